@@ -1,2 +1,22 @@
+# The public API is imported on first access, so importing the package to
+# build a query doesn't import scrapy
+from importlib import import_module
+
 # TODO: Update the path below
-from crwsueddeutsche.main import Crawler  # noqa: F401
+_LAZY_ATTRIBUTES = {
+    "Crawler": "crwsueddeutsche.main",
+}
+
+__all__ = list(_LAZY_ATTRIBUTES)
+
+
+def __getattr__(name):
+    if name not in _LAZY_ATTRIBUTES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(import_module(_LAZY_ATTRIBUTES[name]), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
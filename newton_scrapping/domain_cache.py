@@ -0,0 +1,157 @@
+"""Cache of the parsed robots.txt rules and sitemap indexes of domains, shared by the crawls"""
+
+import os
+import pickle
+import tempfile
+import time
+from urllib.parse import quote, urlparse
+
+from scrapy.extensions.httpcache import parse_cachecontrol, rfc1123_to_epoch
+
+# Caches of the crawler process by directory and TTLs
+_caches = {}
+
+
+def response_ttl(headers, now=None):
+    """Seconds a response may be cached for by its Cache-Control or Expires header
+
+    Args:
+        headers (Headers): response headers
+        now (float, optional): time.time() to compare Expires to without a
+            Date header. Defaults to None.
+
+    Returns:
+        float: 0 for no-store and no-cache, None when neither header sets it
+    """
+    cache_control = parse_cachecontrol(headers.get(b"Cache-Control") or b"")
+    if b"no-store" in cache_control or b"no-cache" in cache_control:
+        return 0.0
+    for directive in (b"s-maxage", b"max-age"):
+        try:
+            return max(0.0, float(cache_control[directive]))
+        except (KeyError, TypeError, ValueError):
+            pass
+    expires = rfc1123_to_epoch(headers.get(b"Expires"))
+    if expires is None:
+        return None
+    date = rfc1123_to_epoch(headers.get(b"Date"))
+    return max(0.0, expires - (date or (time.time() if now is None else now)))
+
+
+class DomainCache:
+    """
+    On-disk cache of what is parsed once per domain, shared by the crawls.
+    ...
+
+    Keeps the parsed robots.txt rules ("robots") and the entries of the
+    robots.txt sitemaps and sitemap indexes ("sitemap") of every domain in a
+    pickle file of its own, so a crawler process loads them as they were
+    parsed instead of fetching and parsing them again. An entry expires after
+    the Cache-Control/Expires TTL of the response it was parsed from, at least
+    ``min_ttl`` seconds, and after ``default_ttl`` seconds when the response
+    has neither header. Files are loaded once per process and replaced
+    atomically, so concurrent crawler processes never read a partial file.
+
+    Attributes
+    ----------
+    directory : str
+        directory of the domain files, created when missing
+    min_ttl : float
+        min seconds an entry is kept for, whatever its response headers
+    default_ttl : float
+        seconds an entry is kept for without Cache-Control or Expires
+
+    Methods
+    -------
+    get(kind, url)
+        Returns the fresh entry of a URL, None when missing or expired
+    set(kind, url, value, headers)
+        Stores the entry of a URL for the TTL of its response
+    ttl(headers)
+        Returns the seconds an entry parsed from a response is kept for
+    """
+
+    def __init__(self, directory, min_ttl=600, default_ttl=3600):
+        self.directory = directory
+        self.min_ttl = min_ttl
+        self.default_ttl = default_ttl
+        os.makedirs(directory, exist_ok=True)
+        # (kind, url) -> (expires_at, value) by domain
+        self._domains = {}
+
+    @classmethod
+    def from_settings(cls, settings):
+        """Cache configured by the NEWTON_DOMAIN_CACHE_* settings, shared by the crawlers of the process"""
+        key = (
+            settings.get("NEWTON_DOMAIN_CACHE_DIR"),
+            settings.getfloat("NEWTON_DOMAIN_CACHE_MIN_TTL", 600),
+            settings.getfloat("NEWTON_DOMAIN_CACHE_DEFAULT_TTL", 3600),
+        )
+        if key not in _caches:
+            _caches[key] = cls(*key)
+        return _caches[key]
+
+    def _path(self, domain):
+        return os.path.join(self.directory, quote(domain, safe="") + ".pickle")
+
+    def _load(self, domain) -> dict:
+        try:
+            with open(self._path(domain), "rb") as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, EOFError, ValueError, AttributeError, ImportError, pickle.UnpicklingError):
+            # Unreadable or written by another version, it's rebuilt
+            return {}
+
+    def _entries(self, domain) -> dict:
+        if domain not in self._domains:
+            self._domains[domain] = self._load(domain)
+        return self._domains[domain]
+
+    def get(self, kind, url):
+        """Return the fresh entry of a URL
+
+        Args:
+            kind (str): "robots" or "sitemap"
+            url (str): URL the entry was parsed from
+
+        Returns:
+            object: the cached value, None when missing or expired
+        """
+        entry = self._entries(urlparse(url).netloc).get((kind, url))
+        if entry is None or entry[0] < time.time():
+            return None
+        return entry[1]
+
+    def set(self, kind, url, value, headers=None) -> bool:
+        """Store the entry of a URL for the TTL of the response it was parsed from
+
+        Args:
+            kind (str): "robots" or "sitemap"
+            url (str): URL the entry was parsed from
+            value (object): picklable entry
+            headers (Headers, optional): headers of the response. Defaults to None.
+
+        Returns:
+            bool: False when the TTL is 0 and nothing is stored
+        """
+        ttl = self.ttl(headers)
+        if ttl <= 0:
+            return False
+        domain = urlparse(url).netloc
+        now = time.time()
+        # Read again, other processes may have stored entries since the file was loaded
+        entries = {key: entry for key, entry in self._load(domain).items() if entry[0] >= now}
+        entries[(kind, url)] = (now + ttl, value)
+        self._domains[domain] = entries
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(entries, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self._path(domain))
+        return True
+
+    def ttl(self, headers=None) -> float:
+        """Seconds an entry parsed from a response with these headers is kept for"""
+        ttl = None if headers is None else response_ttl(headers)
+        return max(self.min_ttl, self.default_ttl if ttl is None else ttl)
@@ -0,0 +1,244 @@
+"""Compressed HTTP cache storage with LRU eviction"""
+
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import zlib
+
+from w3lib.http import headers_dict_to_raw, headers_raw_to_dict
+
+# Storages of the process by directory, shared by its spiders
+_storages = {}
+_storages_lock = threading.Lock()
+
+
+class CompressedCacheStorage:
+    """
+    HTTP cache keeping zlib compressed bodies within a byte budget.
+    ...
+
+    Bodies are written to one file per request fingerprint while the status,
+    headers and validators (ETag, Last-Modified) live in an sqlite index.
+    Once the compressed bodies take more than ``max_bytes`` the least
+    recently used entries are evicted. Their total size is summed when the
+    storage opens and kept up to date by store() and the deletions.
+
+    Attributes
+    ----------
+    directory : str
+        cache directory
+    max_bytes : int
+        byte budget of the compressed bodies, None for no limit
+    size : int
+        bytes of the compressed bodies in the cache
+
+    Methods
+    -------
+    get(directory, **options)
+        Returns the storage of a directory shared by the spiders of the process
+    release()
+        Releases a shared storage, closed by its last user
+    retrieve(fingerprint, load_body)
+        Returns the cached entry of a request
+    read_body(fingerprint)
+        Returns the decompressed body of an entry
+    store(fingerprint, url, status, headers, body)
+        Caches a response and evicts entries above the budget
+    touch(fingerprint)
+        Marks an entry as recently used
+    """
+
+    def __init__(self, directory, max_bytes=None, compression_level=6):
+        """
+        Args:
+            directory (str): cache directory, created when missing
+            max_bytes (int, optional): byte budget of the compressed bodies. Defaults to None.
+            compression_level (int, optional): zlib compression level. Defaults to 6.
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.compression_level = compression_level
+        self.references = 0
+        os.makedirs(directory, exist_ok=True)
+        self.db = sqlite3.connect(os.path.join(directory, "index.sqlite3"))
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " fingerprint TEXT PRIMARY KEY, url TEXT, status INTEGER, headers BLOB,"
+            " etag TEXT, last_modified TEXT, size INTEGER, stored_at REAL, accessed_at REAL)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS accessed_at_idx ON entries (accessed_at)")
+        self.size = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    @classmethod
+    def from_settings(cls, settings):
+        """Open the cache configured by the NEWTON_HTTPCACHE_* settings"""
+        return cls.get(
+            settings.get("NEWTON_HTTPCACHE_DIR", "httpcache"),
+            max_bytes=settings.getint("NEWTON_HTTPCACHE_MAX_BYTES") or None,
+            compression_level=settings.getint("NEWTON_HTTPCACHE_COMPRESSION_LEVEL", 6),
+        )
+
+    @classmethod
+    def get(cls, directory, **options) -> "CompressedCacheStorage":
+        """Return the storage of a directory, shared by all the spiders of the process
+
+        One connection for all the spiders (one per link of an "articles"
+        query, one per shard) keeps them from locking each other out. Every
+        get() must be matched by a release(), the storage is closed by the
+        last one.
+        """
+        key = os.path.abspath(directory)
+        with _storages_lock:
+            storage = _storages.get(key)
+            if storage is None:
+                storage = _storages[key] = cls(directory, **options)
+            storage.references += 1
+            return storage
+
+    def release(self):
+        with _storages_lock:
+            self.references -= 1
+            if self.references > 0:
+                return
+            _storages.pop(os.path.abspath(self.directory), None)
+        self.close()
+
+    def _body_path(self, fingerprint):
+        return os.path.join(self.directory, fingerprint[:2], fingerprint + ".zlib")
+
+    def retrieve(self, fingerprint: str, load_body=True) -> dict:
+        """Return the cached entry of a request
+
+        Args:
+            fingerprint (str): request fingerprint as a hex string
+            load_body (bool, optional): decompress the body, otherwise it's
+                read by read_body() when needed, after a 304 for instance.
+                Defaults to True.
+
+        Returns:
+            dict: url, status, headers, body (with load_body), etag,
+            last_modified and stored_at, None when the request is not cached
+        """
+        row = self.db.execute(
+            "SELECT url, status, headers, etag, last_modified, stored_at"
+            " FROM entries WHERE fingerprint = ?",
+            (fingerprint,),
+        ).fetchone()
+        if row is None:
+            return None
+        entry = {
+            "url": row[0],
+            "status": row[1],
+            "headers": headers_raw_to_dict(row[2]),
+            "etag": row[3],
+            "last_modified": row[4],
+            "stored_at": row[5],
+        }
+        if load_body:
+            entry["body"] = self.read_body(fingerprint)
+            if entry["body"] is None:
+                return None
+        elif not os.path.exists(self._body_path(fingerprint)):
+            self._delete(fingerprint)
+            self.db.commit()
+            return None
+        return entry
+
+    def read_body(self, fingerprint: str) -> bytes:
+        """Return the decompressed body of an entry, None when it can't be read"""
+        try:
+            with open(self._body_path(fingerprint), "rb") as f:
+                return zlib.decompress(f.read())
+        except (OSError, zlib.error):
+            self._delete(fingerprint)
+            self.db.commit()
+            return None
+
+    def store(self, fingerprint: str, url: str, status: int, headers: dict, body: bytes):
+        """Cache a response and evict the least recently used entries above the budget
+
+        Args:
+            fingerprint (str): request fingerprint as a hex string
+            url (str): response URL
+            status (int): response status
+            headers (dict): response headers
+            body (bytes): response body
+        """
+        compressed = zlib.compress(body, self.compression_level)
+        path = self._body_path(fingerprint)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary file first so readers never see a partial body
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, "wb") as f:
+            f.write(compressed)
+        os.replace(tmp_path, path)
+        replaced = self.db.execute("SELECT size FROM entries WHERE fingerprint = ?", (fingerprint,)).fetchone()
+        now = time.time()
+        self.db.execute(
+            "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                fingerprint, url, status, headers_dict_to_raw(headers),
+                _header(headers, b"ETag"), _header(headers, b"Last-Modified"),
+                len(compressed), now, now,
+            ),
+        )
+        self.db.commit()
+        self.size += len(compressed) - (replaced[0] if replaced else 0)
+        self.evict()
+
+    def touch(self, fingerprint: str):
+        """Mark an entry as recently used"""
+        self.db.execute(
+            "UPDATE entries SET accessed_at = ? WHERE fingerprint = ?", (time.time(), fingerprint)
+        )
+        self.db.commit()
+
+    def total_bytes(self) -> int:
+        return self.size
+
+    def evict(self, batch_size=64):
+        """Delete the least recently used entries until the cache fits in max_bytes
+
+        The entries are read in batches from the accessed_at index, oldest
+        first, so the index is never loaded whole.
+        """
+        if not self.max_bytes:
+            return
+        while self.size > self.max_bytes:
+            rows = self.db.execute(
+                "SELECT fingerprint FROM entries ORDER BY accessed_at LIMIT ?", (batch_size,)
+            ).fetchall()
+            if not rows:
+                self.size = 0
+                break
+            for (fingerprint,) in rows:
+                self._delete(fingerprint)
+                if self.size <= self.max_bytes:
+                    break
+        self.db.commit()
+
+    def _delete(self, fingerprint):
+        row = self.db.execute("SELECT size FROM entries WHERE fingerprint = ?", (fingerprint,)).fetchone()
+        if row is not None:
+            self.db.execute("DELETE FROM entries WHERE fingerprint = ?", (fingerprint,))
+            self.size -= row[0]
+        try:
+            os.remove(self._body_path(fingerprint))
+        except FileNotFoundError:
+            pass
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+
+def _header(headers, name):
+    values = headers.get(name)
+    if not values:
+        return None
+    value = values[0] if isinstance(values, (list, tuple)) else values
+    return value.decode("latin1") if isinstance(value, bytes) else value
@@ -3,6 +3,8 @@
 # See documentation in:
 # https://docs.scrapy.org/en/latest/topics/items.html
 
+from typing import Any, Dict, Iterable, List, Optional, Union
+
 import scrapy
 
 
@@ -10,3 +12,336 @@ class NewtonScrappingItem(scrapy.Item):
     # define the fields for your item here like:
     # name = scrapy.Field()
     pass
+
+
+# Typed, __slots__ based records of the crawl output. Every record converts
+# to and from the dict format returned by Crawler.crawl() (from_dict/to_dict)
+# without copying the strings and lists it holds. Keys a record doesn't know
+# are kept in ``extra`` so the conversion is lossless, and fields that are
+# None are left out of to_dict() like they are absent from the dicts.
+
+
+class _Record:
+    __slots__ = ()
+    # (attribute, dict key) of every field
+    _keys = ()
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def __repr__(self):
+        fields = ", ".join(
+            f"{name}={getattr(self, name)!r}" for name, _ in self._keys if getattr(self, name) is not None
+        )
+        return f"{type(self).__name__}({fields})"
+
+    @classmethod
+    def _split(cls, data: dict) -> tuple:
+        known = {key for _, key in cls._keys}
+        values = {name: data.get(key) for name, key in cls._keys}
+        extra = {key: value for key, value in data.items() if key not in known}
+        return values, extra or None
+
+    def _to_dict(self, convert=None) -> dict:
+        data = {}
+        for name, key in self._keys:
+            value = getattr(self, name)
+            if value is not None:
+                data[key] = convert(name, value) if convert else value
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+
+class Author(_Record):
+    """An entry of parsed_data.author"""
+
+    __slots__ = ("type", "name", "url", "extra")
+    _keys = (("type", "@type"), ("name", "name"), ("url", "url"))
+
+    def __init__(self, name: Optional[str] = None, url: Optional[str] = None,
+                 type: Optional[str] = None, extra: Optional[dict] = None):
+        self.type = type
+        self.name = name
+        self.url = url
+        self.extra = extra
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Author":
+        values, extra = cls._split(data)
+        return cls(extra=extra, **values)
+
+    def to_dict(self) -> dict:
+        return self._to_dict()
+
+
+class Publisher(_Record):
+    """An entry of parsed_data.publisher"""
+
+    __slots__ = ("id", "type", "name", "logo", "extra")
+    _keys = (("id", "@id"), ("type", "@type"), ("name", "name"), ("logo", "logo"))
+
+    def __init__(self, name: Optional[str] = None, id: Optional[str] = None, type: Optional[str] = None,
+                 logo: Optional[dict] = None, extra: Optional[dict] = None):
+        self.id = id
+        self.type = type
+        self.name = name
+        self.logo = logo
+        self.extra = extra
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Publisher":
+        values, extra = cls._split(data)
+        return cls(extra=extra, **values)
+
+    def to_dict(self) -> dict:
+        return self._to_dict()
+
+
+class Image(_Record):
+    """An entry of parsed_data.images"""
+
+    __slots__ = ("link", "caption", "extra")
+    _keys = (("link", "link"), ("caption", "caption"))
+
+    def __init__(self, link: Optional[str] = None, caption: Optional[str] = None, extra: Optional[dict] = None):
+        self.link = link
+        self.caption = caption
+        self.extra = extra
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Image":
+        values, extra = cls._split(data)
+        return cls(extra=extra, **values)
+
+    def to_dict(self) -> dict:
+        return self._to_dict()
+
+
+def _records_from_dicts(record_class, values):
+    if values is None:
+        return None
+    return [record_class.from_dict(value) if isinstance(value, dict) else value for value in values]
+
+
+def _records_to_dicts(values):
+    return [value.to_dict() if isinstance(value, _Record) else value for value in values]
+
+
+class ParsedData(_Record):
+    """The parsed_data of an article, every field is a list like in the output"""
+
+    __slots__ = (
+        "title", "description", "text", "author", "publisher", "images", "section", "tags",
+        "published_at", "modified_at", "country", "language", "source_country", "source_language",
+        "extra",
+    )
+    _keys = tuple((name, name) for name in __slots__[:-1])
+    _nested = {"author": Author, "publisher": Publisher, "images": Image}
+
+    def __init__(
+        self,
+        title: Optional[List[str]] = None,
+        description: Optional[List[str]] = None,
+        text: Optional[List[str]] = None,
+        author: Optional[List[Author]] = None,
+        publisher: Optional[List[Publisher]] = None,
+        images: Optional[List[Image]] = None,
+        section: Optional[List[str]] = None,
+        tags: Optional[List[str]] = None,
+        published_at: Optional[List[str]] = None,
+        modified_at: Optional[List[str]] = None,
+        country: Optional[List[str]] = None,
+        language: Optional[List[str]] = None,
+        source_country: Optional[List[str]] = None,
+        source_language: Optional[List[str]] = None,
+        extra: Optional[Dict[str, Any]] = None,
+    ):
+        self.title = title
+        self.description = description
+        self.text = text
+        self.author = author
+        self.publisher = publisher
+        self.images = images
+        self.section = section
+        self.tags = tags
+        self.published_at = published_at
+        self.modified_at = modified_at
+        self.country = country
+        self.language = language
+        self.source_country = source_country
+        self.source_language = source_language
+        self.extra = extra
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "ParsedData":
+        values, extra = cls._split(data)
+        for name, record_class in cls._nested.items():
+            values[name] = _records_from_dicts(record_class, values[name])
+        return cls(extra=extra, **values)
+
+    def to_dict(self) -> dict:
+        return self._to_dict(lambda name, value: _records_to_dicts(value) if name in self._nested else value)
+
+
+class RawResponse(_Record):
+    """The raw_response of an article, see RawResponsePipeline for the storages"""
+
+    __slots__ = ("content_type", "content", "content_encoding", "content_path", "content_sha256", "extra")
+    _keys = tuple((name, name) for name in __slots__[:-1])
+
+    def __init__(
+        self,
+        content_type: Optional[str] = None,
+        content: Union[str, bytes, None] = None,
+        content_encoding: Optional[str] = None,
+        content_path: Optional[str] = None,
+        content_sha256: Optional[str] = None,
+        extra: Optional[dict] = None,
+    ):
+        self.content_type = content_type
+        self.content = content
+        self.content_encoding = content_encoding
+        self.content_path = content_path
+        self.content_sha256 = content_sha256
+        self.extra = extra
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "RawResponse":
+        values, extra = cls._split(data)
+        return cls(extra=extra, **values)
+
+    def to_dict(self) -> dict:
+        return self._to_dict()
+
+
+class ArticleRecord(_Record):
+    """
+    An article of the crawl output.
+    ...
+
+    Attributes
+    ----------
+    raw_response : RawResponse
+        page content
+    parsed_json : dict
+        JSON-LD and JSON blocks of the page, "main", "imageObjects", "videoObjects",
+        "other" and "misc"
+    parsed_data : ParsedData
+        fields extracted from the page
+    """
+
+    __slots__ = ("raw_response", "parsed_json", "parsed_data", "extra")
+    _keys = (("raw_response", "raw_response"), ("parsed_json", "parsed_json"), ("parsed_data", "parsed_data"))
+
+    def __init__(self, raw_response: Optional[RawResponse] = None, parsed_json: Optional[dict] = None,
+                 parsed_data: Optional[ParsedData] = None, extra: Optional[dict] = None):
+        self.raw_response = raw_response
+        self.parsed_json = parsed_json
+        self.parsed_data = parsed_data
+        self.extra = extra
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "ArticleRecord":
+        values, extra = cls._split(data)
+        if values["raw_response"] is not None:
+            values["raw_response"] = RawResponse.from_dict(values["raw_response"])
+        if values["parsed_data"] is not None:
+            values["parsed_data"] = ParsedData.from_dict(values["parsed_data"])
+        return cls(extra=extra, **values)
+
+    def to_dict(self) -> dict:
+        return self._to_dict(lambda name, value: value.to_dict() if isinstance(value, _Record) else value)
+
+
+class SitemapEntry(_Record):
+    """An article link of a sitemap crawl"""
+
+    __slots__ = ("link", "title", "extra")
+    _keys = (("link", "link"), ("title", "title"))
+
+    def __init__(self, link: str, title: Optional[str] = None, extra: Optional[dict] = None):
+        self.link = link
+        self.title = title
+        self.extra = extra
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "SitemapEntry":
+        values, extra = cls._split(data)
+        return cls(extra=extra, **values)
+
+    def to_dict(self) -> dict:
+        # A sitemap entry always has its title key, even when there is no title
+        data = {"link": self.link, "title": self.title}
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+
+class SitemapBatch:
+    """
+    Columnar form of a large sitemap output.
+    ...
+
+    Keeps one list per field instead of one dict per link, which is several
+    times smaller for hundreds of thousands of links. Indexing and iterating
+    return SitemapEntry records, to_dicts() returns the usual output.
+
+    Attributes
+    ----------
+    links : list
+        link of every entry
+    titles : list
+        title of every entry, None when it has none
+    """
+
+    __slots__ = ("links", "titles")
+
+    def __init__(self, links: Optional[List[str]] = None, titles: Optional[List[Optional[str]]] = None):
+        self.links = links if links is not None else []
+        self.titles = titles if titles is not None else [None] * len(self.links)
+        if len(self.titles) != len(self.links):
+            raise ValueError("links and titles must have the same length")
+
+    @classmethod
+    def from_dicts(cls, entries: Iterable[Union[dict, SitemapEntry]]) -> "SitemapBatch":
+        batch = cls()
+        for entry in entries:
+            batch.append(entry)
+        return batch
+
+    def append(self, entry: Union[dict, SitemapEntry]):
+        if isinstance(entry, SitemapEntry):
+            self.links.append(entry.link)
+            self.titles.append(entry.title)
+        else:
+            self.links.append(entry["link"])
+            self.titles.append(entry.get("title"))
+
+    def __len__(self):
+        return len(self.links)
+
+    def __getitem__(self, index) -> SitemapEntry:
+        if isinstance(index, slice):
+            return SitemapBatch(self.links[index], self.titles[index])
+        return SitemapEntry(self.links[index], self.titles[index])
+
+    def __iter__(self):
+        for link, title in zip(self.links, self.titles):
+            yield SitemapEntry(link, title)
+
+    def __eq__(self, other):
+        if not isinstance(other, SitemapBatch):
+            return NotImplemented
+        return self.links == other.links and self.titles == other.titles
+
+    def to_dicts(self) -> List[dict]:
+        return [{"link": link, "title": title} for link, title in zip(self.links, self.titles)]
+
+    def to_dataframe(self):
+        """The batch as a pandas DataFrame with "link" and "title" columns"""
+        import pandas
+
+        return pandas.DataFrame({"link": self.links, "title": self.titles})
@@ -1,7 +1,61 @@
-from scrapy.crawler import CrawlerProcess
-from multiprocessing import Process, Queue
-# TODO: Change path and spider name here
-from crwsueddeutsche.spiders.sueddeutsche import SueddeutscheSpider
+# Scrapy, Twisted and the spiders are only imported by the methods running the
+# crawl, so building a Crawler and a query doesn't pay for them
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from importlib import import_module
+from queue import Empty
+import asyncio
+import multiprocessing
+import os
+import time
+
+from newton_scrapping.metrics import CrawlMetrics
+from newton_scrapping.profiling import CrawlProfiler
+from newton_scrapping.proxy_pool import ProxyPool
+from newton_scrapping.resume import CrawlCheckpoint, query_digest
+from newton_scrapping.sharding import SHARD_BY, merge_links, split_date_range, split_sitemaps
+from newton_scrapping.throttle import AdaptiveThrottle
+from newton_scrapping.transport import (
+    MappedResults, PipeSender, ResultWriter, create_result_file, receive, wait_readable,
+)
+
+_STREAM_ITEM = "item"
+_STREAM_ERROR = "error"
+_STREAM_END = "end"
+
+# Share of the deadline, at most _DEADLINE_GRACE_MAX seconds, left to the
+# spiders to close and send their items before the process is terminated
+_DEADLINE_GRACE = 0.2
+_DEADLINE_GRACE_MAX = 2.0
+
+# Error of the "articles" links given up when the crawl was cut short, by
+# the reason the spiders were closed with
+_CLOSE_ERRORS = {
+    "deadline": "Deadline exceeded",
+    "max_items": "Item limit reached",
+    "max_bytes": "Byte limit reached",
+    "memory_limit": "Memory limit reached",
+}
+
+# In-loop crawls running on the reactor of the caller's event loop
+_loop_crawls = 0
+
+# Spiders of the query types handled by the project itself
+_GENERIC_SPIDERS = {
+    "sitemaps": "newton_scrapping.sitemap.SitemapShardSpider",
+}
+
+# Modules every crawler process needs, imported once by the forkserver or by
+# the parent before forking
+PRELOAD_MODULES = [
+    "scrapy.crawler",
+    "scrapy.core.engine",
+    "twisted.internet.defer",
+    "newton_scrapping.middlewares",
+    "newton_scrapping.pipelines",
+    "newton_scrapping.sitemap",
+    __name__,
+]
 
 
 class Crawler:
@@ -13,76 +67,1005 @@ class Crawler:
     ----------
     query : dict
         query dictionary that contains type, link, domain, since and until
-    proxies : str
-        dictionary that contains proxy related information
-    output : int
-        Data returned by crawl method
+    proxies : dict|list
+        dictionary that contains proxy related information, or a list of them
+    pool : CrawlerPool
+        optional pool of warm worker processes used to run the query
+    seen_index : str
+        optional path of the index of URLs returned by earlier crawls
+    http_cache : str
+        optional directory of the compressed HTTP cache
+    raw_response : str
+        how the page HTML of the articles is returned
+    raw_response_dir : str
+        directory of the spilled page HTML
+    transport : str
+        how crawl() receives the results from the crawler process
+    throttle : bool
+        whether the per-domain concurrency and delay are adapted
+    throttle_state : str
+        optional JSON file of the per-domain throttle state
+    throttle_shares : int
+        number of crawler processes splitting the throttle of every domain
+    metrics : str
+        optional directory of the exported crawl metrics
+    profile : str
+        optional directory of the profile of the crawler process
+    output : str
+        optional directory the items are written to instead of being returned
+    near_duplicates : str
+        optional path of the index of near-duplicate articles
+    in_loop : bool
+        whether acrawl() runs the spiders on the caller's event loop
+    deadline : float
+        optional seconds after which the crawl returns what it has so far
+    response_size_limits : dict
+        optional max bytes downloaded per response by content type
+    max_rss_mb : float
+        optional RSS of the crawler process above which the crawl slows down
+    close_reason : str
+        reason the crawl was cut short with, like "deadline" or "max_items"
+    resume_key : str
+        optional name of the checkpoint the crawl is resumed from
+    resume_dir : str
+        directory of the checkpoints
+    domain_cache : str
+        optional directory of the robots.txt and sitemap index cache
+    domain_cache_min_ttl : float
+        min seconds the cached robots.txt and sitemap index entries are kept for
+    report : dict
+        information about the last crawl besides its data, like its "metrics"
 
     Methods
     -------
     crawl()
         Crawls the sitemap URL and article URL and return final data
+    iter_crawl(buffer_size)
+        Crawls like crawl() and yields the data while it is being scraped
+    acrawl()
+        Crawls like crawl() without blocking the running event loop
+    aiter_crawl()
+        Crawls like iter_crawl() as an async iterator
+    crawl_many(links)
+        Crawls a list of article URLs in one process and return data by URL
+    close_spiders(reason)
+        Closes the running spiders of the crawl, which flush their items
+    get_options()
+        Returns the keyword arguments to build the same Crawler
+    get_spider_class(type)
+        Imports the spider class of a query type
+    get_context()
+        Returns the multiprocessing context of the crawler processes
+    get_settings()
+        Builds the scrapy settings used to run the query
+    get_spider_args(callback)
+        Builds the keyword arguments passed to the spider
+    schedule(runner, callback)
+        Schedules the spider runs of the query on a scrapy runner
     def yield_output(data)
         set data to output attribute
     """
 
-    def __init__(self, query={'type': None}, proxies={}):
+    # TODO: Change the spider paths here, "articles" queries use the "article" spider
+    spider_classes = {
+        "sitemap": "crwsueddeutsche.spiders.sueddeutsche.SueddeutscheSpider",
+        "article": "crwsueddeutsche.spiders.sueddeutsche.SueddeutscheSpider",
+    }
+    # A spider class set here is used for every type instead
+    spider_class = None
+
+    def __init__(
+        self, query={'type': None}, proxies={}, pool=None, seen_index=None, http_cache=None,
+        raw_response="inline", raw_response_dir="raw_responses", transport="queue",
+        throttle=True, throttle_state=None, throttle_shares=1, metrics=None,
+        profile=None, profile_mode="cprofile", profile_memory=False,
+        output=None, output_format="jsonl.gz", near_duplicates=None, near_duplicate_action="tag",
+        start_method=None, in_loop=False, deadline=None, response_size_limits=None, max_rss_mb=None,
+        resume_key=None, resume_dir="crawl_jobs", domain_cache=None, domain_cache_min_ttl=600,
+    ):
         """
         Args:
             query (dict): A dict that takes input for crawling the link for one of the below type.\n
             for sitemap:- {
                 "type": "sitemap", "domain": "https://example.com",\n
+                "since": "2022-03-01", "until": "2022-03-26",\n
+                "columnar": False, "shards": 1, "shard_by": "sitemap",\n
+                "shard_retries": 2, "max_items": None, "max_bytes": None\n
+                }, "columnar": True returns an items.SitemapBatch instead of a list of dicts.
+                "shards": N runs crawl() as N crawler processes, each crawling
+                a share of the child sitemaps of the index ("shard_by":
+                "sitemap", found from robots.txt or given as "sitemaps") or a
+                share of the since/until days ("shard_by": "date"). The links
+                are merged and deduplicated, a shard whose sitemaps failed
+                is crawled again up to "shard_retries" times.
+                "max_items" and "max_bytes" stop the crawl once that many
+                items were scraped or response bytes downloaded, which
+                every query type takes, report["reason"] is then
+                "max_items" or "max_bytes".
+            for sitemaps:- {
+                "type": "sitemaps", "sitemaps": ["https://example.com/sitemap.xml"],\n
                 "since": "2022-03-01", "until": "2022-03-26"\n
-                }
+                }, crawls the given sitemaps with the project's generic sitemap spider
             for article:- {"type": "article", "link": https://example.com/articles/test.html"}\n
+            for articles:- {
+                "type": "articles", "links": ["https://example.com/articles/test.html"],\n
+                "concurrency": 16\n
+                }\n
             for link_feed:- {"type": "link_feed"}. Defaults to {'type': None}.\n
-            proxies (dict, optional): Use:- {
+            proxies (dict|list, optional): Use:- {
                 "proxyIp": "123.456.789.2", "proxyPort": "3199",\n
                 "proxyUsername": "IgNyTnddr5", "proxyPassword": "123466"\n
-                }. Defaults to {}.
+                }, or a list of them to rotate requests over the proxies by
+                health and latency, ejecting failing ones. Defaults to {}.
+            pool (CrawlerPool, optional): run the query on a warm worker of this
+                pool instead of forking a new process. Defaults to None.
+            seen_index (str, optional): path of a SeenIndex database, articles
+                and sitemap links that did not change since an earlier crawl
+                with the same index are skipped. Defaults to None.
+            http_cache (str, optional): directory of a compressed HTTP cache,
+                cached pages are revalidated instead of downloaded again.
+                Defaults to None.
+            raw_response (str, optional): "inline" keeps raw_response.content as
+                text, "gzip"/"zstd" return compressed bytes, "spill" writes it to
+                a file under raw_response_dir and returns its path, "omit" drops
+                it. Read it with utils.get_raw_content(). Defaults to "inline".
+            raw_response_dir (str, optional): directory used by the "spill"
+                storage. Defaults to "raw_responses".
+            transport (str, optional): "queue" pickles the whole result through
+                a multiprocessing Queue, "mmap" has the crawler process write
+                every item to a shared memory file and crawl() return a
+                MappedResults that decodes records on access and must be
+                closed. Ignored when running on a pool. Defaults to "queue".
+            throttle (bool, optional): adapt the concurrency and delay of every
+                domain to its latency and 429/503 responses, starting from the
+                0.25s delay. False keeps the fixed 0.25s delay. Defaults to True.
+            throttle_state (str, optional): JSON file keeping the per-domain
+                throttle state between runs. Defaults to None.
+            throttle_shares (int, optional): crawler processes crawling the
+                same domains at once, each one gets this share of the
+                concurrency and delay of a domain. Set by sharded crawls.
+                Defaults to 1.
+            metrics (str, optional): directory to write the queue wait, download
+                and parse time histograms, bytes, items per callback and errors
+                per domain of the crawl to, as metrics.prom (Prometheus text
+                format) and metrics.json. The summary is also available as
+                report["metrics"] after crawl(). Defaults to None.
+            profile (str, optional): directory to write a profile of the crawler
+                process to, the paths of the files are in report["profile"]
+                after crawl(). Ignored when running on a pool. Defaults to None.
+            profile_mode (str, optional): "cprofile" writes a .pstats file,
+                "sampling" samples the stack and writes collapsed stacks for
+                flame graphs. Defaults to "cprofile".
+            profile_memory (bool, optional): also trace allocations with
+                tracemalloc and write the top allocation sites. Defaults to False.
+            output (str, optional): directory to write the items to in batches
+                from a background thread, in rotating files completed
+                atomically, instead of holding them in memory. crawl() then
+                returns the paths of the files, also in report["output"].
+                Defaults to None.
+            output_format (str, optional): "jsonl.gz" or "parquet" (requires
+                pyarrow). Defaults to "jsonl.gz".
+            near_duplicates (str, optional): path of a NearDuplicateIndex
+                database, articles whose title and text are near-duplicates of
+                an article indexed by this or an earlier crawl are tagged or
+                dropped. Defaults to None.
+            near_duplicate_action (str, optional): "tag" adds a
+                "near_duplicate" entry with the "url" of the first article and
+                the "similarity", "drop" drops the article. Defaults to "tag".
+            start_method (str, optional): multiprocessing start method of the
+                crawler processes. "forkserver" forks them from a server that
+                imported scrapy and the spiders once, which needs the calling
+                script to be guarded by if __name__ == "__main__". None uses
+                the platform default, with "fork" the modules are imported
+                once in the calling process before its first crawl.
+                Defaults to None.
+            in_loop (bool, optional): acrawl() and aiter_crawl() run the
+                spiders on the caller's asyncio event loop through the asyncio
+                reactor instead of in a crawler process. Meant for light
+                queries like single articles, as the crawl shares the CPU of
+                the loop. The reactor is installed on the loop by the first
+                crawl, and must not already be installed on another loop.
+                Ignored by crawl(), "profile" and "transport" are ignored.
+                Defaults to False.
+            deadline (float, optional): seconds the crawl may take. When they
+                have passed crawl() returns the items scraped so far and
+                report["partial"] is True with the "reason". The spiders are
+                closed shortly before, so they flush the items they hold, and
+                a crawler process still running at the deadline is
+                terminated. The items are streamed from the crawler process,
+                "transport" is ignored. On a pool the deadline counts from
+                the submission of the job, and a job not done at the
+                deadline returns no data. Defaults to None.
+            response_size_limits (dict, optional): max bytes downloaded per
+                response by media type, "type/*" or "*". HTML over its limit
+                is truncated, other responses over it are dropped. Pass
+                memory.DEFAULT_SIZE_LIMITS for limits suited to news sites,
+                None or {} downloads responses whole. Defaults to None.
+            max_rss_mb (float, optional): RSS in MB of the crawler process
+                above which the engine is paused at intervals, items buffered
+                for output files are flushed and garbage is collected. Above
+                1.5 times this the spiders are closed and report["reason"] is
+                "memory_limit". The items are streamed from the crawler
+                process like with a deadline. Defaults to None.
+            resume_key (str, optional): checkpoint the pending requests, the
+                dupefilter and the items of the crawl under resume_dir/<key>,
+                so a crawl that stopped or crashed is resumed by running the
+                same query with the same key. Completed sitemaps and articles
+                are not fetched again, the result includes the items of the
+                earlier runs and report["resume"] the "status" of the
+                checkpoint. Once "finished", the crawl returns the
+                checkpointed items without crawling, a key used for another
+                query is reset. Defaults to None.
+            resume_dir (str, optional): directory of the checkpoints.
+                Defaults to "crawl_jobs".
+            domain_cache (str, optional): directory of a cache of the parsed
+                robots.txt rules, robots.txt sitemaps and sitemap indexes of
+                every domain, shared by the crawls and their processes.
+                Cached entries are used instead of fetching and parsing the
+                files again for the Cache-Control/Expires TTL of their
+                response, an hour without those headers. Sitemap entries are
+                cached by the generic "sitemaps" spider, robots.txt rules
+                when the spider obeys robots.txt. Defaults to None.
+            domain_cache_min_ttl (float, optional): min seconds the cached
+                entries are kept for, whatever the headers of their
+                response. Defaults to 600.
         """
         self.output_queue = None
         self.query = query
         self.proxies = proxies
+        self.pool = pool
+        self.seen_index = seen_index
+        self.http_cache = http_cache
+        self.raw_response = raw_response
+        self.raw_response_dir = raw_response_dir
+        self.transport = transport
+        self.throttle = throttle
+        self.throttle_state = throttle_state
+        self.throttle_shares = throttle_shares
+        self.metrics = metrics
+        self.profile = profile
+        self.profile_mode = profile_mode
+        self.profile_memory = profile_memory
+        self.output = output
+        self.output_format = output_format
+        self.near_duplicates = near_duplicates
+        self.near_duplicate_action = near_duplicate_action
+        self.start_method = start_method
+        self.in_loop = in_loop
+        self.deadline = deadline
+        self.response_size_limits = response_size_limits
+        self.max_rss_mb = max_rss_mb
+        self.resume_key = resume_key
+        self.resume_dir = resume_dir
+        self.domain_cache = domain_cache
+        self.domain_cache_min_ttl = domain_cache_min_ttl
+        self.checkpoint = None
+        self.deadline_at = None
+        self.close_reason = None
+        self.items_scraped = 0
+        self.bytes_received = 0
+        self._deadline_call = None
+        self.timings = {}
+        self.profiler = None
+        self.crawlers = []
+        self.report = {}
 
     def crawl(self) -> list[dict]:
-        self.output_queue = Queue()
-        process = Process(
+        if self.query.get("type") == "sitemap" and self.query.get("shards", 1) > 1:
+            return self._crawl_sharded()
+
+        if self.pool is not None:
+            return self._crawl_on_pool()
+
+        if self.deadline is not None or self.max_rss_mb is not None:
+            # Streamed, so the crawler process doesn't hold all the items
+            return self._collect(list(self.iter_crawl()))
+
+        if self.transport == "mmap":
+            return self._crawl_mapped()
+
+        spawned_at = time.time()
+        context = self.get_context()
+        self.output_queue = context.Queue()
+        process = context.Process(
             target=self.start_crawler, args=(self.query, self.output_queue)
         )
         process.start()
-        return self.output_queue.get()
+        try:
+            output = _get_message(self.output_queue, process)
+            received_at = time.time()
+            try:
+                self.report = self.output_queue.get(timeout=5)
+            except Empty:
+                self.report = {}
+        finally:
+            _reap(process)
+        self.report["timings"] = _phase_timings(self.report.get("timings"), spawned_at, received_at)
+        return output
 
-    def start_crawler(self, query, output_queue):
-        """Crawls the sitemap URL and article URL and return final data
+    def _crawl_on_pool(self):
+        """Crawls on the pool, the job is given up when the deadline passes
+
+        The worker closes the spiders shortly before the deadline, a job
+        still waiting for a worker or closing at the deadline returns no data.
+        """
+        if self.deadline is not None:
+            self.deadline_at = time.time() + self.deadline
+        future = self.pool.submit(self.query, self.proxies, **self.get_options())
+        try:
+            output = future.result(None if self.deadline_at is None else max(0.0, self.deadline_at - time.time()))
+        except FutureTimeoutError:
+            # A job not started yet is dropped by the pool
+            future.cancel()
+            self.report = {"partial": True, "reason": "deadline"}
+            return self._collect([])
+        self.report = future.report
+        return output
+
+    def _collect(self, items):
+        """Build the result of crawl() from the streamed items of a crawl
+
+        Links of an "articles" query left when the crawl was cut short get
+        an error result.
+        """
+        from newton_scrapping.items import SitemapBatch
+
+        if self.output:
+            return self.report.get("output", [])
+        if self.query["type"] == "articles":
+            results = dict(items)
+            if self.report.get("partial"):
+                error = _CLOSE_ERRORS.get(self.report.get("reason"), "Crawl stopped")
+                for link in self.query["links"]:
+                    results.setdefault(link, {"error": error})
+            return results
+        if self.query["type"] == "sitemap" and self.query.get("columnar"):
+            return SitemapBatch.from_dicts(items)
+        return items
+
+    def _crawl_sharded(self) -> list[dict]:
+        """Crawls a sitemap query as parallel shards, each in its own process
+
+        Returns:
+            list[dict]: merged article links, or the output files
+        """
+        shards = self.query["shards"]
+        shard_by = self.query.get("shard_by", "sitemap")
+        if shard_by not in SHARD_BY:
+            raise Exception(f"Invalid shard_by: {shard_by}")
+        window = {"since": self.query.get("since"), "until": self.query.get("until")}
+        limits = {name: self.query[name] for name in ("max_items", "max_bytes") if self.query.get(name)}
+        if self.deadline is not None:
+            self.deadline_at = time.time() + self.deadline
+        self.report = {"shards": []}
+        results = []
+
+        if shard_by == "date":
+            queries = [
+                {**self.query, "since": since, "until": until, "shards": 1}
+                for since, until in split_date_range(window["since"], window["until"], shards)
+            ]
+        else:
+            roots = self.query.get("sitemaps") or [self.query["domain"].rstrip("/") + "/robots.txt"]
+            plan, self.report["plan"] = self._crawl_shard_with_retries(
+                {"type": "sitemaps", "sitemaps": roots, "expand": False, **window}, None
+            )
+            if not plan and (self.report["plan"].get("failed_sitemaps") or self.report["plan"].get("error")):
+                raise Exception(f"Could not download the sitemaps of {roots}")
+            # A sitemap without child sitemaps can't be split any further
+            results.append([entry for entry in plan if "link" in entry])
+            children = [entry["sitemap"] for entry in plan if "sitemap" in entry]
+            queries = [
+                {"type": "sitemaps", "sitemaps": sitemaps, **window, **limits}
+                for sitemaps in split_sitemaps(children, shards)
+            ]
+
+        self.shard_count = max(1, len(queries))
+        with ThreadPoolExecutor(max_workers=self.shard_count) as executor:
+            shard_results = list(executor.map(self._crawl_shard_with_retries, queries, range(len(queries))))
+        for data, report in shard_results:
+            results.append(data)
+            self.report["shards"].append(report)
+        self.report["failed_sitemaps"] = [
+            url for report in self.report["shards"] for url in report.get("failed_sitemaps", [])
+        ]
+        reasons = [
+            report["report"].get("reason") for report in self.report["shards"]
+            if report.get("report", {}).get("partial")
+        ]
+        if reasons:
+            self.report.update(partial=True, reason=reasons[0] or "deadline")
+        if self.output:
+            self.report["output"] = [path for data in results for path in data]
+            return self.report["output"]
+        links = merge_links(results)
+        if limits.get("max_items") and len(links) > limits["max_items"]:
+            # Every shard stopped at the limit on its own
+            links = links[:limits["max_items"]]
+            self.report.update(partial=True, reason="max_items")
+        if self.query.get("columnar"):
+            from newton_scrapping.items import SitemapBatch
+
+            return SitemapBatch.from_dicts(links)
+        return links
+
+    def _crawl_shard_with_retries(self, query, index) -> tuple:
+        """Crawls a shard, crawling its failed sitemaps again
+
+        Returns:
+            tuple: the data of every attempt and the report of the shard
+        """
+        retries = self.query.get("shard_retries", 2)
+        started = time.monotonic()
+        data, report = [], {"shard": index, "attempts": 0}
+        if query["type"] == "sitemaps":
+            report["sitemaps"] = len(query["sitemaps"])
+        else:
+            report.update(since=query["since"], until=query["until"])
+        completed = False
+        for attempt in range(retries + 1):
+            if attempt and self.deadline_at is not None and time.time() >= self.deadline_at:
+                break
+            report["attempts"] = attempt + 1
+            try:
+                output, shard_report = self._crawl_shard(query, index)
+            except Exception as exception:
+                report["error"] = str(exception)
+                continue
+            report.pop("error", None)
+            report["report"] = shard_report
+            data.extend(output)
+            if query["type"] == "sitemaps":
+                if not shard_report.get("failed_sitemaps"):
+                    completed = True
+                    break
+                # Only the sitemaps that failed are crawled again
+                query = {**query, "sitemaps": shard_report["failed_sitemaps"]}
+            elif not shard_report.get("failed_requests"):
+                completed = True
+                break
+        if not completed and query["type"] == "sitemaps":
+            report["failed_sitemaps"] = list(query["sitemaps"])
+        report["links"] = len(data)
+        report["seconds"] = round(time.monotonic() - started, 3)
+        return data, report
+
+    def _crawl_shard(self, query, index=None) -> tuple:
+        """Crawls a query of a sharded crawl in its own process
+
+        The metrics and profile of every shard go to a "shard-<index>"
+        subdirectory, the shard used to split the crawl keeps no output.
+
+        Returns:
+            tuple: the data and the report of the crawl
+        """
+        options = self.get_options()
+        for name in ("metrics", "profile"):
+            if options[name]:
+                options[name] = os.path.join(options[name], "plan" if index is None else f"shard-{index}")
+        if index is None:
+            options.update(output=None, near_duplicates=None)
+        if self.resume_key:
+            # Every shard query, retries included, has its own checkpoint
+            options["resume_key"] = os.path.join(self.resume_key, "shard-" + query_digest(query))
+        if self.deadline_at is not None:
+            # The shards share the deadline of the whole crawl
+            options["deadline"] = max(0.0, self.deadline_at - time.time())
+        if index is not None:
+            # The shards crawl the same domains at once, they split their throttle
+            options["throttle_shares"] = self.throttle_shares * self.shard_count
+        crawler = type(self)(query=query, proxies=self.proxies, pool=self.pool, **options)
+        output = crawler.crawl()
+        return output, crawler.report
+
+    def _crawl_mapped(self) -> MappedResults:
+        """Crawls through a memory mapped result file
+
+        Returns:
+            MappedResults: article data or sitemap links, (link, result) tuples
+            for an "articles" query
+        """
+        path = create_result_file()
+        spawned_at = time.time()
+        context = self.get_context()
+        self.output_queue = context.Queue()
+        process = context.Process(
+            target=self.mapped_crawler, args=(self.query, path, self.output_queue)
+        )
+        process.start()
+        try:
+            kind, payload = _get_message(self.output_queue, process)
+        except BaseException:
+            os.remove(path)
+            raise
+        finally:
+            received_at = time.time()
+            _reap(process)
+        if kind == _STREAM_ERROR:
+            os.remove(path)
+            raise Exception(payload)
+        self.report = payload
+        self.report["timings"] = _phase_timings(payload.get("timings"), spawned_at, received_at)
+        return MappedResults(path)
+
+    def iter_crawl(self, buffer_size=1000):
+        """Crawls like crawl() but yields every item as soon as it is scraped
+
+        The child process blocks once buffer_size items are waiting to be
+        consumed, so a slow consumer slows the crawl down instead of letting
+        results pile up in memory. Stopping the iteration early terminates
+        the crawl, so does the deadline.
+
+        Args:
+            buffer_size (int, optional): max items in flight between the
+                crawler process and the caller. Defaults to 1000.
+
+        Raises:
+            Exception: Raised exception when the crawl could not be started
+
+        Yields:
+            dict: article data or sitemap link, (link, result) tuples for
+            an "articles" query
+        """
+        spawned_at = time.time()
+        if self.deadline is not None:
+            self.deadline_at = spawned_at + self.deadline
+        context = self.get_context()
+        output_queue = context.Queue(maxsize=buffer_size)
+        process = context.Process(
+            target=self.stream_crawler, args=(self.query, output_queue)
+        )
+        process.start()
+        finished = False
+        self.report = {}
+        try:
+            while True:
+                try:
+                    kind, payload = _get_message(output_queue, process, self.deadline_at)
+                except _DeadlineReached:
+                    self.report = {"partial": True, "reason": "deadline", "terminated": True}
+                    break
+                if kind == _STREAM_END:
+                    self.report = payload or {}
+                    finished = True
+                    break
+                if kind == _STREAM_ERROR:
+                    raise Exception(payload)
+                yield payload
+        finally:
+            received_at = time.time()
+            # A crawler blocked on the full queue can't shut down gracefully
+            _reap(process, timeout=5 if finished else 0)
+            self.report["timings"] = _phase_timings(self.report.get("timings"), spawned_at, received_at)
+
+    async def acrawl(self):
+        """Crawls like crawl() but awaits the result without blocking the loop
+
+        The results are received from the crawler process through a pipe
+        watched by the event loop, so no thread is held while the crawl runs
+        and many crawls can be awaited at the same time. Cancelling the task
+        terminates the crawler process. Sharded sitemap queries run crawl()
+        in the default executor.
+
+        Raises:
+            Exception: Raised exception when the crawl could not be started
+
+        Returns:
+            list[dict]: same data as crawl()
+        """
+        if self.query.get("type") == "sitemap" and self.query.get("shards", 1) > 1:
+            return await asyncio.get_running_loop().run_in_executor(None, self.crawl)
+
+        if self.in_loop:
+            return await self._acrawl_in_loop()
+
+        if self.pool is not None:
+            if self.deadline is not None:
+                self.deadline_at = time.time() + self.deadline
+            future = self.pool.submit(self.query, self.proxies, **self.get_options())
+            try:
+                output = await asyncio.wait_for(
+                    asyncio.wrap_future(future),
+                    None if self.deadline_at is None else max(0.0, self.deadline_at - time.time()),
+                )
+            except asyncio.TimeoutError:
+                self.report = {"partial": True, "reason": "deadline"}
+                return self._collect([])
+            self.report = future.report
+            return output
+
+        if self.deadline is not None:
+            return self._collect([item async for item in self.aiter_crawl()])
+
+        if self.transport == "mmap":
+            path = create_result_file()
+            process, connection = self._start_piped(self.mapped_crawler, path)
+            try:
+                kind, payload = await receive(connection)
+            except BaseException:
+                await self._areap(process, connection, terminate=True)
+                os.remove(path)
+                raise
+            await self._areap(process, connection)
+            if kind == _STREAM_ERROR:
+                os.remove(path)
+                raise Exception(payload)
+            self.report = payload
+            return MappedResults(path)
+
+        spawned_at = time.time()
+        process, connection = self._start_piped(self.start_crawler)
+        try:
+            output = await receive(connection)
+            self.report = await receive(connection)
+        except BaseException:
+            await self._areap(process, connection, terminate=True)
+            raise
+        received_at = time.time()
+        await self._areap(process, connection)
+        self.report["timings"] = _phase_timings(self.report.get("timings"), spawned_at, received_at)
+        return output
+
+    async def aiter_crawl(self):
+        """Crawls like iter_crawl() as an async iterator
+
+        The crawler process blocks while the pipe to the caller is full, so a
+        slow consumer slows the crawl down. Stopping the iteration early
+        terminates the crawl.
+
+        Raises:
+            Exception: Raised exception when the crawl could not be started
+
+        Yields:
+            dict: article data or sitemap link, (link, result) tuples for
+            an "articles" query
+        """
+        if self.in_loop:
+            async for item in self._aiter_in_loop():
+                yield item
+            return
+
+        spawned_at = time.time()
+        if self.deadline is not None:
+            self.deadline_at = spawned_at + self.deadline
+        process, connection = self._start_piped(self.stream_crawler)
+        finished = False
+        self.report = {}
+        try:
+            while True:
+                try:
+                    kind, payload = await asyncio.wait_for(
+                        receive(connection),
+                        None if self.deadline_at is None else max(0.0, self.deadline_at - time.time()),
+                    )
+                except asyncio.TimeoutError:
+                    self.report = {"partial": True, "reason": "deadline", "terminated": True}
+                    break
+                if kind == _STREAM_END:
+                    self.report = payload or {}
+                    finished = True
+                    break
+                if kind == _STREAM_ERROR:
+                    raise Exception(payload)
+                yield payload
+        finally:
+            received_at = time.time()
+            # A crawler blocked on the full pipe can't shut down gracefully
+            await self._areap(process, connection, terminate=not finished)
+            self.report["timings"] = _phase_timings(self.report.get("timings"), spawned_at, received_at)
+
+    def _start_piped(self, target, *args) -> tuple:
+        """Start a crawler process putting its results on a pipe
+
+        Returns:
+            tuple: the process and the readable end of the pipe
+        """
+        context = self.get_context()
+        connection, sender = context.Pipe(duplex=False)
+        process = context.Process(
+            target=self._run_piped, args=(target.__name__, self.query, *args, PipeSender(sender))
+        )
+        process.start()
+        # The reader gets EOFError instead of waiting forever if the process dies
+        sender.close()
+        return process, connection
+
+    def _run_piped(self, name, *args):
+        """Run a crawler process method in a process started from an event loop"""
+        # A forked process inherits the loop of the caller, marked as running
+        asyncio.set_event_loop(asyncio.new_event_loop())
+        getattr(self, name)(*args)
+
+    async def _areap(self, process, connection, terminate=False):
+        """Wait for the exit of a crawler process, terminating it first if asked"""
+        connection.close()
+        if terminate and process.is_alive():
+            process.terminate()
+        # The sentinel becomes readable once the process exited
+        await wait_readable(process.sentinel)
+        process.join()
+
+    def _get_loop_runner(self):
+        """CrawlerRunner on the asyncio reactor of the running event loop
+
+        Raises:
+            Exception: Raised exception when another reactor is installed
+        """
+        import sys
+
+        loop = asyncio.get_running_loop()
+        if "twisted.internet.reactor" not in sys.modules:
+            from twisted.internet import asyncioreactor
+
+            asyncioreactor.install(loop)
+        from twisted.internet import reactor
+        from scrapy.crawler import CrawlerRunner
+
+        if getattr(reactor, "_asyncioEventloop", None) is not loop:
+            raise Exception("in_loop crawls need the asyncio reactor to run on the running event loop")
+        if self.deadline is not None:
+            self.deadline_at = time.time() + self.deadline
+        runner = CrawlerRunner(self.get_settings())
+        if not reactor.running:
+            # Fires the startup triggers, the loop itself is run by the caller
+            reactor.startRunning(installSignalHandlers=False)
+        global _loop_crawls
+        _loop_crawls += 1
+        if self.deadline is not None:
+            # Nothing to terminate in the loop, the spiders are closed at the deadline
+            self._deadline_call = reactor.callLater(self.deadline, self.close_spiders, "deadline")
+        return runner
+
+    def _release_loop_runner(self):
+        """Cancel the deadline of an in-loop crawl and release the reactor"""
+        if self._deadline_call is not None and self._deadline_call.active():
+            self._deadline_call.cancel()
+        self._deadline_call = None
+        _release_loop_reactor()
+
+    async def _acrawl_in_loop(self):
+        """Crawls on the running event loop, like start_crawler() in a process"""
+        from newton_scrapping.items import SitemapBatch
+
+        runner = self._get_loop_runner()
+        self.crawlers = []
+        try:
+            if self.output:
+                await self.schedule(runner, _discard, stream=True).asFuture(asyncio.get_running_loop())
+                output = self.get_output_files()
+            else:
+                results = []
+                await self.schedule(runner, results.append).asFuture(asyncio.get_running_loop())
+                output = results[0] if results else []
+        finally:
+            self._release_loop_runner()
+            if self.query["type"] == "sitemap" and self.query.get("columnar") and isinstance(output, list):
+                output = SitemapBatch.from_dicts(output)
+        self.report = self.get_report()
+        return output
+
+    async def _aiter_in_loop(self):
+        """Streams the items of a crawl on the running event loop"""
+        runner = self._get_loop_runner()
+        self.crawlers = []
+        items = asyncio.Queue()
+        done = object()
+        deferred = self.schedule(runner, items.put_nowait, stream=True)
+        future = deferred.asFuture(asyncio.get_running_loop())
+        future.add_done_callback(lambda _: items.put_nowait(done))
+        try:
+            while True:
+                item = await items.get()
+                if item is done:
+                    break
+                yield item
+            future.result()
+        finally:
+            if not future.done():
+                # Stopping the iteration early stops the spiders
+                runner.stop()
+                await asyncio.wait([future])
+            self._release_loop_runner()
+        self.report = self.get_report()
+
+    def crawl_many(self, links) -> dict:
+        """Crawls all the article links in a single crawler process
+
+        Args:
+            links (list[str]): article URLs
+
+        Returns:
+            dict: article data keyed by URL, {"data": [...]} on success
+            or {"error": "..."} for links that failed
+        """
+        query = {"type": "articles", "links": links}
+        return type(self)(query=query, proxies=self.proxies, pool=self.pool, **self.get_options()).crawl()
+
+    def get_options(self) -> dict:
+        """Keyword arguments to build the same Crawler in another process"""
+        return {
+            "seen_index": self.seen_index,
+            "http_cache": self.http_cache,
+            "raw_response": self.raw_response,
+            "raw_response_dir": self.raw_response_dir,
+            "throttle": self.throttle,
+            "throttle_state": self.throttle_state,
+            "throttle_shares": self.throttle_shares,
+            "metrics": self.metrics,
+            "profile": self.profile,
+            "profile_mode": self.profile_mode,
+            "profile_memory": self.profile_memory,
+            "output": self.output,
+            "output_format": self.output_format,
+            "near_duplicates": self.near_duplicates,
+            "near_duplicate_action": self.near_duplicate_action,
+            "start_method": self.start_method,
+            "in_loop": self.in_loop,
+            "deadline": self.deadline,
+            "response_size_limits": self.response_size_limits,
+            "max_rss_mb": self.max_rss_mb,
+            "resume_key": self.resume_key,
+            "resume_dir": self.resume_dir,
+            "domain_cache": self.domain_cache,
+            "domain_cache_min_ttl": self.domain_cache_min_ttl,
+        }
+
+    def get_spider_class(self, type):
+        """Import the spider class of a query type
+
+        Args:
+            type (str): "sitemap", "article" or "sitemaps"
 
         Raises:
             Exception: Raised exception for unknown Type
 
         Returns:
-            list[dict]: list of dictionary of the article data or article links
-            as per expected_article.json or expected_sitemap.json
+            type: the spider class
         """
+        if type in _GENERIC_SPIDERS:
+            path = _GENERIC_SPIDERS[type]
+        elif self.spider_class is not None:
+            return self.spider_class
+        elif type in self.spider_classes:
+            path = self.spider_classes[type]
+        else:
+            raise Exception("Invalid Type")
+        module_name, _, class_name = path.rpartition(".")
+        return getattr(import_module(module_name), class_name)
+
+    def get_preload_modules(self) -> list:
+        """Modules imported once for all the crawler processes"""
+        spider_modules = [path.rpartition(".")[0] for path in self.spider_classes.values()]
+        return list(dict.fromkeys(PRELOAD_MODULES + [type(self).__module__] + spider_modules))
 
-        process = CrawlerProcess()
-        process_settings = process.settings
+    def get_context(self):
+        """multiprocessing context the crawler processes are started with"""
+        context = multiprocessing.get_context(self.start_method)
+        if context.get_start_method() == "forkserver":
+            # Only used when the server starts, by the first forkserver crawl
+            context.set_forkserver_preload(self.get_preload_modules())
+        elif context.get_start_method() == "fork":
+            preload(self.get_preload_modules())
+        return context
+
+    def get_settings(self):
+        """Build the scrapy settings for the query and proxies
+
+        Returns:
+            Settings: settings to create the scrapy crawler with
+        """
+        from scrapy.settings import Settings
+
+        process_settings = Settings()
         process_settings["DOWNLOAD_DELAY"] = 0.25
         process_settings["REFERER_ENABLED"] = False
         process_settings["USER_AGENT"] = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.36"  # noqa: E501
-        process.settings = process_settings
-        if self.query["type"] == "article":
-            spider_args = {
-                "type": "article",
-                "url": self.query.get("link"),
-                "args": {"callback": output_queue.put},
-            }
-        elif self.query["type"] == "sitemap":
-            spider_args = {"type": "sitemap", "args": {"callback": output_queue.put}}
-        else:
-            raise Exception("Invalid Type")
 
-        if self.proxies:
-            process_settings = process.settings
+        if self.seen_index:
+            process_settings["SPIDER_MIDDLEWARES"][
+                "newton_scrapping.middlewares.SeenIndexMiddleware"
+            ] = 800
+            process_settings["NEWTON_SEEN_INDEX_PATH"] = self.seen_index
+
+        if self.http_cache:
+            process_settings["DOWNLOADER_MIDDLEWARES"][
+                "newton_scrapping.middlewares.NewtonScrappingDownloaderMiddleware"
+            ] = 585
+            process_settings["NEWTON_HTTPCACHE_ENABLED"] = True
+            process_settings["NEWTON_HTTPCACHE_DIR"] = self.http_cache
+
+        if self.throttle:
+            process_settings["DOWNLOADER_MIDDLEWARES"][
+                "newton_scrapping.middlewares.NewtonScrappingDownloaderMiddleware"
+            ] = 585
+            process_settings["NEWTON_THROTTLE_ENABLED"] = True
+            process_settings["CONCURRENT_REQUESTS"] = 32
+            process_settings["NEWTON_THROTTLE_MAX_CONCURRENCY"] = 32
+            process_settings["NEWTON_THROTTLE_SHARES"] = self.throttle_shares
+            if self.throttle_state:
+                process_settings["NEWTON_THROTTLE_STATE_PATH"] = self.throttle_state
+                # Start every known domain from its saved state
+                process_settings["DOWNLOAD_SLOTS"] = {
+                    domain: {
+                        "concurrency": max(1, int(state["concurrency"] / self.throttle_shares)),
+                        "delay": state["delay"] * self.throttle_shares,
+                    }
+                    for domain, state in AdaptiveThrottle.load(self.throttle_state).items()
+                }
+
+        if self.deadline_at is not None:
+            process_settings["DOWNLOADER_MIDDLEWARES"][
+                "newton_scrapping.middlewares.NewtonScrappingDownloaderMiddleware"
+            ] = 585
+            # Downloads end when the spiders are closed
+            process_settings["NEWTON_DEADLINE_AT"] = self.deadline_at - self._deadline_grace()
+
+        if self.response_size_limits:
+            process_settings["EXTENSIONS"]["newton_scrapping.memory.ResponseSizeLimiter"] = 100
+            process_settings["NEWTON_RESPONSE_SIZE_LIMITS"] = dict(self.response_size_limits)
+
+        if self.max_rss_mb:
+            process_settings["EXTENSIONS"]["newton_scrapping.memory.MemoryWatchdog"] = 100
+            process_settings["NEWTON_MEMORY_LIMIT_MB"] = self.max_rss_mb
+
+        if self.resume_key and self.query["type"] != "articles":
+            # "articles" crawls are checkpointed by link
+            process_settings["SPIDER_MIDDLEWARES"][
+                "newton_scrapping.middlewares.ResumeMiddleware"
+            ] = 900
+
+        if self.domain_cache:
+            process_settings["DOWNLOADER_MIDDLEWARES"][
+                "scrapy.downloadermiddlewares.robotstxt.RobotsTxtMiddleware"
+            ] = None
+            process_settings["DOWNLOADER_MIDDLEWARES"][
+                "newton_scrapping.middlewares.CachedRobotsTxtMiddleware"
+            ] = 100
+            process_settings["DOWNLOADER_MIDDLEWARES"][
+                "newton_scrapping.middlewares.SitemapCacheMiddleware"
+            ] = 50
+            process_settings["NEWTON_DOMAIN_CACHE_DIR"] = self.domain_cache
+            process_settings["NEWTON_DOMAIN_CACHE_MIN_TTL"] = self.domain_cache_min_ttl
+
+        if self.metrics:
+            process_settings["DOWNLOADER_MIDDLEWARES"][
+                "newton_scrapping.middlewares.NewtonScrappingDownloaderMiddleware"
+            ] = 585
+            process_settings["SPIDER_MIDDLEWARES"][
+                "newton_scrapping.middlewares.NewtonScrappingSpiderMiddleware"
+            ] = 950
+            process_settings["NEWTON_METRICS_ENABLED"] = True
+
+        if self.near_duplicates:
+            process_settings["ITEM_PIPELINES"][
+                "newton_scrapping.pipelines.NearDuplicatePipeline"
+            ] = 800
+            process_settings["SPIDER_MIDDLEWARES"][
+                "newton_scrapping.middlewares.ResponseUrlMiddleware"
+            ] = 940
+            process_settings["NEWTON_NEAR_DUPLICATE_INDEX"] = self.near_duplicates
+            process_settings["NEWTON_NEAR_DUPLICATE_ACTION"] = self.near_duplicate_action
+
+        if self.raw_response != "inline":
+            process_settings["ITEM_PIPELINES"][
+                "newton_scrapping.pipelines.RawResponsePipeline"
+            ] = 900
+            process_settings["NEWTON_RAW_RESPONSE_STORAGE"] = self.raw_response
+            process_settings["NEWTON_RAW_RESPONSE_DIR"] = self.raw_response_dir
+
+        if self.output:
+            process_settings["ITEM_PIPELINES"][
+                "newton_scrapping.pipelines.BulkOutputPipeline"
+            ] = 950
+            process_settings["NEWTON_OUTPUT_DIR"] = self.output
+            process_settings["NEWTON_OUTPUT_FORMAT"] = self.output_format
+
+        if isinstance(self.proxies, list):
+            process_settings["DOWNLOADER_MIDDLEWARES"][
+                "newton_scrapping.middlewares.ProxyPoolMiddleware"
+            ] = 740
+            process_settings["NEWTON_PROXY_LIST"] = self.proxies
+        elif self.proxies:
             process_settings["DOWNLOADER_MIDDLEWARES"][
                 "scrapy.downloadermiddlewares.httpproxy.HttpProxyMiddleware"
             ] = 400
@@ -92,8 +1075,554 @@ class Crawler:
             )
             process_settings["HTTP_PROXY_USER"] = self.proxies["proxyUsername"]
             process_settings["HTTP_PROXY_PASS"] = self.proxies["proxyPassword"]
-            process.settings = process_settings
+        return process_settings
+
+    def start_profiler(self):
+        """Start profiling the current process when the crawl is profiled"""
+        if self.profile:
+            self.profiler = CrawlProfiler(self.profile, mode=self.profile_mode, memory=self.profile_memory)
+            self.profiler.start()
+
+    def get_report(self) -> dict:
+        """Information about the finished crawl besides its data
+
+        Merges the metrics of all the spiders of the crawl and writes them to
+        the metrics directory, and stops the profiler.
+
+        Returns:
+            dict: "metrics" summary when metrics are enabled, paths of the
+            "profile" files when the crawl is profiled, paths of the "output"
+            files when the items are written to files, the "failed_sitemaps"
+            and number of "failed_requests" given up after their retries,
+            "partial" and the "reason" when the spiders were closed before
+            they were done, like "deadline", "max_items" or "memory_limit",
+            the checkpoint of a resumable crawl as "resume", and the start and end "timings" of the crawl
+        """
+        report = {}
+        if self.output:
+            report["output"] = self.get_output_files()
+        failed_sitemaps = [
+            url for crawler in self.crawlers for url in getattr(crawler.spider, "failed_sitemaps", ())
+        ]
+        if failed_sitemaps:
+            report["failed_sitemaps"] = failed_sitemaps
+        # Requests given up after all their retries
+        failed_requests = sum(crawler.stats.get_value("retry/max_reached", 0) for crawler in self.crawlers)
+        if failed_requests:
+            report["failed_requests"] = failed_requests
+        # Spiders closed before they were done, by the deadline or a limit
+        reasons = [
+            reason for reason in (crawler.stats.get_value("finish_reason") for crawler in self.crawlers)
+            if reason not in (None, "finished")
+        ]
+        if self.close_reason:
+            reasons.insert(0, self.close_reason)
+        if reasons:
+            report["partial"] = True
+            report["reason"] = reasons[0]
+        if self.checkpoint is not None:
+            report["resume"] = self.checkpoint.finish(not reasons, self.get_output_files() if self.output else ())
+            self.checkpoint = None
+        if self.timings:
+            report["timings"] = dict(self.timings)
+        if self.profiler is not None:
+            report["profile"] = self.profiler.stop()
+            self.profiler = None
+        if self.metrics:
+            metrics = CrawlMetrics()
+            for crawler in self.crawlers:
+                if getattr(crawler, "newton_metrics", None) is not None:
+                    metrics.merge(crawler.newton_metrics)
+            report["metrics"] = metrics.write(self.metrics)
+        return report
+
+    def get_output_files(self) -> list:
+        """Paths of the files the items of the crawl were written to"""
+        files = {}
+        if self.checkpoint is not None:
+            files.update(dict.fromkeys(self.checkpoint.output_files))
+        for crawler in self.crawlers:
+            files.update(dict.fromkeys(getattr(crawler, "newton_output_files", ())))
+        return list(files)
+
+    def get_spider_args(self, callback) -> dict:
+        """Build the spider keyword arguments for the query
+
+        Args:
+            callback (callable): called by the spider with the final data
+
+        Raises:
+            Exception: Raised exception for unknown Type
+
+        Returns:
+            dict: keyword arguments for the spider
+        """
+        if self.query["type"] == "article":
+            spider_args = {
+                "type": "article",
+                "url": self.query.get("link"),
+                "args": {"callback": callback},
+            }
+        elif self.query["type"] == "sitemap":
+            spider_args = {
+                "type": "sitemap",
+                "args": {
+                    "callback": callback,
+                    "since": self.query.get("since"),
+                    "until": self.query.get("until"),
+                },
+            }
+        elif self.query["type"] == "sitemaps":
+            spider_args = {
+                "type": "sitemaps",
+                "args": {
+                    "callback": callback,
+                    "sitemaps": self.query.get("sitemaps"),
+                    "since": self.query.get("since"),
+                    "until": self.query.get("until"),
+                    "expand": self.query.get("expand", True),
+                },
+            }
+        else:
+            raise Exception("Invalid Type")
+        return spider_args
+
+    def schedule(self, runner, callback, stream=False):
+        """Schedule the spider runs needed by the query on a runner
+
+        An "articles" query runs one spider per link on the same runner, so all
+        the links share one reactor and process. At most "concurrency" spiders
+        run at the same time. A resumed crawl delivers the checkpointed items
+        first, and only crawls the "articles" links without a result.
+
+        Args:
+            runner (CrawlerRunner): runner or process to schedule the spiders on
+            callback (callable): called once with the final data, or with every
+                item (a (link, result) tuple for "articles") when stream is True
+            stream (bool, optional): deliver items as soon as they are scraped.
+                Defaults to False.
+
+        Returns:
+            Deferred: fired when all the spiders are closed
+        """
+        from scrapy import signals
+        from twisted.internet.defer import DeferredList, DeferredSemaphore, succeed
+
+        self.close_reason = None
+        self.items_scraped = 0
+        self.bytes_received = 0
+        status = None
+        if self.resume_key:
+            self.checkpoint = CrawlCheckpoint(os.path.join(self.resume_dir, self.resume_key))
+            status = self.checkpoint.begin(self.query)
+
+        if self.query["type"] != "articles":
+            if self.checkpoint is not None and not self.output:
+                earlier = self.checkpoint.items()
+                if stream:
+                    for item in earlier:
+                        callback(item)
+                elif earlier:
+                    deliver = callback
+
+                    def callback(data):
+                        deliver(earlier + list(data))
+            if status == "finished":
+                # Nothing left to crawl
+                if not stream:
+                    callback([])
+                return succeed(None)
+            _, deferred = self._crawl(runner, self.get_spider_args(None), callback, stream)
+            return deferred
+
+        earlier = self.checkpoint.results() if self.checkpoint is not None else {}
+        results = {}
+        semaphore = DeferredSemaphore(self.query.get("concurrency", 16))
+
+        def set_result(link, result):
+            if stream:
+                callback((link, result))
+            else:
+                results[link] = result
+
+        def crawl_link(link):
+            if link in earlier:
+                set_result(link, earlier[link])
+                return None
+            if self.close_reason:
+                set_result(link, {"error": _CLOSE_ERRORS.get(self.close_reason, "Crawl stopped")})
+                return None
+            output = []
+            errors = []
+            spider_args = {"type": "article", "url": link, "args": {}}
+            crawler, deferred = self._crawl(runner, spider_args, output.append)
+            crawler.signals.connect(
+                lambda failure, response, spider: errors.append(failure.getErrorMessage()),
+                signal=signals.spider_error,
+                weak=False,
+            )
+
+            def finished(_):
+                if errors:
+                    result = {"error": errors[0]}
+                elif (output and output[0]) or crawler.stats.get_value("item_dropped_count"):
+                    result = {"data": output[0] if output else []}
+                elif self.close_reason:
+                    result = {"error": _CLOSE_ERRORS.get(self.close_reason, "Crawl stopped")}
+                else:
+                    result = {"error": _get_crawl_error(crawler.stats)}
+                if self.checkpoint is not None and "data" in result:
+                    # Links that failed are crawled again by the next run
+                    self.checkpoint.add_item(result, link)
+                    self.checkpoint.mark_done([link])
+                set_result(link, result)
+
+            def failed(failure):
+                set_result(link, {"error": failure.getErrorMessage()})
+
+            deferred.addCallbacks(finished, failed)
+            return deferred
+
+        def link_failed(failure, link):
+            # crawl_link raised before its spider ran, the spider class can't be imported for instance
+            set_result(link, {"error": failure.getErrorMessage()})
+
+        if runner.settings.getlist("NEWTON_PROXY_LIST"):
+            # Held for the whole crawl, so the proxy health outlives the spider of each link
+            pool = ProxyPool.from_settings(runner.settings)
+        else:
+            pool = None
+        deferreds = [
+            semaphore.run(crawl_link, link).addErrback(link_failed, link)
+            for link in dict.fromkeys(self.query["links"])
+        ]
+        deferred = DeferredList(deferreds)
+        if pool is not None:
+            deferred.addBoth(lambda result: pool.release() or result)
+        if not stream:
+            deferred.addCallback(lambda _: callback(results))
+        return deferred
+
+    def _crawl(self, runner, spider_args, callback, stream=False):
+        """Run one spider and deliver the items it scrapes
+
+        Items are taken from the item_scraped signal, so the project middlewares
+        and pipelines apply to them. The list a spider passes to its "callback"
+        arg is only used for spiders that don't yield their items. The
+        "max_items" and "max_bytes" of the query count the items and the
+        response bytes of all the spiders of the crawl. The items of a
+        resumable crawl are checkpointed with the URL they were scraped from.
+
+        Returns:
+            tuple: the scrapy crawler and the Deferred fired when it is closed
+        """
+        from scrapy import signals
+
+        from newton_scrapping.pipelines import BulkOutputPipeline
+
+        items = []
+        yielded = 0
+        max_items = self.query.get("max_items")
+        max_bytes = self.query.get("max_bytes")
+        # "articles" crawls checkpoint the result of every link instead
+        checkpoint = self.checkpoint if self.query["type"] != "articles" else None
+
+        def item_scraped(item, response, spider):
+            nonlocal yielded
+            yielded += 1
+            if max_items:
+                if self.items_scraped >= max_items:
+                    # Scraped by the spiders still closing
+                    return
+                self.items_scraped += 1
+                if self.items_scraped >= max_items:
+                    self.close_spiders("max_items")
+            if checkpoint is not None and response is not None:
+                if not self.output:
+                    checkpoint.add_item(item, response.url)
+                checkpoint.item_done(response.url)
+            if stream:
+                callback(item)
+            else:
+                items.append(item)
 
-        # TODO: Change path and spider name here
-        process.crawl(NTvSpider, **spider_args)
+        def item_dropped(item, response, exception, spider):
+            nonlocal yielded
+            yielded += 1
+            if checkpoint is not None and response is not None:
+                checkpoint.item_done(response.url)
+
+        def response_received(response, request, spider):
+            self.bytes_received += len(response.body)
+            if self.bytes_received >= max_bytes:
+                self.close_spiders("max_bytes")
+
+        def spider_closed(spider, reason):
+            # A spider closed by its MemoryWatchdog stops the whole crawl
+            if reason in _CLOSE_ERRORS:
+                self.close_spiders(reason)
+
+        def closed(data):
+            if yielded:
+                if not stream:
+                    callback(items)
+                return
+            if self.output:
+                # Data passed to the callback skipped the pipelines
+                BulkOutputPipeline.write_items(crawler, data)
+                return
+            if checkpoint is not None:
+                for entry in data:
+                    checkpoint.add_item(entry)
+            if stream:
+                for entry in data:
+                    callback(entry)
+            else:
+                callback(data)
+
+        spider_args["args"]["callback"] = closed
+        crawler = runner.create_crawler(self.get_spider_class(spider_args["type"]))
+        crawler.newton_checkpoint = checkpoint
+        self.crawlers.append(crawler)
+        crawler.signals.connect(item_scraped, signal=signals.item_scraped, weak=False)
+        crawler.signals.connect(item_dropped, signal=signals.item_dropped, weak=False)
+        crawler.signals.connect(spider_closed, signal=signals.spider_closed, weak=False)
+        if max_bytes:
+            crawler.signals.connect(response_received, signal=signals.response_received, weak=False)
+        return crawler, runner.crawl(crawler, **spider_args)
+
+    def start_crawler(self, query, output_queue):
+        """Crawls the sitemap URL and article URL and return final data
+
+        Raises:
+            Exception: Raised exception for unknown Type
+
+        Returns:
+            list[dict]: list of dictionary of the article data or article links
+            as per expected_article.json or expected_sitemap.json
+        """
+
+        from scrapy.crawler import CrawlerProcess
+
+        from newton_scrapping.items import SitemapBatch
+
+        self.timings = {"started_at": time.time()}
+        self.start_profiler()
+        def put_columnar(data):
+            # One list per field is much smaller to pickle and hold than a dict per link
+            output_queue.put(SitemapBatch.from_dicts(data) if isinstance(data, list) else data)
+
+        if query["type"] == "sitemap" and query.get("columnar"):
+            callback = put_columnar
+        else:
+            callback = output_queue.put
+        process = CrawlerProcess(self.get_settings())
+        if self.output:
+            # The items are only kept by BulkOutputPipeline
+            self.schedule(process, _discard, stream=True)
+            self.run_process(process)
+            output_queue.put(self.get_output_files())
+        else:
+            self.schedule(process, callback)
+            self.run_process(process)
+        output_queue.put(self.get_report())
+
+    def stream_crawler(self, query, output_queue):
+        """Crawls the query and puts every item on the queue as it is scraped
+
+        Every item is put as an ("item", data) message and the stream always
+        ends with an ("end", report) message.
+        """
+        from scrapy.crawler import CrawlerProcess
+
+        self.timings = {"started_at": time.time()}
+        self.start_profiler()
+        try:
+            process = CrawlerProcess(self.get_settings())
+            self.schedule(
+                process, lambda item: output_queue.put((_STREAM_ITEM, item)), stream=True
+            )
+        except Exception as exception:
+            output_queue.put((_STREAM_ERROR, str(exception)))
+        else:
+            self.run_process(process)
+        output_queue.put((_STREAM_END, self.get_report()))
+
+    def mapped_crawler(self, query, path, output_queue):
+        """Crawls the query writing every item to a result file
+
+        Puts ("end", report) on the queue once the file is complete, or
+        ("error", message) when the crawl could not be started.
+        """
+        from scrapy.crawler import CrawlerProcess
+
+        writer = ResultWriter(path)
+        self.timings = {"started_at": time.time()}
+        self.start_profiler()
+        try:
+            process = CrawlerProcess(self.get_settings())
+            self.schedule(process, writer.write, stream=True)
+        except Exception as exception:
+            writer.close()
+            output_queue.put((_STREAM_ERROR, str(exception)))
+            return
+        self.run_process(process)
+        writer.close()
+        output_queue.put((_STREAM_END, self.get_report()))
+
+    def run_process(self, process):
+        """Run a CrawlerProcess until its spiders are done or the deadline
+
+        The spiders are closed with the "deadline" reason a grace period
+        before the deadline, so their items reach the caller in time. Spiders
+        still closing halfway through the grace period are abandoned.
+        """
+        from twisted.internet import reactor
+
+        if self.deadline_at is not None:
+            grace = self._deadline_grace()
+            reactor.callLater(max(0.0, self.deadline_at - grace - time.time()), self.close_spiders, "deadline")
+            reactor.callLater(max(0.0, self.deadline_at - grace / 2 - time.time()), _crash_reactor)
+        self.timings["crawl_started_at"] = time.time()
         process.start()
+        self.timings["crawl_finished_at"] = time.time()
+
+    def _deadline_grace(self) -> float:
+        """Seconds before the deadline the spiders are closed at"""
+        return min(self.deadline * _DEADLINE_GRACE, _DEADLINE_GRACE_MAX)
+
+    def close_spiders(self, reason):
+        """Close the running spiders of the crawl
+
+        The spiders pass the items they hold to their callback as they close,
+        and "articles" links not started yet are given up. The first reason
+        is the one reported.
+        """
+        if self.close_reason is None:
+            self.close_reason = reason
+        if self.checkpoint is not None:
+            self.checkpoint.freeze()
+        for crawler in self.crawlers:
+            if crawler.crawling and crawler.engine is not None and crawler.engine.running:
+                crawler.engine.close_spider(crawler.spider, reason)
+
+
+def preload(modules):
+    """Import modules, skipping the ones that can't be imported"""
+    for module in modules:
+        try:
+            import_module(module)
+        except ImportError:
+            pass
+
+
+def _crash_reactor():
+    """Stop the reactor without waiting for the spiders to close"""
+    from twisted.internet import reactor
+
+    # stop() would wait for the shutdown of the crawlers, the crawler
+    # process exits right after anyway
+    if reactor.running:
+        reactor.crash()
+        # What the skipped shutdown trigger does, its threads would keep the
+        # process from exiting
+        if reactor.threadpool is not None:
+            reactor._stopThreadPool()
+
+
+class _DeadlineReached(Exception):
+    pass
+
+
+def _get_message(queue, process, deadline_at=None):
+    """Get the next message a crawler process puts on a queue
+
+    Raises:
+        _DeadlineReached: Raised when deadline_at passed first
+        Exception: Raised when the process exited without putting it
+    """
+    while True:
+        timeout = 1.0
+        if deadline_at is not None:
+            timeout = min(timeout, deadline_at - time.time())
+            if timeout <= 0:
+                raise _DeadlineReached()
+        try:
+            return queue.get(timeout=timeout)
+        except Empty:
+            if process.is_alive():
+                continue
+        try:
+            # Put right before the process exited
+            return queue.get(timeout=1)
+        except Empty:
+            raise Exception(f"Crawler process exited with code {process.exitcode} without sending its results")
+
+
+def _reap(process, timeout=5):
+    """Wait for a crawler process to exit, terminating then killing it if it doesn't"""
+    process.join(timeout)
+    if process.is_alive():
+        process.terminate()
+        process.join(1)
+    if process.is_alive():
+        process.kill()
+    process.join()
+
+
+def _phase_timings(child, spawned_at, received_at) -> dict:
+    """Seconds spent in every phase of a crawl in a crawler process
+
+    Args:
+        child (dict): "started_at", "crawl_started_at" and "crawl_finished_at"
+            times of the crawler process, None when it didn't report them
+        spawned_at (float): time the process was started at
+        received_at (float): time the last result was received at
+
+    Returns:
+        dict: "spawn" until the process runs, "setup" of the crawler, "crawl"
+        until the spiders are closed, "transfer" of the results, "reap" of
+        the process and "total"
+    """
+    now = time.time()
+    if child and "crawl_finished_at" in child:
+        marks = [
+            ("spawn", spawned_at), ("setup", child["started_at"]), ("crawl", child["crawl_started_at"]),
+            ("transfer", child["crawl_finished_at"]), ("reap", received_at), (None, now),
+        ]
+    else:
+        # The process was terminated or failed before reporting
+        marks = [("crawl", spawned_at), ("reap", received_at), (None, now)]
+    timings = {phase: round(max(0.0, end - start), 3) for (phase, start), (_, end) in zip(marks, marks[1:])}
+    timings["total"] = round(now - spawned_at, 3)
+    return timings
+
+
+def _release_loop_reactor():
+    """Stop the reactor threads once no in-loop crawl is running
+
+    The reactor of in-loop crawls is never stopped, its threads would keep the
+    interpreter from exiting.
+    """
+    from twisted.internet import reactor
+
+    global _loop_crawls
+    _loop_crawls -= 1
+    if not _loop_crawls and reactor.threadpool is not None:
+        # What the shutdown trigger of the reactor does, the next crawl
+        # creates a new pool
+        reactor._stopThreadPool()
+
+
+def _discard(item):
+    pass
+
+
+def _get_crawl_error(stats) -> str:
+    """Describe why a spider run returned no data from its stats"""
+    for key, value in stats.get_stats().items():
+        if key.startswith("downloader/exception_type_count/"):
+            return key.rsplit("/", 1)[-1]
+        if key.startswith("downloader/response_status_count/") and int(key.rsplit("/", 1)[-1]) >= 400:
+            return "HTTP " + key.rsplit("/", 1)[-1]
+    return "No data returned"
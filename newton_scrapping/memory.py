@@ -0,0 +1,213 @@
+"""Bounds on the memory a crawler process uses: response sizes and RSS"""
+
+import gc
+import logging
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured, StopDownload
+from twisted.internet import task
+
+from newton_scrapping.utils import get_rss_bytes
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+# Max bytes downloaded per content type, "type/*" and "*" match any subtype
+# and any type. Responses of TRUNCATED_TYPES over the limit are truncated,
+# the others are dropped.
+DEFAULT_SIZE_LIMITS = {
+    "text/html": 8 * MB,
+    "application/xhtml+xml": 8 * MB,
+    "application/xml": 100 * MB,
+    "text/xml": 100 * MB,
+    "application/x-gzip": 50 * MB,
+    "application/gzip": 50 * MB,
+    "image/*": 0,
+    "video/*": 0,
+    "audio/*": 0,
+    "*": 32 * MB,
+}
+TRUNCATED_TYPES = ("text/html", "application/xhtml+xml")
+
+# Sent with the rss when the process is above its soft memory limit, for
+# components holding items to pass them on
+memory_pressure = object()
+
+
+def media_type(content_type) -> str:
+    """Return the lowercase media type of a Content-Type header value"""
+    if isinstance(content_type, bytes):
+        content_type = content_type.decode("latin-1")
+    return (content_type or "").split(";")[0].strip().lower()
+
+
+def size_limit(limits, content_type):
+    """Return the max bytes of a content type, None when it isn't limited
+
+    Args:
+        limits (dict): max bytes by media type, "type/*" or "*"
+        content_type (str|bytes): Content-Type header value
+    """
+    media = media_type(content_type)
+    for key in (media, media.split("/")[0] + "/*", "*"):
+        if key in limits:
+            return limits[key]
+    return None
+
+
+def is_truncated(response) -> bool:
+    """Whether the body of a response is incomplete, truncated at its size
+    limit ("download_stopped") or cut short by the server ("dataloss")"""
+    return "download_stopped" in response.flags or "dataloss" in response.flags
+
+
+class ResponseSizeLimiter:
+    """
+    Caps the bytes downloaded per response by content type.
+    ...
+
+    Runs on the headers_received and bytes_received signals, so a download is
+    stopped as soon as it is over its limit instead of being held in memory
+    whole like DOWNLOAD_MAXSIZE responses without a Content-Length. HTML over
+    its limit is truncated and still parsed, the response gets the
+    "download_stopped" flag, other content is dropped. NEWTON_RESPONSE_SIZE_LIMITS
+    maps media types to max bytes.
+
+    Attributes
+    ----------
+    limits : dict
+        max bytes by media type, "type/*" or "*"
+    stats : StatsCollector
+        counts the truncated and dropped responses
+    """
+
+    def __init__(self, limits, stats=None):
+        self.limits = limits
+        self.stats = stats
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        limits = crawler.settings.getdict("NEWTON_RESPONSE_SIZE_LIMITS")
+        if not limits:
+            raise NotConfigured
+        limiter = cls({key.lower(): int(value) for key, value in limits.items()}, crawler.stats)
+        crawler.signals.connect(limiter.headers_received, signal=signals.headers_received)
+        crawler.signals.connect(limiter.bytes_received, signal=signals.bytes_received)
+        return limiter
+
+    def headers_received(self, headers, body_length, request, spider):
+        content_type = headers.get(b"Content-Type") or headers.get("Content-Type")
+        limit = size_limit(self.limits, content_type)
+        if limit is None:
+            return
+        truncate = media_type(content_type) in TRUNCATED_TYPES
+        request.meta["newton_size_limit"] = (limit, truncate)
+        if not truncate and body_length and body_length > limit:
+            self._stop(request, truncate, body_length)
+
+    def bytes_received(self, data, request, spider):
+        limit, truncate = request.meta.get("newton_size_limit", (None, False))
+        if limit is None:
+            return
+        received = request.meta.get("newton_bytes_received", 0) + len(data)
+        request.meta["newton_bytes_received"] = received
+        if received > limit:
+            self._stop(request, truncate, received)
+
+    def _stop(self, request, truncate, size):
+        if self.stats is not None:
+            self.stats.inc_value("newton/response_size/truncated" if truncate else "newton/response_size/dropped")
+        logger.debug("%s %s over its size limit (%s bytes)", "Truncating" if truncate else "Dropping", request, size)
+        raise StopDownload(fail=not truncate)
+
+
+class MemoryWatchdog:
+    """
+    Keeps the RSS of the crawler process under NEWTON_MEMORY_LIMIT_MB.
+    ...
+
+    Checks the RSS every NEWTON_MEMORY_CHECK_INTERVAL seconds. Above the limit
+    the engine is paused for NEWTON_MEMORY_PAUSE seconds of every check, so
+    fewer requests are in flight while the downloads and items already in
+    the process drain, the memory_pressure signal is sent for the components
+    holding items to pass them on, and garbage is collected. Above
+    NEWTON_MEMORY_HARD_LIMIT_MB (1.5 times the limit by default) the spider
+    is closed with the "memory_limit" reason.
+
+    Attributes
+    ----------
+    limit : int
+        RSS bytes above which the crawl is slowed down
+    hard_limit : int
+        RSS bytes above which the spider is closed
+    interval : float
+        seconds between two checks
+    pause : float
+        seconds the engine is paused for at every check above the limit
+    clock : IReactorTime
+        schedules the checks and the end of the pauses, the reactor by default
+    """
+
+    def __init__(self, crawler, limit, hard_limit, interval=1.0, pause=0.5, clock=None):
+        self.crawler = crawler
+        self.limit = limit
+        self.hard_limit = hard_limit
+        self.interval = interval
+        self.pause = min(pause, interval)
+        self.clock = clock
+        self.task = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        limit = settings.getfloat("NEWTON_MEMORY_LIMIT_MB")
+        if not limit:
+            raise NotConfigured
+        watchdog = cls(
+            crawler,
+            int(limit * MB),
+            int(settings.getfloat("NEWTON_MEMORY_HARD_LIMIT_MB", limit * 1.5) * MB),
+            settings.getfloat("NEWTON_MEMORY_CHECK_INTERVAL", 1.0),
+            settings.getfloat("NEWTON_MEMORY_PAUSE", 0.5),
+        )
+        crawler.signals.connect(watchdog.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(watchdog.spider_closed, signal=signals.spider_closed)
+        return watchdog
+
+    def get_clock(self):
+        if self.clock is None:
+            # Imported late so importing this module doesn't install a reactor
+            from twisted.internet import reactor
+
+            self.clock = reactor
+        return self.clock
+
+    def spider_opened(self, spider):
+        self.task = task.LoopingCall(self.check)
+        self.task.clock = self.get_clock()
+        self.task.start(self.interval, now=False)
+
+    def spider_closed(self, spider):
+        if self.task is not None and self.task.running:
+            self.task.stop()
+        self.task = None
+
+    def check(self):
+        rss = get_rss_bytes()
+        stats = self.crawler.stats
+        stats.max_value("newton/memory/max_rss", rss)
+        if rss < self.limit:
+            return
+        engine = self.crawler.engine
+        if rss >= self.hard_limit:
+            logger.warning("Closing the spider, RSS %d MB is over %d MB", rss // MB, self.hard_limit // MB)
+            self.spider_closed(None)
+            engine.close_spider(self.crawler.spider, "memory_limit")
+            return
+        stats.inc_value("newton/memory/pressure")
+        self.crawler.signals.send_catch_log(memory_pressure, rss=rss)
+        gc.collect()
+        if not engine.paused:
+            engine.pause()
+            self.get_clock().callLater(self.pause, engine.unpause)
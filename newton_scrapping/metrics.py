@@ -0,0 +1,217 @@
+"""Crawl timing histograms and counters, exported as Prometheus text and JSON"""
+
+import json
+import os
+import tempfile
+from bisect import bisect_left
+
+# Upper bounds in seconds, the last bucket is +Inf
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Histogram:
+    """
+    Fixed bucket histogram, cumulative counts are only computed on export.
+    ...
+
+    Attributes
+    ----------
+    buckets : tuple
+        upper bounds of the buckets
+    counts : list
+        observations per bucket, the last one being +Inf
+    count : int
+        number of observations
+    sum : float
+        total of the observations
+    """
+
+    __slots__ = ("buckets", "counts", "count", "sum")
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def merge(self, other: "Histogram"):
+        for index, count in enumerate(other.counts):
+            self.counts[index] += count
+        self.count += other.count
+        self.sum += other.sum
+
+    def quantile(self, q: float) -> float:
+        """Estimate a quantile by interpolating inside its bucket"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = self.buckets[index - 1] if index else 0.0
+                upper = self.buckets[index] if index < len(self.buckets) else lower
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "mean": round(self.sum / self.count, 6) if self.count else None,
+            "p50": _round(self.quantile(0.5)),
+            "p90": _round(self.quantile(0.9)),
+            "p99": _round(self.quantile(0.99)),
+        }
+
+
+def _round(value):
+    return None if value is None else round(value, 6)
+
+
+class CrawlMetrics:
+    """
+    Timings and counters of a crawl.
+    ...
+
+    Filled by the project middlewares: the queue_wait, download and parse
+    histograms (seconds), the bytes in and out, the items yielded by every
+    callback and the requests and errors of every domain. The metrics of the
+    spiders of one crawl are merged with ``merge()`` and exported with
+    ``to_prometheus()`` or ``summary()``.
+
+    Attributes
+    ----------
+    histograms : dict
+        "queue_wait", "download" and "parse" Histogram
+    bytes_in : int
+        response bytes received
+    bytes_out : int
+        request bytes sent
+    items : dict
+        items yielded by callback name
+    requests : dict
+        responses received by domain
+    errors : dict
+        errors by domain, then by exception name or HTTP status
+    """
+
+    HISTOGRAMS = ("queue_wait", "download", "parse")
+
+    def __init__(self):
+        self.histograms = {name: Histogram() for name in self.HISTOGRAMS}
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.items = {}
+        self.requests = {}
+        self.errors = {}
+
+    @classmethod
+    def from_crawler(cls, crawler) -> "CrawlMetrics":
+        """Return the metrics of a crawler, shared by all its middlewares"""
+        metrics = getattr(crawler, "newton_metrics", None)
+        if metrics is None:
+            metrics = crawler.newton_metrics = cls()
+        return metrics
+
+    def observe(self, name: str, seconds: float):
+        self.histograms[name].observe(seconds)
+
+    def add_items(self, callback: str, count: int):
+        self.items[callback] = self.items.get(callback, 0) + count
+
+    def add_request(self, domain: str):
+        self.requests[domain] = self.requests.get(domain, 0) + 1
+
+    def add_error(self, domain: str, reason: str):
+        errors = self.errors.setdefault(domain, {})
+        errors[reason] = errors.get(reason, 0) + 1
+
+    def merge(self, other: "CrawlMetrics"):
+        for name, histogram in other.histograms.items():
+            self.histograms[name].merge(histogram)
+        self.bytes_in += other.bytes_in
+        self.bytes_out += other.bytes_out
+        for callback, count in other.items.items():
+            self.add_items(callback, count)
+        for domain, count in other.requests.items():
+            self.requests[domain] = self.requests.get(domain, 0) + count
+        for domain, errors in other.errors.items():
+            for reason, count in errors.items():
+                self.errors.setdefault(domain, {})
+                self.errors[domain][reason] = self.errors[domain].get(reason, 0) + count
+
+    def summary(self) -> dict:
+        """JSON serializable summary of the metrics"""
+        return {
+            **{f"{name}_seconds": histogram.summary() for name, histogram in self.histograms.items()},
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "items": dict(self.items),
+            "requests": dict(self.requests),
+            "errors": {domain: dict(errors) for domain, errors in self.errors.items()},
+        }
+
+    def to_prometheus(self, prefix="newton_crawl") -> str:
+        """The metrics in the Prometheus text exposition format"""
+        lines = []
+        for name, histogram in self.histograms.items():
+            metric = f"{prefix}_{name}_seconds"
+            lines.append(f"# TYPE {metric} histogram")
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                lines.append(f'{metric}_bucket{{le="{bound}"}} {cumulative}')
+            lines.append(f'{metric}_bucket{{le="+Inf"}} {histogram.count}')
+            lines.append(f"{metric}_sum {histogram.sum}")
+            lines.append(f"{metric}_count {histogram.count}")
+        for direction in ("in", "out"):
+            lines.append(f"# TYPE {prefix}_bytes_{direction}_total counter")
+            lines.append(f"{prefix}_bytes_{direction}_total {getattr(self, 'bytes_' + direction)}")
+        lines.append(f"# TYPE {prefix}_items_total counter")
+        for callback, count in sorted(self.items.items()):
+            lines.append(f'{prefix}_items_total{{callback="{_escape(callback)}"}} {count}')
+        lines.append(f"# TYPE {prefix}_requests_total counter")
+        for domain, count in sorted(self.requests.items()):
+            lines.append(f'{prefix}_requests_total{{domain="{_escape(domain)}"}} {count}')
+        lines.append(f"# TYPE {prefix}_errors_total counter")
+        for domain, errors in sorted(self.errors.items()):
+            for reason, count in sorted(errors.items()):
+                lines.append(
+                    f'{prefix}_errors_total{{domain="{_escape(domain)}",reason="{_escape(reason)}"}} {count}'
+                )
+        return "\n".join(lines) + "\n"
+
+    def write(self, directory: str) -> dict:
+        """Write metrics.prom and metrics.json to a directory
+
+        Returns:
+            dict: the summary, with the "files" written
+        """
+        os.makedirs(directory, exist_ok=True)
+        summary = self.summary()
+        summary["files"] = {
+            "prometheus": _write_atomic(os.path.join(directory, "metrics.prom"), self.to_prometheus()),
+            "json": os.path.join(os.path.abspath(directory), "metrics.json"),
+        }
+        _write_atomic(summary["files"]["json"], json.dumps(summary, indent=2))
+        return summary
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _write_atomic(path: str, text: str) -> str:
+    # Scrapers of the textfile never see a partial file
+    path = os.path.abspath(path)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(fd, "w") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+    return path
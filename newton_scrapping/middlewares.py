@@ -3,21 +3,48 @@
 # See documentation in:
 # https://docs.scrapy.org/en/latest/topics/spider-middleware.html
 
-from scrapy import signals
+from time import perf_counter, time
+
+from scrapy import Request, signals
+from scrapy.downloadermiddlewares.robotstxt import RobotsTxtMiddleware
+from scrapy.exceptions import DropItem, NotConfigured
+from scrapy.http import Headers, Response
+from scrapy.responsetypes import responsetypes
+from scrapy.utils.httpobj import urlparse_cached
+from scrapy.utils.request import fingerprint
 
 # useful for handling different item types with a single interface
 from itemadapter import is_item, ItemAdapter
 
+from newton_scrapping.domain_cache import DomainCache
+from newton_scrapping.httpcache import CompressedCacheStorage
+from newton_scrapping.memory import is_truncated
+from newton_scrapping.metrics import CrawlMetrics
+from newton_scrapping.proxy_pool import ProxyPool, proxy_name
+from newton_scrapping.seen_index import SeenIndex, content_hash
+from newton_scrapping.throttle import CONGESTION_STATUSES, AdaptiveThrottle
+
 
 class NewtonScrappingSpiderMiddleware:
     # Not all methods need to be defined. If a method is not defined,
     # scrapy acts as if the spider middleware does not modify the
     # passed objects.
 
+    # With NEWTON_METRICS_ENABLED the time spent in the spider callbacks and
+    # the items they yield are recorded in the crawler's CrawlMetrics. Only
+    # the time inside the callback is measured when the middleware is the
+    # closest to the spider, e.g. 950.
+
+    def __init__(self, metrics=None):
+        self.metrics = metrics
+
     @classmethod
     def from_crawler(cls, crawler):
         # This method is used by Scrapy to create your spiders.
-        s = cls()
+        metrics = None
+        if crawler.settings.getbool("NEWTON_METRICS_ENABLED"):
+            metrics = CrawlMetrics.from_crawler(crawler)
+        s = cls(metrics)
         crawler.signals.connect(s.spider_opened, signal=signals.spider_opened)
         return s
 
@@ -33,15 +60,62 @@ class NewtonScrappingSpiderMiddleware:
         # it has processed the response.
 
         # Must return an iterable of Request, or item objects.
-        for i in result:
-            yield i
+        if self.metrics is None:
+            yield from result
+            return
+        elapsed = 0.0
+        items = 0
+        iterator = iter(result)
+        try:
+            while True:
+                started = perf_counter()
+                try:
+                    i = next(iterator)
+                except StopIteration:
+                    break
+                finally:
+                    elapsed += perf_counter() - started
+                if is_item(i):
+                    items += 1
+                yield i
+        finally:
+            self._record_parse(response, elapsed, items)
+
+    async def process_spider_output_async(self, response, result, spider):
+        if self.metrics is None:
+            async for i in result:
+                yield i
+            return
+        elapsed = 0.0
+        items = 0
+        iterator = result.__aiter__()
+        try:
+            while True:
+                started = perf_counter()
+                try:
+                    i = await iterator.__anext__()
+                except StopAsyncIteration:
+                    break
+                finally:
+                    elapsed += perf_counter() - started
+                if is_item(i):
+                    items += 1
+                yield i
+        finally:
+            self._record_parse(response, elapsed, items)
+
+    def _record_parse(self, response, elapsed, items):
+        self.metrics.observe("parse", elapsed)
+        callback = getattr(response.request, "callback", None) if response.request else None
+        self.metrics.add_items(getattr(callback, "__name__", "parse"), items)
 
     def process_spider_exception(self, response, exception, spider):
         # Called when a spider or process_spider_input() method
         # (from other spider middleware) raises an exception.
 
         # Should return either None or an iterable of Request or item objects.
-        pass
+        if self.metrics is not None:
+            self.metrics.add_error(urlparse_cached(response).hostname or "", type(exception).__name__)
 
     def process_start_requests(self, start_requests, spider):
         # Called with the start requests of the spider, and works
@@ -61,11 +135,48 @@ class NewtonScrappingDownloaderMiddleware:
     # scrapy acts as if the downloader middleware does not modify the
     # passed objects.
 
+    # With NEWTON_HTTPCACHE_ENABLED responses are kept compressed in a
+    # CompressedCacheStorage and cached pages are revalidated with
+    # If-None-Match/If-Modified-Since, a 304 is answered from the cache.
+    # Truncated responses (see memory.is_truncated) are never stored.
+    # With NEWTON_THROTTLE_ENABLED an AdaptiveThrottle sets the concurrency and
+    # delay of every download slot from the latency and 429/503 it observes.
+    # The throttle is shared by the crawlers of the process, which split the
+    # concurrency and delay of every domain between them.
+    # It has to see the responses before RetryMiddleware, so the middleware is
+    # installed above 550.
+    # With NEWTON_METRICS_ENABLED the time requests wait in the scheduler, the
+    # download time (including the slot delay), the bytes and the errors of
+    # every domain are recorded in the crawler's CrawlMetrics.
+    # With NEWTON_DEADLINE_AT the download timeout of every request ends at
+    # that time, so the spiders can be closed before a crawl deadline.
+
+    def __init__(self, cache=None, stats=None, throttle=None, crawler=None, metrics=None, deadline_at=None):
+        self.cache = cache
+        self.stats = stats
+        self.throttle = throttle
+        self.crawler = crawler
+        self.metrics = metrics
+        self.deadline_at = deadline_at
+
     @classmethod
     def from_crawler(cls, crawler):
         # This method is used by Scrapy to create your spiders.
-        s = cls()
+        cache = None
+        if crawler.settings.getbool("NEWTON_HTTPCACHE_ENABLED"):
+            cache = CompressedCacheStorage.from_settings(crawler.settings)
+        throttle = None
+        if crawler.settings.getbool("NEWTON_THROTTLE_ENABLED"):
+            throttle = AdaptiveThrottle.from_settings(crawler.settings)
+        metrics = None
+        if crawler.settings.getbool("NEWTON_METRICS_ENABLED"):
+            metrics = CrawlMetrics.from_crawler(crawler)
+        deadline_at = crawler.settings.getfloat("NEWTON_DEADLINE_AT") or None
+        s = cls(cache, crawler.stats, throttle, crawler, metrics, deadline_at)
         crawler.signals.connect(s.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(s.spider_closed, signal=signals.spider_closed)
+        if metrics is not None:
+            crawler.signals.connect(s.request_scheduled, signal=signals.request_scheduled)
         return s
 
     def process_request(self, request, spider):
@@ -78,6 +189,27 @@ class NewtonScrappingDownloaderMiddleware:
         # - or return a Request object
         # - or raise IgnoreRequest: process_exception() methods of
         #   installed downloader middleware will be called
+        if self.metrics is not None:
+            now = perf_counter()
+            scheduled_at = request.meta.get("newton_scheduled_at")
+            if scheduled_at is not None:
+                self.metrics.observe("queue_wait", now - scheduled_at)
+            request.meta["newton_download_at"] = now
+        if self.throttle is not None:
+            self._apply_throttle(request.meta.get("download_slot") or urlparse_cached(request).hostname)
+        if self.deadline_at is not None:
+            timeout = request.meta.get("download_timeout", self.crawler.settings.getfloat("DOWNLOAD_TIMEOUT"))
+            request.meta["download_timeout"] = max(0.001, min(timeout, self.deadline_at - time()))
+        if self.cache is None or request.method != "GET" or request.meta.get("dont_cache"):
+            return None
+        key = fingerprint(request).hex()
+        entry = self.cache.retrieve(key, load_body=False)
+        if entry is not None:
+            request.meta["newton_cache_entry"] = entry
+            if entry["etag"]:
+                request.headers.setdefault("If-None-Match", entry["etag"])
+            if entry["last_modified"]:
+                request.headers.setdefault("If-Modified-Since", entry["last_modified"])
         return None
 
     def process_response(self, request, response, spider):
@@ -87,6 +219,37 @@ class NewtonScrappingDownloaderMiddleware:
         # - return a Response object
         # - return a Request object
         # - or raise IgnoreRequest
+        if self.metrics is not None:
+            self._record_response(request, response)
+        if self.throttle is not None:
+            self._observe(request, response)
+        if self.cache is None or request.method != "GET" or request.meta.get("dont_cache"):
+            return response
+        key = fingerprint(request).hex()
+        entry = request.meta.pop("newton_cache_entry", None)
+        if response.status == 304 and entry is not None:
+            body = self.cache.read_body(key)
+            if body is None:
+                # Lost since the request was sent, fetched again without validators
+                retry = request.replace(dont_filter=True)
+                retry.headers.pop("If-None-Match", None)
+                retry.headers.pop("If-Modified-Since", None)
+                return retry
+            self.cache.touch(key)
+            self.stats.inc_value("newton_httpcache/revalidated")
+            headers = Headers(entry["headers"])
+            respcls = responsetypes.from_args(headers=headers, url=entry["url"], body=body)
+            return respcls(
+                url=entry["url"], status=entry["status"], headers=headers,
+                body=body, request=request, flags=["cached"],
+            )
+        if is_truncated(response):
+            # Would be served as the whole page later
+            self.stats.inc_value("newton_httpcache/truncated")
+            return response
+        if response.status == 200 and b"no-store" not in response.headers.get("Cache-Control", b""):
+            self.cache.store(key, response.url, response.status, response.headers, response.body)
+            self.stats.inc_value("newton_httpcache/store")
         return response
 
     def process_exception(self, request, exception, spider):
@@ -97,7 +260,365 @@ class NewtonScrappingDownloaderMiddleware:
         # - return None: continue processing this exception
         # - return a Response object: stops process_exception() chain
         # - return a Request object: stops process_exception() chain
-        pass
+        if self.metrics is not None:
+            self.metrics.add_error(urlparse_cached(request).hostname or "", type(exception).__name__)
+        if self.throttle is not None and "download_slot" in request.meta:
+            self.throttle.on_error(request.meta["download_slot"])
+            self.stats.inc_value("newton_throttle/error")
+            self._apply_throttle(request.meta["download_slot"])
+        return None
+
+    def request_scheduled(self, request, spider):
+        request.meta["newton_scheduled_at"] = perf_counter()
+
+    def _record_response(self, request, response):
+        download_at = request.meta.get("newton_download_at")
+        if download_at is not None:
+            self.metrics.observe("download", perf_counter() - download_at)
+        domain = urlparse_cached(request).hostname or ""
+        self.metrics.bytes_in += len(response.body)
+        self.metrics.add_request(domain)
+        if response.status >= 400:
+            self.metrics.add_error(domain, str(response.status))
+
+    def _observe(self, request, response):
+        key = request.meta.get("download_slot")
+        if key is None:
+            return
+        self.throttle.on_response(
+            key, response.status, latency=request.meta.get("download_latency"),
+            retry_after=response.headers.get("Retry-After"),
+        )
+        if response.status in CONGESTION_STATUSES:
+            self.stats.inc_value(f"newton_throttle/{response.status}")
+        self._apply_throttle(key)
+
+    def _apply_throttle(self, key):
+        # The slot of a domain only exists once its first request was enqueued
+        slot = self.crawler.engine.downloader.slots.get(key) if self.crawler.engine else None
+        if slot is None:
+            return
+        # The crawlers of the process share the budget of the domain
+        users = self.throttle.attach(key, self)
+        slot.concurrency = self.throttle.concurrency(key, users)
+        slot.delay = self.throttle.delay(key, users)
 
     def spider_opened(self, spider):
         spider.logger.info("Spider opened: %s" % spider.name)
+
+    def spider_closed(self, spider):
+        if self.cache is not None:
+            self.cache.release()
+        if self.throttle is not None:
+            self.throttle.detach(self)
+            self.throttle.release()
+        if self.metrics is not None:
+            self.metrics.bytes_out = self.stats.get_value("downloader/request_bytes", 0)
+
+
+class SeenIndexMiddleware:
+    # Drops article items whose page did not change since an earlier crawl.
+    # The index configured by NEWTON_SEEN_INDEX_PATH is shared by the spiders
+    # of the process, and with the spider as ``spider.seen_index`` so its
+    # SitemapEngine can skip known URLs too.
+
+    def __init__(self, index, crawler):
+        self.index = index
+        self.crawler = crawler
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.get("NEWTON_SEEN_INDEX_PATH"):
+            raise NotConfigured
+        s = cls(SeenIndex.from_settings(crawler.settings), crawler)
+        crawler.signals.connect(s.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(s.spider_closed, signal=signals.spider_closed)
+        return s
+
+    def process_spider_output(self, response, result, spider):
+        for i in result:
+            if self._is_new(response, i, spider):
+                yield i
+
+    async def process_spider_output_async(self, response, result, spider):
+        async for i in result:
+            if self._is_new(response, i, spider):
+                yield i
+
+    def _is_new(self, response, i, spider):
+        if not (is_item(i) and "raw_response" in ItemAdapter(i)):
+            return True
+        modified_at = (ItemAdapter(i).get("parsed_data") or {}).get("modified_at")
+        lastmod = modified_at[0] if modified_at else None
+        if is_truncated(response):
+            # The hash of part of the page tells nothing, only modified_at can
+            body_hash = None
+            unchanged = lastmod is not None and self.index.is_unchanged(response.url, lastmod=lastmod)
+        else:
+            body_hash = content_hash(response.body)
+            unchanged = self.index.is_unchanged(response.url, content_hash=body_hash)
+        if unchanged:
+            self.crawler.stats.inc_value("seen_index/unchanged")
+            self.crawler.signals.send_catch_log(
+                signals.item_dropped, item=i, response=response, spider=spider,
+                exception=DropItem("Unchanged since the last crawl"),
+            )
+            return False
+        self.index.add(response.url, lastmod=lastmod, content_hash=body_hash)
+        self.crawler.stats.inc_value("seen_index/added")
+        return True
+
+    def spider_opened(self, spider):
+        spider.seen_index = self.index
+
+    def spider_closed(self, spider):
+        # Compacted and closed once the last spider of the process is done
+        self.index.release()
+
+
+class ResponseUrlMiddleware:
+    # Sets the URL of the response an article item was scraped from as
+    # ``raw_response["url"]``, so the pipelines can key the article by it when
+    # its JSON-LD has no url, like NearDuplicatePipeline does.
+
+    def process_spider_output(self, response, result, spider):
+        for i in result:
+            yield self._set_url(response, i)
+
+    async def process_spider_output_async(self, response, result, spider):
+        async for i in result:
+            yield self._set_url(response, i)
+
+    def _set_url(self, response, i):
+        if is_item(i):
+            raw_response = ItemAdapter(i).get("raw_response")
+            if isinstance(raw_response, dict):
+                raw_response.setdefault("url", response.url)
+        return i
+
+
+class ResumeMiddleware:
+    # Checkpoints a resumable crawl in its CrawlCheckpoint, set as
+    # ``crawler.newton_checkpoint`` by Crawler. Requests yielded by the spider
+    # are recorded as pending, and dropped when an earlier run already
+    # yielded them, responses are done once their items were scraped or
+    # dropped.
+    # When the crawl is resumed, the pending requests are sent after the
+    # start requests. A response yielding a request that can't be recorded
+    # is never done, so it is fetched again by the next run.
+
+    def __init__(self, checkpoint, crawler):
+        self.checkpoint = checkpoint
+        self.crawler = crawler
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        checkpoint = getattr(crawler, "newton_checkpoint", None)
+        if checkpoint is None:
+            raise NotConfigured
+        return cls(checkpoint, crawler)
+
+    def process_spider_output(self, response, result, spider):
+        output = {"recorded": True, "items": 0}
+        for i in result:
+            if self._record(i, output, spider):
+                yield i
+        self._done(response, output)
+
+    async def process_spider_output_async(self, response, result, spider):
+        output = {"recorded": True, "items": 0}
+        async for i in result:
+            if self._record(i, output, spider):
+                yield i
+        self._done(response, output)
+
+    def _record(self, i, output, spider):
+        if not isinstance(i, Request):
+            output["items"] += 1
+            return True
+        if self.checkpoint.is_known(i.url):
+            self.crawler.stats.inc_value("newton/resume/skipped")
+            return False
+        output["recorded"] = self.checkpoint.add_request(i, spider) and output["recorded"]
+        return True
+
+    def _done(self, response, output):
+        # Errback output has no response
+        if output["recorded"] and isinstance(response, Response):
+            urls = response.meta.get("redirect_urls", []) + [response.request.url, response.url]
+            self.checkpoint.mark_done(list(dict.fromkeys(urls)), response.url, output["items"])
+
+    def process_start_requests(self, start_requests, spider):
+        for r in start_requests:
+            if self._is_new_start(r, spider):
+                yield r
+        yield from self._pending(spider)
+
+    async def process_start(self, start):
+        # Scrapy >= 2.13
+        async for r in start:
+            if self._is_new_start(r, None):
+                yield r
+        for r in self._pending(None):
+            yield r
+
+    def _is_new_start(self, r, spider):
+        if not isinstance(r, Request):
+            return True
+        if self.checkpoint.is_known(r.url):
+            return False
+        self.checkpoint.add_request(r, spider or self.crawler.spider)
+        return True
+
+    def _pending(self, spider):
+        pending = self.checkpoint.pending_requests(spider or self.crawler.spider)
+        self.crawler.stats.set_value("newton/resume/pending", len(pending))
+        return pending
+
+
+class ProxyPoolMiddleware:
+    # Routes every request through a proxy of NEWTON_PROXY_LIST chosen by
+    # ProxyPool. Responses with a NEWTON_PROXY_BAN_CODES status and download
+    # errors count against the proxy and the request is retried through
+    # another one, up to NEWTON_PROXY_MAX_RETRIES times. It sets meta["proxy"]
+    # so it must come before HttpProxyMiddleware (750), which sends the
+    # credentials. The pool is shared by the crawlers of the process.
+
+    def __init__(self, pool, stats, ban_codes=(403, 407, 429), max_retries=2):
+        self.pool = pool
+        self.stats = stats
+        self.ban_codes = set(ban_codes)
+        self.max_retries = max_retries
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getlist("NEWTON_PROXY_LIST"):
+            raise NotConfigured
+        s = cls(
+            ProxyPool.from_settings(crawler.settings), crawler.stats,
+            ban_codes=[int(code) for code in crawler.settings.getlist("NEWTON_PROXY_BAN_CODES", [403, 407, 429])],
+            max_retries=crawler.settings.getint("NEWTON_PROXY_MAX_RETRIES", 2),
+        )
+        crawler.signals.connect(s.spider_closed, signal=signals.spider_closed)
+        return s
+
+    def process_request(self, request, spider):
+        # Requests with their own proxy are left alone
+        if "proxy" in request.meta and "newton_proxy" not in request.meta:
+            return None
+        url = self.pool.choose(exclude=request.meta.get("newton_proxies_tried", ()))
+        request.meta["proxy"] = request.meta["newton_proxy"] = url
+        self.stats.inc_value(f"proxy_pool/{proxy_name(url)}/requests")
+        return None
+
+    def process_response(self, request, response, spider):
+        url = request.meta.get("newton_proxy")
+        if url is None:
+            return response
+        if response.status in self.ban_codes:
+            return self._failed(request, url, spider) or response
+        self.pool.record_success(url, request.meta.get("download_latency"))
+        self.stats.inc_value(f"proxy_pool/{proxy_name(url)}/success")
+        return response
+
+    def process_exception(self, request, exception, spider):
+        url = request.meta.get("newton_proxy")
+        if url is None:
+            return None
+        return self._failed(request, url, spider)
+
+    def _failed(self, request, url, spider):
+        name = proxy_name(url)
+        self.stats.inc_value(f"proxy_pool/{name}/failure")
+        if self.pool.record_failure(url):
+            self.stats.inc_value(f"proxy_pool/{name}/ejected")
+            spider.logger.warning("Proxy %s ejected for %ss", name, self.pool.cooldown)
+        tried = request.meta.get("newton_proxies_tried", []) + [url]
+        if len(tried) > self.max_retries:
+            return None
+        self.stats.inc_value("proxy_pool/retry")
+        retry = request.replace(dont_filter=True)
+        retry.meta["newton_proxies_tried"] = tried
+        # Let process_request pick another proxy and HttpProxyMiddleware set its credentials
+        del retry.meta["proxy"]
+        del retry.meta["newton_proxy"]
+        retry.headers.pop(b"Proxy-Authorization", None)
+        return retry
+
+    def spider_closed(self, spider):
+        for url, health in self.pool.proxies.items():
+            if health["latency"] is not None:
+                self.stats.set_value(f"proxy_pool/{proxy_name(url)}/latency_ms", round(health["latency"] * 1000, 1))
+        self.pool.release()
+
+
+class CachedRobotsTxtMiddleware(RobotsTxtMiddleware):
+    # RobotsTxtMiddleware taking the parsed robots.txt rules of a domain from
+    # the DomainCache of NEWTON_DOMAIN_CACHE_DIR while they are fresh, so a
+    # crawl doesn't fetch and parse robots.txt before its first request to
+    # the domain. The robots.txt responses it fetches are parsed once more
+    # without the spider to be cached. Replaces RobotsTxtMiddleware (100) in
+    # DOWNLOADER_MIDDLEWARES.
+
+    def __init__(self, crawler):
+        super().__init__(crawler)
+        self.cache = None
+        if crawler.settings.get("NEWTON_DOMAIN_CACHE_DIR"):
+            self.cache = DomainCache.from_settings(crawler.settings)
+
+    def robot_parser(self, request, *args):
+        # Takes the spider with Scrapy < 2.13
+        url = urlparse_cached(request)
+        if self.cache is not None and url.netloc not in self._parsers:
+            parser = self.cache.get("robots", f"{url.scheme}://{url.netloc}/robots.txt")
+            if parser is not None:
+                self._parsers[url.netloc] = parser
+                self.crawler.stats.inc_value("newton/domain_cache/robots_hit")
+        return super().robot_parser(request, *args)
+
+    def process_response(self, request, response, spider=None):
+        if (
+            self.cache is not None
+            and request.meta.get("dont_obey_robotstxt")
+            and urlparse_cached(request).path == "/robots.txt"
+            and response.status < 500
+        ):
+            # Like RobotsTxtMiddleware, which parses the body of any response
+            url = request.meta.get("redirect_urls", [request.url])[0]
+            if self.cache.set("robots", url, self._parserimpl(response.body, None), response.headers):
+                self.crawler.stats.inc_value("newton/domain_cache/robots_stored")
+        return response
+
+
+class SitemapCacheMiddleware:
+    # Answers the robots.txt and sitemap index requests of the spiders using a
+    # DomainCache (SitemapShardSpider) with their entries cached by an earlier
+    # crawl, in response.meta["newton_cached_sitemap"], instead of downloading
+    # them. The cache of NEWTON_DOMAIN_CACHE_DIR is shared with those spiders
+    # as ``spider.domain_cache``, they store the entries they parse.
+
+    def __init__(self, cache, stats):
+        self.cache = cache
+        self.stats = stats
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.get("NEWTON_DOMAIN_CACHE_DIR"):
+            raise NotConfigured
+        s = cls(DomainCache.from_settings(crawler.settings), crawler.stats)
+        crawler.signals.connect(s.spider_opened, signal=signals.spider_opened)
+        return s
+
+    def process_request(self, request, spider):
+        if getattr(spider, "domain_cache", None) is not self.cache or request.meta.get("dont_obey_robotstxt"):
+            return None
+        nodes = self.cache.get("sitemap", request.url)
+        if nodes is None:
+            return None
+        self.stats.inc_value("newton/domain_cache/sitemap_hit")
+        request.meta["newton_cached_sitemap"] = nodes
+        return Response(request.url, status=200, request=request, flags=["domain_cache"])
+
+    def spider_opened(self, spider):
+        if hasattr(spider, "domain_cache"):
+            spider.domain_cache = self.cache
@@ -0,0 +1,421 @@
+"""MinHash signatures and a persistent LSH index of near-duplicate articles"""
+
+import os
+import sqlite3
+import string
+import threading
+import time
+import zlib
+
+import numpy as np
+
+# Punctuation is replaced by spaces before splitting the words, much faster than a regex
+_PUNCTUATION = str.maketrans(dict.fromkeys(string.punctuation + "“”‘’„«»–—…", " "))
+_ARTICLE_TYPES = {"NewsArticle", "Article", "ReportageNewsArticle", "AnalysisNewsArticle", "BlogPosting"}
+# Combines the word hashes of a shingle, any large odd constant works
+_SHINGLE_PRIME = np.uint64(0x100000001B3)
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def article_text(item) -> str:
+    """Title and text of an article item, the content compared for duplicates"""
+    parsed_data = item.get("parsed_data") or {}
+    return " ".join(
+        value for key in ("title", "text") for value in (parsed_data.get(key) or []) if isinstance(value, str)
+    )
+
+
+def article_url(item) -> str:
+    """URL of an article item
+
+    The url of its NewsArticle JSON-LD, else the URL of the response it was
+    scraped from, set in raw_response by ResponseUrlMiddleware, None when it
+    has neither.
+    """
+    main = (item.get("parsed_json") or {}).get("main") or []
+    for block in main if isinstance(main, list) else [main]:
+        if isinstance(block, dict) and block.get("@type") in _ARTICLE_TYPES and isinstance(block.get("url"), str):
+            return block["url"]
+    raw_response = item.get("raw_response")
+    if isinstance(raw_response, dict) and raw_response.get("url"):
+        return raw_response["url"]
+    return item.get("link")
+
+
+def shingle_hashes(text: str, size=5) -> np.ndarray:
+    """Hashes of the word n-grams of a text, stable across processes
+
+    Args:
+        text (str): article text
+        size (int, optional): words per shingle. Defaults to 5.
+
+    Returns:
+        np.ndarray: uint64 hash of every shingle, empty when the text has no words
+    """
+    words = text.lower().translate(_PUNCTUATION).split()
+    words = np.fromiter(map(zlib.crc32, map(str.encode, words)), dtype=np.uint64, count=len(words))
+    if not len(words):
+        return words
+    size = min(size, len(words))
+    count = len(words) - size + 1
+    hashes = np.zeros(max(count, 0), dtype=np.uint64)
+    for offset in range(size):
+        hashes = hashes * _SHINGLE_PRIME + words[offset:offset + count]
+    return hashes
+
+
+class NearDuplicateIndex:
+    """
+    Persistent MinHash LSH index of article texts.
+    ...
+
+    Every text is reduced to a ``num_perm`` MinHash signature of its word
+    shingles, computed for whole batches with NumPy. The signature is split
+    in ``bands`` bands whose hashes are the LSH bucket keys stored in sqlite,
+    so a lookup is one indexed query returning the few articles that share a
+    band. Candidates count as duplicates when the share of equal signature
+    values, an estimate of the Jaccard similarity of the shingles, is at
+    least ``threshold``. A lookup loads at most ``max_candidates`` articles,
+    the ones sharing the most bands. The index keeps the ``max_entries``
+    newest articles and evicts the ones older than ``ttl`` on ``compact()``.
+    It can be used from any thread, one at a time.
+
+    Attributes
+    ----------
+    path : str
+        sqlite database file
+    num_perm : int
+        signature length
+    bands : int
+        number of LSH bands, must divide num_perm
+    threshold : float
+        estimated Jaccard similarity from which texts are duplicates
+    shingle_size : int
+        words per shingle
+    ttl : int
+        seconds after which an entry is evicted, None to keep entries forever
+    max_entries : int
+        number of entries kept by compact(), None for no limit
+    max_candidates : int
+        number of indexed articles a lookup compares
+
+    Methods
+    -------
+    get(path, **options)
+        Returns the index of a path shared by the process
+    signatures(texts)
+        Computes the MinHash signatures of texts
+    find(signature, url)
+        Returns the most similar indexed article
+    candidates(keys, url)
+        Returns the indexed articles sharing a bucket with a signature
+    add(url, signature)
+        Indexes an article
+    check_many(documents)
+        Finds the duplicates of (url, text) pairs, indexing the others
+    compact()
+        Evicts expired entries and trims the index
+    """
+
+    SIGNATURE_CHUNK = 8192
+
+    def __init__(self, path, num_perm=128, bands=16, threshold=0.8, shingle_size=5, ttl=None,
+                 max_entries=None, seed=1, max_candidates=1000):
+        """
+        Args:
+            path (str): sqlite database file, created when missing
+            num_perm (int, optional): signature length. Defaults to 128.
+            bands (int, optional): LSH bands. Defaults to 16.
+            threshold (float, optional): duplicate similarity. Defaults to 0.8.
+            shingle_size (int, optional): words per shingle. Defaults to 5.
+            ttl (int, optional): seconds to keep an entry. Defaults to None.
+            max_entries (int, optional): entries kept by compact(). Defaults to None.
+            seed (int, optional): seed of the hash functions of a new index. Defaults to 1.
+            max_candidates (int, optional): articles compared per lookup. Defaults to 1000.
+
+        Raises:
+            ValueError: bands doesn't divide num_perm, or the index was created
+            with another num_perm or bands
+        """
+        if num_perm % bands:
+            raise ValueError("bands must divide num_perm")
+        self.path = path
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.threshold = threshold
+        self.shingle_size = shingle_size
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_candidates = max_candidates
+        self.references = 0
+        self.pending = 0
+        self._lock = threading.RLock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Batches are checked on the threads of the reactor pool, see NearDuplicatePipeline
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value BLOB)")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT, url TEXT UNIQUE, signature BLOB, added_at REAL)"
+        )
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS buckets (key INTEGER, document_id INTEGER,"
+            " PRIMARY KEY (key, document_id)) WITHOUT ROWID"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS buckets_document_idx ON buckets (document_id)")
+        try:
+            self._load_hash_functions(seed)
+        except ValueError:
+            self.db.close()
+            raise
+
+    def _load_hash_functions(self, seed):
+        # The hash functions are stored with the index so its signatures stay
+        # comparable whatever NumPy generates for the seed
+        meta = dict(self.db.execute("SELECT name, value FROM meta"))
+        if meta:
+            if int(meta["num_perm"]) != self.num_perm or int(meta["bands"]) != self.bands:
+                raise ValueError(
+                    f"{self.path} was created with num_perm={meta['num_perm']} and bands={meta['bands']}"
+                )
+            values = np.frombuffer(meta["hash_functions"], dtype=np.uint64).reshape(3, -1)
+        else:
+            random = np.random.default_rng(seed)
+            values = random.integers(0, 2 ** 64 - 1, size=(3, self.num_perm), dtype=np.uint64, endpoint=True)
+            values[0] |= np.uint64(1)
+            values[2] |= np.uint64(1)
+            self.db.executemany(
+                "INSERT INTO meta (name, value) VALUES (?, ?)",
+                [("num_perm", self.num_perm), ("bands", self.bands), ("hash_functions", values.tobytes())],
+            )
+            self.db.commit()
+        # Multipliers and increments of the permutations, multipliers of the band hashes
+        self._multipliers, self._increments, band_multipliers = values.copy()
+        self._band_multipliers = band_multipliers[:self.rows]
+
+    @classmethod
+    def from_settings(cls, settings, path=None) -> "NearDuplicateIndex":
+        """Open the index configured by the NEWTON_NEAR_DUPLICATE_* settings"""
+        ttl_days = settings.getfloat("NEWTON_NEAR_DUPLICATE_TTL_DAYS")
+        return cls.get(
+            path or settings.get("NEWTON_NEAR_DUPLICATE_INDEX"),
+            threshold=settings.getfloat("NEWTON_NEAR_DUPLICATE_THRESHOLD", 0.8),
+            ttl=ttl_days * 86400 if ttl_days else None,
+            max_entries=settings.getint("NEWTON_NEAR_DUPLICATE_MAX_ENTRIES") or None,
+            max_candidates=settings.getint("NEWTON_NEAR_DUPLICATE_MAX_CANDIDATES", 1000),
+        )
+
+    @classmethod
+    def get(cls, path, **options) -> "NearDuplicateIndex":
+        """Return the index of a path, shared by all the spiders of the process
+
+        Sharing one connection lets every spider see the articles indexed by
+        the others before they are committed. Every get() must be matched by
+        a release(), the index is compacted and closed by the last one.
+        """
+        key = os.path.abspath(path)
+        with _indexes_lock:
+            index = _indexes.get(key)
+            if index is None:
+                index = _indexes[key] = cls(path, **options)
+            index.references += 1
+            return index
+
+    def release(self):
+        with _indexes_lock:
+            self.references -= 1
+            if self.references > 0:
+                return
+            _indexes.pop(os.path.abspath(self.path), None)
+        self.compact()
+        self.close()
+
+    def __len__(self):
+        with self._lock:
+            return self.db.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def signatures(self, texts) -> np.ndarray:
+        """MinHash signatures of a batch of texts
+
+        Args:
+            texts (list[str]): texts
+
+        Returns:
+            np.ndarray: (len(texts), num_perm) uint32 signatures, rows of a text
+            without words are all 0xFFFFFFFF
+        """
+        shingles = [shingle_hashes(text, self.shingle_size) for text in texts]
+        signatures = np.full((len(shingles), self.num_perm), np.iinfo(np.uint32).max, dtype=np.uint32)
+        filled = [index for index, hashes in enumerate(shingles) if len(hashes)]
+        if not filled:
+            return signatures
+        # Texts are hashed in chunks of about SIGNATURE_CHUNK shingles through
+        # one (num_perm, shingles) buffer that stays in cache, which is several
+        # times faster than allocating the matrix of the whole batch
+        chunks, chunk, size = [], [], 0
+        for index in filled:
+            if chunk and size + len(shingles[index]) > self.SIGNATURE_CHUNK:
+                chunks.append(chunk)
+                chunk, size = [], 0
+            chunk.append(index)
+            size += len(shingles[index])
+        chunks.append(chunk)
+        buffer = np.empty(
+            (self.num_perm, max(sum(len(shingles[index]) for index in chunk) for chunk in chunks)), dtype=np.uint64
+        )
+        for chunk in chunks:
+            values = np.concatenate([shingles[index] for index in chunk])
+            permuted = buffer[:, :len(values)]
+            np.multiply(values, self._multipliers[:, None], out=permuted)
+            permuted += self._increments[:, None]
+            permuted >>= np.uint64(32)
+            offsets = np.cumsum([0] + [len(shingles[index]) for index in chunk[:-1]])
+            signatures[chunk] = np.minimum.reduceat(permuted, offsets, axis=1).T
+        return signatures
+
+    def bucket_keys(self, signatures: np.ndarray) -> np.ndarray:
+        """LSH bucket key of every band of signatures
+
+        Returns:
+            np.ndarray: (len(signatures), bands) int64 keys
+        """
+        bands = signatures.reshape(len(signatures), self.bands, self.rows).astype(np.uint64)
+        keys = (bands * self._band_multipliers).sum(axis=2, dtype=np.uint64)
+        # Keys of different bands never collide on equal rows
+        keys += np.arange(self.bands, dtype=np.uint64) * np.uint64(0x9E3779B97F4A7C15)
+        return keys.view(np.int64)
+
+    @staticmethod
+    def is_empty(signature: np.ndarray) -> bool:
+        return bool((signature == np.iinfo(np.uint32).max).all())
+
+    def find(self, signature: np.ndarray, url=None, keys=None) -> tuple:
+        """Return the indexed article most similar to a signature
+
+        Args:
+            signature (np.ndarray): signature of the article
+            url (str, optional): URL of the article, never its own duplicate. Defaults to None.
+            keys (np.ndarray, optional): bucket keys of the signature. Defaults to None.
+
+        Returns:
+            tuple: (url, similarity) of the duplicate, None when there is none
+        """
+        if self.is_empty(signature):
+            return None
+        if keys is None:
+            keys = self.bucket_keys(signature[None])[0]
+        rows = self.candidates(keys, url)
+        if not rows:
+            return None
+        candidates = np.frombuffer(b"".join(row[1] for row in rows), dtype=np.uint32).reshape(len(rows), -1)
+        similarities = (candidates == signature).mean(axis=1)
+        best = int(similarities.argmax())
+        if similarities[best] < self.threshold:
+            return None
+        return rows[best][0], float(similarities[best])
+
+    def candidates(self, keys: np.ndarray, url=None) -> list:
+        """Indexed articles sharing a bucket with the keys of a signature
+
+        Popular buckets can hold many articles, at most ``max_candidates``
+        are returned, the ones sharing the most bands first.
+
+        Args:
+            keys (np.ndarray): bucket keys of the signature
+            url (str, optional): URL of the article, left out. Defaults to None.
+
+        Returns:
+            list: (url, signature bytes) of the candidates
+        """
+        keys = keys.tolist()
+        rows = self.db.execute(
+            "SELECT url, signature FROM documents JOIN ("
+            " SELECT document_id, COUNT(*) AS shared FROM buckets"
+            f" WHERE key IN ({','.join('?' * len(keys))}) GROUP BY document_id"
+            " ORDER BY shared DESC LIMIT ?"
+            ") ON id = document_id ORDER BY shared DESC",
+            keys + [self.max_candidates + 1],
+        ).fetchall()
+        return [row for row in rows if url is None or row[0] != url][:self.max_candidates]
+
+    def add(self, url, signature: np.ndarray, keys=None):
+        """Index an article, replacing the entry of the same URL
+
+        Args:
+            url (str): URL of the article
+            signature (np.ndarray): signature of the article
+            keys (np.ndarray, optional): bucket keys of the signature. Defaults to None.
+        """
+        if self.is_empty(signature):
+            return
+        if keys is None:
+            keys = self.bucket_keys(signature[None])[0]
+        if url is not None:
+            self._delete("SELECT id FROM documents WHERE url = ?", (url,))
+        cursor = self.db.execute(
+            "INSERT INTO documents (url, signature, added_at) VALUES (?, ?, ?)",
+            (url, signature.astype(np.uint32).tobytes(), time.time()),
+        )
+        self.db.executemany(
+            "INSERT OR IGNORE INTO buckets (key, document_id) VALUES (?, ?)",
+            [(key, cursor.lastrowid) for key in keys.tolist()],
+        )
+        self.pending += 1
+        if self.pending >= 1000:
+            self.commit()
+
+    def check_many(self, documents) -> list:
+        """Find the duplicates of a batch of articles and index the others
+
+        An article is compared with the index and with the articles before it
+        in the batch.
+
+        Args:
+            documents (list[tuple]): (url, text) of the articles
+
+        Returns:
+            list: (url, similarity) of the duplicate of every article, None
+            for articles that were indexed
+        """
+        documents = list(documents)
+        signatures = self.signatures([text for _, text in documents])
+        keys = self.bucket_keys(signatures)
+        results = []
+        with self._lock:
+            for (url, _), signature, signature_keys in zip(documents, signatures, keys):
+                duplicate = self.find(signature, url, signature_keys)
+                if duplicate is None:
+                    self.add(url, signature, signature_keys)
+                results.append(duplicate)
+        return results
+
+    def _delete(self, query, parameters=()):
+        ids = [(document_id,) for (document_id,) in self.db.execute(query, parameters)]
+        self.db.executemany("DELETE FROM buckets WHERE document_id = ?", ids)
+        self.db.executemany("DELETE FROM documents WHERE id = ?", ids)
+
+    def commit(self):
+        with self._lock:
+            self.db.commit()
+            self.pending = 0
+
+    def compact(self):
+        """Evict expired entries and trim to max_entries"""
+        with self._lock:
+            if self.ttl:
+                self._delete("SELECT id FROM documents WHERE added_at < ?", (time.time() - self.ttl,))
+            if self.max_entries:
+                self._delete("SELECT id FROM documents ORDER BY id DESC LIMIT -1 OFFSET ?", (self.max_entries,))
+            self.db.commit()
+
+    def close(self):
+        with self._lock:
+            self.db.commit()
+            self.db.close()
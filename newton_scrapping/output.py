@@ -0,0 +1,292 @@
+"""Batched, rotating JSONL.gz and Parquet writers running on a background thread"""
+
+import base64
+import gzip
+import itertools
+import json
+import os
+import queue
+import threading
+import time
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+OUTPUT_FORMATS = ("jsonl.gz", "parquet")
+
+_writers = {}
+_writers_lock = threading.Lock()
+# Numbers the files of every writer of the process, so they never share a name
+_file_sequence = itertools.count(1)
+
+
+def _json_default(value):
+    # Compressed raw_response content
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return base64.b64encode(bytes(value)).decode("ascii")
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def encode_record(record: dict) -> str:
+    return json.dumps(record, ensure_ascii=False, default=_json_default)
+
+
+class BulkWriter:
+    """
+    Writes records in batches to rotating files from a background thread.
+    ...
+
+    ``write()`` only appends to a buffer, full batches are handed to a writer
+    thread through a bounded queue so the reactor never waits on compression
+    or disk unless the thread falls behind. A file is written under a hidden
+    ".part" name and renamed once it is complete, after ``rotate_bytes`` of
+    records or ``rotate_seconds``, so readers of the directory only ever see
+    whole files.
+
+    "jsonl.gz" writes one JSON object per line. "parquet" (requires pyarrow)
+    writes one row group per batch with a column per top-level key, typed
+    from its values (dicts as struct and lists as list columns, a column with
+    values of different types as JSON strings); a batch that doesn't fit the
+    schema of the current file starts a new file.
+
+    Attributes
+    ----------
+    directory : str
+        output directory
+    format : str
+        "jsonl.gz" or "parquet"
+    files : list
+        completed files
+    records : int
+        records written
+
+    Methods
+    -------
+    get(directory, format, **options)
+        Returns the writer of the directory shared by the process
+    write(record)
+        Buffers a record
+    flush()
+        Hands the buffered records to the writer thread
+    close()
+        Writes the remaining records and completes the current file
+    """
+
+    def __init__(self, directory, format="jsonl.gz", batch_size=1000, rotate_bytes=256 * 1024 * 1024,
+                 rotate_seconds=3600, flush_seconds=5, compression_level=6, prefix="items"):
+        """
+        Args:
+            directory (str): output directory, created when missing
+            format (str, optional): "jsonl.gz" or "parquet". Defaults to "jsonl.gz".
+            batch_size (int, optional): records per batch. Defaults to 1000.
+            rotate_bytes (int, optional): uncompressed bytes per file. Defaults to 256 MiB.
+            rotate_seconds (float, optional): seconds before a file is completed. Defaults to 3600.
+            flush_seconds (float, optional): seconds after which the next write hands
+                over a partial batch. Defaults to 5.
+            compression_level (int, optional): gzip level. Defaults to 6.
+            prefix (str, optional): file name prefix. Defaults to "items".
+        """
+        if format not in OUTPUT_FORMATS:
+            raise ValueError(f"Unknown output format: {format}")
+        if format == "parquet" and pyarrow is None:
+            raise ImportError("parquet output requires the pyarrow package")
+        self.directory = os.path.abspath(directory)
+        self.format = format
+        self.batch_size = batch_size
+        self.rotate_bytes = rotate_bytes
+        self.rotate_seconds = rotate_seconds
+        self.flush_seconds = flush_seconds
+        self.compression_level = compression_level
+        self.prefix = prefix
+        self.files = []
+        self.records = 0
+        self.references = 0
+        self._buffer = []
+        self._buffered_at = None
+        self._current = None
+        self._error = None
+        os.makedirs(self.directory, exist_ok=True)
+        self._batches = queue.Queue(maxsize=4)
+        self._thread = threading.Thread(target=self._run, name="bulk-writer", daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def get(cls, directory, format="jsonl.gz", **options) -> "BulkWriter":
+        """Return the writer of a directory, shared by all the spiders of the process
+
+        Every get() must be matched by a release(), the writer is closed by
+        the last one.
+        """
+        key = (os.path.abspath(directory), format)
+        with _writers_lock:
+            writer = _writers.get(key)
+            if writer is None:
+                writer = _writers[key] = cls(directory, format, **options)
+            writer.references += 1
+            return writer
+
+    def release(self):
+        with _writers_lock:
+            self.references -= 1
+            if self.references > 0:
+                return
+            _writers.pop((self.directory, self.format), None)
+        self.close()
+
+    def write(self, record: dict):
+        if self._error is not None:
+            raise self._error
+        if not self._buffer:
+            self._buffered_at = time.monotonic()
+        self._buffer.append(record)
+        if len(self._buffer) >= self.batch_size or time.monotonic() - self._buffered_at >= self.flush_seconds:
+            self.flush()
+
+    def flush(self):
+        if self._error is not None:
+            raise self._error
+        if self._buffer:
+            batch, self._buffer = self._buffer, []
+            self._batches.put(batch)
+
+    def close(self) -> list:
+        """Write the remaining records, complete the current file and stop the thread
+
+        Returns:
+            list: the completed files
+        """
+        if self._thread.is_alive():
+            self.flush()
+            self._batches.put(None)
+            self._thread.join()
+        if self._error is not None:
+            raise self._error
+        return self.files
+
+    def _run(self):
+        while True:
+            try:
+                batch = self._batches.get(timeout=1)
+            except queue.Empty:
+                batch = ()
+            try:
+                if batch is None:
+                    self._complete()
+                    return
+                if self._current is not None and time.monotonic() - self._current["opened_at"] >= self.rotate_seconds:
+                    self._complete()
+                if batch:
+                    self._write_batch(batch)
+            except Exception as exception:
+                self._error = exception
+                self._discard()
+                return
+
+    def _open(self, schema=None):
+        sequence = next(_file_sequence)
+        name = f"{self.prefix}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{sequence:05d}.{self.format}"
+        path = os.path.join(self.directory, name)
+        part_path = os.path.join(self.directory, f".{name}.part")
+        if self.format == "jsonl.gz":
+            handle = gzip.open(part_path, "wt", encoding="utf-8", compresslevel=self.compression_level)
+        else:
+            handle = None
+        self._current = {
+            "path": path, "part_path": part_path, "handle": handle, "schema": schema,
+            "bytes": 0, "opened_at": time.monotonic(),
+        }
+
+    def _write_batch(self, batch):
+        if self.format == "jsonl.gz":
+            if self._current is None:
+                self._open()
+            lines = "".join(encode_record(record) + "\n" for record in batch)
+            self._current["handle"].write(lines)
+            self._current["bytes"] += len(lines)
+        else:
+            schema = self._current["schema"] if self._current is not None else None
+            table = _parquet_table(batch, schema)
+            if schema is not None and not table.schema.equals(schema):
+                self._complete()
+            if self._current is None:
+                self._open(table.schema)
+            if self._current["handle"] is None:
+                self._current["handle"] = pyarrow.parquet.ParquetWriter(self._current["part_path"], table.schema)
+            self._current["handle"].write_table(table)
+            self._current["bytes"] += table.nbytes
+        self.records += len(batch)
+        if self._current["bytes"] >= self.rotate_bytes:
+            self._complete()
+
+    def _complete(self):
+        if self._current is None:
+            return
+        current, self._current = self._current, None
+        if current["handle"] is not None:
+            current["handle"].close()
+            os.replace(current["part_path"], current["path"])
+            self.files.append(current["path"])
+
+    def _discard(self):
+        if self._current is not None:
+            try:
+                if self._current["handle"] is not None:
+                    self._current["handle"].close()
+                os.remove(self._current["part_path"])
+            except OSError:
+                pass
+            self._current = None
+
+
+def _json_value(value):
+    return value if value is None or isinstance(value, str) else encode_record(value)
+
+
+def _parquet_array(values, type=None):
+    if type == pyarrow.string():
+        return pyarrow.array([_json_value(value) for value in values], pyarrow.string())
+    try:
+        array = pyarrow.array(values)
+    except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError, TypeError, ValueError):
+        # Values of different types, kept as JSON
+        array = None
+    # Parquet can't store a struct without fields like the type of {}, unless
+    # it is cast to the type of the file
+    if array is None or (type is None and _has_empty_struct(array.type)):
+        return pyarrow.array([_json_value(value) for value in values], pyarrow.string())
+    return array
+
+
+def _has_empty_struct(type) -> bool:
+    if pyarrow.types.is_struct(type):
+        return type.num_fields == 0 or any(_has_empty_struct(field.type) for field in type)
+    if pyarrow.types.is_list(type) or pyarrow.types.is_large_list(type):
+        return _has_empty_struct(type.value_type)
+    return False
+
+
+def _parquet_table(batch, schema=None):
+    """Table of a batch with a column per top-level key and the types inferred from its values
+
+    The batch is given the schema of the file being written when it fits in
+    it (the same or fewer columns, values of the same types or null),
+    otherwise it gets its own schema and starts a new file.
+    """
+    columns = list(dict.fromkeys(key for record in batch for key in record))
+    if schema is not None and set(columns) <= set(schema.names):
+        table = pyarrow.table({
+            field.name: _parquet_array([record.get(field.name) for record in batch], field.type)
+            for field in schema
+        })
+        try:
+            # Struct fields are matched by name, a field the file doesn't have would be dropped
+            if pyarrow.unify_schemas([schema, table.schema], promote_options="permissive").equals(schema):
+                return table.cast(schema)
+        except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError, pyarrow.ArrowNotImplementedError):
+            pass
+    return pyarrow.table({
+        column: _parquet_array([record.get(column) for record in batch]) for column in columns
+    })
@@ -6,8 +6,247 @@
 
 # useful for handling different item types with a single interface
 from itemadapter import ItemAdapter
+from scrapy.exceptions import DropItem, NotConfigured
+from twisted.python.failure import Failure
+
+from newton_scrapping.memory import memory_pressure
+from newton_scrapping.near_duplicates import NearDuplicateIndex, article_text, article_url
+from newton_scrapping.output import BulkWriter
+from newton_scrapping.utils import (RAW_RESPONSE_STORAGES, compress_content,
+                                    spill_content)
 
 
 class NewtonScrappingPipeline:
     def process_item(self, item, spider):
         return item
+
+
+class NearDuplicatePipeline:
+    """Tag or drop articles that are near-duplicates of an earlier article
+
+    Syndicated stories are republished under many URLs with small edits. The
+    title and text of every article are looked up in the NearDuplicateIndex
+    of NEWTON_NEAR_DUPLICATE_INDEX, which keeps them between crawls. With
+    NEWTON_NEAR_DUPLICATE_ACTION "tag" duplicates get a "near_duplicate"
+    entry with the "url" of the first article and their "similarity", with
+    "drop" they are dropped. Only the first article of a story is indexed.
+
+    Articles are buffered and checked in batches of
+    NEWTON_NEAR_DUPLICATE_BATCH_SIZE on a thread of the reactor pool, so
+    their signatures are computed together and the sqlite queries don't
+    block the reactor. A batch that isn't full is checked after
+    ``batch_delay`` seconds.
+    """
+
+    ACTIONS = ("tag", "drop")
+
+    def __init__(self, index, action="tag", stats=None, batch_size=64, batch_delay=0.1, clock=None):
+        if action not in self.ACTIONS:
+            raise ValueError(f"Unknown near-duplicate action: {action}")
+        self.index = index
+        self.action = action
+        self.stats = stats
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self.clock = clock
+        # (item, adapter, deferred) of the articles waiting for their batch
+        self._batch = []
+        self._flush_call = None
+        self._running = set()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.get("NEWTON_NEAR_DUPLICATE_INDEX"):
+            raise NotConfigured
+        return cls(
+            NearDuplicateIndex.from_settings(crawler.settings),
+            crawler.settings.get("NEWTON_NEAR_DUPLICATE_ACTION", "tag"),
+            crawler.stats,
+            batch_size=crawler.settings.getint("NEWTON_NEAR_DUPLICATE_BATCH_SIZE", 64),
+        )
+
+    def get_clock(self):
+        if self.clock is None:
+            # Imported late so importing this module doesn't install a reactor
+            from twisted.internet import reactor
+
+            self.clock = reactor
+        return self.clock
+
+    def process_item(self, item, spider):
+        from twisted.internet.defer import Deferred
+
+        adapter = ItemAdapter(item)
+        if "parsed_data" not in adapter:
+            return item
+        deferred = Deferred()
+        self._batch.append((item, adapter, deferred))
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+        elif self._flush_call is None:
+            self._flush_call = self.get_clock().callLater(self.batch_delay, self.flush)
+        return deferred
+
+    def flush(self):
+        """Check the buffered articles on a thread, their deferreds fire with the result"""
+        from twisted.internet import threads
+
+        if self._flush_call is not None and self._flush_call.active():
+            self._flush_call.cancel()
+        self._flush_call = None
+        batch, self._batch = self._batch, []
+        if not batch:
+            return
+        documents = [(article_url(adapter), article_text(adapter)) for _, adapter, _ in batch]
+        running = threads.deferToThread(self.index.check_many, documents)
+        self._running.add(running)
+        running.addBoth(self._batch_checked, batch, running)
+
+    def _batch_checked(self, duplicates, batch, running):
+        self._running.discard(running)
+        for index, (item, adapter, deferred) in enumerate(batch):
+            if isinstance(duplicates, Failure):
+                deferred.errback(duplicates)
+                continue
+            try:
+                result = self._apply(item, adapter, duplicates[index])
+            except DropItem:
+                deferred.errback()
+            else:
+                deferred.callback(result)
+
+    def _apply(self, item, adapter, duplicate):
+        if duplicate is None:
+            self._inc_stat("near_duplicates/unique")
+            return item
+        self._inc_stat("near_duplicates/duplicate")
+        if self.action == "drop":
+            raise DropItem(f"Near-duplicate of {duplicate[0]}")
+        adapter["near_duplicate"] = {"url": duplicate[0], "similarity": round(duplicate[1], 4)}
+        return item
+
+    def _inc_stat(self, key):
+        if self.stats is not None:
+            self.stats.inc_value(key)
+
+    def close_spider(self, spider):
+        from twisted.internet.defer import DeferredList
+
+        self.flush()
+        if not self._running:
+            self.index.release()
+            return None
+        # The index is released once the batches still running are checked
+        running = DeferredList(list(self._running), consumeErrors=True)
+        return running.addBoth(lambda _: self.index.release())
+
+
+class RawResponsePipeline:
+    """Change how the page HTML in raw_response is delivered
+
+    NEWTON_RAW_RESPONSE_STORAGE selects one of:
+    "inline" leaves the content as it is,
+    "gzip"/"zstd" replace it with compressed bytes and a "content_encoding",
+    "spill" writes it to a content addressed file under NEWTON_RAW_RESPONSE_DIR
+    and keeps "content_path"/"content_sha256" references,
+    "omit" drops it.
+    utils.get_raw_content() reads the content back from any of them.
+    """
+
+    def __init__(self, storage="inline", directory="raw_responses"):
+        if storage not in RAW_RESPONSE_STORAGES:
+            raise ValueError(f"Unknown raw_response storage: {storage}")
+        if storage == "zstd":
+            compress_content("", "zstd")
+        self.storage = storage
+        self.directory = directory
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(
+            crawler.settings.get("NEWTON_RAW_RESPONSE_STORAGE", "inline"),
+            crawler.settings.get("NEWTON_RAW_RESPONSE_DIR", "raw_responses"),
+        )
+
+    def process_item(self, item, spider):
+        raw_response = ItemAdapter(item).get("raw_response")
+        if self.storage == "inline" or not raw_response or not isinstance(raw_response.get("content"), str):
+            return item
+        # Update in place, spiders may hold the same dict in their own results
+        content = raw_response.pop("content")
+        if self.storage in ("gzip", "zstd"):
+            raw_response["content"] = compress_content(content, self.storage)
+            raw_response["content_encoding"] = self.storage
+        elif self.storage == "spill":
+            raw_response.update(spill_content(content, self.directory))
+        return item
+
+
+class BulkOutputPipeline:
+    """Write the items to rotating JSONL.gz or Parquet files
+
+    Items are batched and written by a BulkWriter on a background thread,
+    shared by all the spiders of the process, so an "articles" crawl fills
+    the same files. NEWTON_OUTPUT_DIR and NEWTON_OUTPUT_FORMAT ("jsonl.gz" or
+    "parquet") select the files, NEWTON_OUTPUT_BATCH_SIZE,
+    NEWTON_OUTPUT_ROTATE_BYTES and NEWTON_OUTPUT_ROTATE_SECONDS the batching
+    and rotation. The batch being filled is handed to the writer thread
+    early when the MemoryWatchdog reports memory pressure. The completed
+    files are listed in the crawler's ``newton_output_files``.
+    """
+
+    def __init__(self, directory, format="jsonl.gz", crawler=None, **options):
+        self.directory = directory
+        self.format = format
+        self.crawler = crawler
+        self.options = options
+        self.writer = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        pipeline = cls.from_settings(crawler.settings, crawler)
+        if crawler.settings.getfloat("NEWTON_MEMORY_LIMIT_MB"):
+            crawler.signals.connect(pipeline.memory_pressure, signal=memory_pressure)
+        return pipeline
+
+    @classmethod
+    def from_settings(cls, settings, crawler=None):
+        return cls(
+            settings.get("NEWTON_OUTPUT_DIR", "output"),
+            settings.get("NEWTON_OUTPUT_FORMAT", "jsonl.gz"),
+            crawler,
+            batch_size=settings.getint("NEWTON_OUTPUT_BATCH_SIZE", 1000),
+            rotate_bytes=settings.getint("NEWTON_OUTPUT_ROTATE_BYTES", 256 * 1024 * 1024),
+            rotate_seconds=settings.getfloat("NEWTON_OUTPUT_ROTATE_SECONDS", 3600),
+        )
+
+    @classmethod
+    def write_items(cls, crawler, items):
+        """Write items that didn't go through the pipelines, like the data a
+        spider passes to its callback instead of yielding it"""
+        # Not connected to memory_pressure, the items are all written at once
+        pipeline = cls.from_settings(crawler.settings, crawler)
+        pipeline.open_spider(None)
+        for item in items:
+            pipeline.process_item(item, None)
+        pipeline.close_spider(None)
+
+    def open_spider(self, spider):
+        self.writer = BulkWriter.get(self.directory, self.format, **self.options)
+
+    def process_item(self, item, spider):
+        self.writer.write(ItemAdapter(item).asdict())
+        return item
+
+    def memory_pressure(self, rss):
+        if self.writer is not None:
+            self.writer.flush()
+
+    def close_spider(self, spider):
+        writer, self.writer = self.writer, None
+        writer.flush()
+        writer.release()
+        if self.crawler is not None:
+            # Files completed so far, the last spider of the process completes the last one
+            files = getattr(self.crawler, "newton_output_files", [])
+            self.crawler.newton_output_files = list(dict.fromkeys(files + writer.files))
@@ -0,0 +1,331 @@
+"""Pool of long-lived crawler worker processes"""
+
+import itertools
+import logging
+import os
+import pickle
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+import multiprocessing
+from multiprocessing.connection import wait
+
+from newton_scrapping.utils import get_rss_bytes
+
+logger = logging.getLogger(__name__)
+
+_DONE = "done"
+_FAILED = "failed"
+
+
+class CrawlerPool:
+    """
+    A pool of persistent worker processes that run crawler queries.
+    ...
+
+    Every worker installs the twisted reactor and imports scrapy once, then
+    keeps the reactor running and takes queries one at a time through a pipe
+    of its own. Jobs are assigned to idle workers by the pool, so the job of
+    a worker that dies is failed with its exit code, and workers share no
+    lock a killed worker could keep. A worker is recycled after
+    ``max_jobs_per_worker`` jobs or when its resident memory grows above
+    ``max_rss_mb``.
+
+    Attributes
+    ----------
+    size : int
+        number of worker processes
+    max_jobs_per_worker : int
+        number of jobs after which a worker is replaced
+    max_rss_mb : int
+        resident memory in MB after which a worker is replaced
+
+    Methods
+    -------
+    submit(query, proxies)
+        Queues a query and returns a Future for its data and report
+    close(timeout)
+        Stops the workers once their jobs are done
+    """
+
+    def __init__(self, size=2, max_jobs_per_worker=100, max_rss_mb=None, context=None):
+        """
+        Args:
+            size (int, optional): number of worker processes. Defaults to 2.
+            max_jobs_per_worker (int, optional): recycle a worker after this many
+                jobs, None to never recycle on job count. Defaults to 100.
+            max_rss_mb (int, optional): recycle a worker once its RSS is above
+                this many MB, None to disable. Defaults to None.
+            context (str, optional): multiprocessing start method. Defaults to None.
+        """
+        if size < 1:
+            raise ValueError("size must be at least 1")
+        self.size = size
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self.max_rss_mb = max_rss_mb
+        self._context = multiprocessing.get_context(context)
+        if self._context.get_start_method() == "forkserver":
+            from newton_scrapping.main import Crawler
+
+            # Recycled workers start with scrapy and the spiders imported
+            self._context.set_forkserver_preload(Crawler().get_preload_modules())
+        self._job_ids = itertools.count()
+        self._futures = {}
+        self._pending = deque()
+        self._workers = []
+        # Pipe, job running and idle workers by pid
+        self._conns = {}
+        self._running = {}
+        self._idle = deque()
+        self._lock = threading.Lock()
+        self._closed = False
+        with self._lock:
+            for _ in range(size):
+                self._spawn_worker()
+        self._dispatcher = threading.Thread(
+            target=self._dispatch, name="CrawlerPoolDispatcher", daemon=True
+        )
+        self._dispatcher.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def submit(self, query, proxies={}, **options) -> Future:
+        """Queue a query on the pool
+
+        Args:
+            query (dict): query as accepted by Crawler
+            proxies (dict, optional): proxies as accepted by Crawler. Defaults to {}.
+            **options: other keyword arguments of Crawler
+
+        Returns:
+            Future: resolves to the crawled data, its ``report`` attribute is
+            then the report of the crawl (see Crawler.get_report())
+        """
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("CrawlerPool is closed")
+            job_id = next(self._job_ids)
+            self._futures[job_id] = future
+            # The deadline of a job counts from its submission
+            self._pending.append((job_id, query, proxies, options, time.time()))
+            self._assign()
+        return future
+
+    def close(self, timeout=10):
+        """Stop the workers once their running jobs are done
+
+        Jobs not started yet fail, so do the jobs of the workers still
+        running after the timeout, which are terminated.
+
+        Args:
+            timeout (int, optional): seconds to wait for every worker. Defaults to 10.
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            pending, self._pending = self._pending, deque()
+            workers = list(self._workers)
+            for worker in workers:
+                self._send(worker.pid, None)
+        self._fail([job[0] for job in pending], "CrawlerPool closed before the job started")
+        for worker in workers:
+            worker.join(timeout)
+            if worker.is_alive():
+                worker.terminate()
+                worker.join()
+        # The dispatcher handles the results the workers sent before exiting
+        self._dispatcher.join(timeout)
+        with self._lock:
+            job_ids = list(self._futures)
+        self._fail(job_ids, "CrawlerPool closed before the job finished")
+
+    def _spawn_worker(self):
+        conn, child_conn = self._context.Pipe()
+        worker = self._context.Process(
+            target=_worker_main,
+            args=(child_conn, self.max_jobs_per_worker, self.max_rss_mb),
+            daemon=True,
+        )
+        worker.start()
+        child_conn.close()
+        self._workers.append(worker)
+        self._conns[worker.pid] = conn
+        self._idle.append(worker.pid)
+
+    def _send(self, pid, job) -> bool:
+        try:
+            self._conns[pid].send(job)
+        except (OSError, ValueError):
+            # The worker died, it's reaped by the dispatcher
+            return False
+        return True
+
+    def _assign(self):
+        # Called with the lock held
+        while self._pending and self._idle:
+            job = self._pending.popleft()
+            if self._futures[job[0]].cancelled():
+                # Given up by the caller, like at its deadline
+                self._futures.pop(job[0])
+                continue
+            pid = self._idle.popleft()
+            self._running[pid] = job[0]
+            if not self._send(pid, job):
+                # Failed with the exit code of the worker
+                return
+
+    def _fail(self, job_ids, message):
+        for job_id in job_ids:
+            self._resolve(job_id, _FAILED, message)
+
+    def _resolve(self, job_id, status, payload):
+        with self._lock:
+            future = self._futures.pop(job_id, None)
+        if future is None or future.done():
+            return
+        if status == _DONE:
+            data, future.report = payload
+            future.set_result(data)
+        else:
+            future.set_exception(Exception(payload))
+
+    def _dispatch(self):
+        while True:
+            with self._lock:
+                workers = list(self._workers)
+            if not workers:
+                return
+            conns = {self._conns[worker.pid]: worker for worker in workers}
+            ready = wait(list(conns) + [worker.sentinel for worker in workers], timeout=0.5)
+            for conn in ready:
+                if conn in conns:
+                    self._receive(conns[conn])
+            for worker in workers:
+                if worker.sentinel in ready:
+                    self._reap(worker)
+
+    def _receive(self, worker) -> bool:
+        try:
+            job_id, status, payload, retiring = self._conns[worker.pid].recv()
+        except (EOFError, OSError):
+            return False
+        with self._lock:
+            self._running.pop(worker.pid, None)
+            if not retiring and not self._closed:
+                self._idle.append(worker.pid)
+                self._assign()
+        self._resolve(job_id, status, payload)
+        return True
+
+    def _reap(self, worker):
+        # A recycled worker sends its last result before exiting, handle it first
+        conn = self._conns[worker.pid]
+        while conn.poll() and self._receive(worker):
+            pass
+        worker.join()
+        conn.close()
+        with self._lock:
+            self._workers.remove(worker)
+            del self._conns[worker.pid]
+            if worker.pid in self._idle:
+                self._idle.remove(worker.pid)
+            job_id = self._running.pop(worker.pid, None)
+            if not self._closed:
+                self._spawn_worker()
+                self._assign()
+        if job_id is not None:
+            self._fail([job_id], f"Crawler worker {worker.pid} exited with code {worker.exitcode}")
+
+
+def _worker_main(conn, max_jobs, max_rss_mb):
+    """Entry point of a worker process, runs jobs until recycled"""
+    from scrapy.crawler import CrawlerRunner
+    from scrapy.settings import Settings
+    from scrapy.utils.log import configure_logging
+    from scrapy.utils.reactor import install_reactor
+
+    reactor_class = Settings().get("TWISTED_REACTOR")
+    if reactor_class:
+        install_reactor(reactor_class)
+    from twisted.internet import reactor
+
+    from newton_scrapping.main import Crawler
+
+    configure_logging()
+    pid = os.getpid()
+
+    def run_job(job_id, query, proxies, options, submitted_at, result, done):
+        output = []
+        deadline_calls = []
+
+        def finished(_):
+            for call in deadline_calls:
+                if call.active():
+                    call.cancel()
+            data = crawler.get_output_files() if crawler.output else (output[0] if output else [])
+            result.append((job_id, _DONE, (data, crawler.get_report())))
+
+        def failed(failure):
+            result.append((job_id, _FAILED, failure.getErrorMessage()))
+
+        try:
+            crawler = Crawler(query=query, proxies=proxies, **options)
+            if crawler.deadline is not None:
+                crawler.deadline_at = submitted_at + crawler.deadline
+            runner = CrawlerRunner(crawler.get_settings())
+            if crawler.output:
+                # The items are only kept by BulkOutputPipeline
+                deferred = crawler.schedule(runner, lambda item: None, stream=True)
+            else:
+                deferred = crawler.schedule(runner, output.append)
+        except Exception as exception:
+            result.append((job_id, _FAILED, str(exception)))
+            done.set()
+            return
+        if crawler.deadline_at is not None:
+            # Like Crawler.run_process(), without stopping the reactor shared by the jobs
+            delay = crawler.deadline_at - crawler._deadline_grace() - time.time()
+            deadline_calls.append(reactor.callLater(max(0.0, delay), crawler.close_spiders, "deadline"))
+        deferred.addCallbacks(finished, failed)
+        deferred.addBoth(lambda _: done.set())
+
+    def serve():
+        jobs_done = 0
+        while True:
+            try:
+                job = conn.recv()
+            except (EOFError, OSError):
+                # The pool is gone
+                break
+            if job is None:
+                break
+            result = []
+            done = threading.Event()
+            reactor.callFromThread(run_job, *job, result, done)
+            done.wait()
+            jobs_done += 1
+            retiring = False
+            if max_jobs and jobs_done >= max_jobs:
+                logger.info("Recycling crawler worker %s after %s jobs", pid, jobs_done)
+                retiring = True
+            elif max_rss_mb and get_rss_bytes() > max_rss_mb * 1024 * 1024:
+                logger.info("Recycling crawler worker %s above %s MB RSS", pid, max_rss_mb)
+                retiring = True
+            job_id, status, payload = result[0]
+            try:
+                conn.send((job_id, status, payload, retiring))
+            except (TypeError, AttributeError, pickle.PicklingError) as exception:
+                conn.send((job_id, _FAILED, f"Result can't be sent to the pool: {exception}", retiring))
+            if retiring:
+                break
+        reactor.callFromThread(reactor.stop)
+
+    reactor.callWhenRunning(threading.Thread(target=serve, daemon=True).start)
+    reactor.run(installSignalHandlers=False)
@@ -0,0 +1,122 @@
+"""CPU and memory profiling of a crawler process"""
+
+import cProfile
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+PROFILE_MODES = ("cprofile", "sampling")
+
+
+class CrawlProfiler:
+    """
+    Profiles the process it is started in and writes the artifacts to a directory.
+    ...
+
+    "cprofile" traces every call with cProfile and writes a .pstats file (open
+    it with pstats or snakeviz). "sampling" walks the main thread's stack every
+    ``interval`` seconds from a background thread and writes the stacks in
+    the collapsed format of flamegraph.pl/speedscope, its overhead does not
+    grow with the number of calls. With ``memory`` tracemalloc runs as well
+    and the ``top`` allocation sites are written to a text file.
+
+    Attributes
+    ----------
+    directory : str
+        directory of the artifacts
+    mode : str
+        "cprofile" or "sampling"
+    memory : bool
+        whether allocations are traced
+    files : dict
+        paths of the artifacts written by stop()
+
+    Methods
+    -------
+    start()
+        Starts profiling
+    stop()
+        Stops profiling and writes the artifacts
+    """
+
+    def __init__(self, directory, mode="cprofile", memory=False, interval=0.005, top=50):
+        """
+        Args:
+            directory (str): directory of the artifacts, created when missing
+            mode (str, optional): "cprofile" or "sampling". Defaults to "cprofile".
+            memory (bool, optional): trace allocations with tracemalloc. Defaults to False.
+            interval (float, optional): seconds between samples. Defaults to 0.005.
+            top (int, optional): number of allocation sites written. Defaults to 50.
+        """
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Unknown profile mode: {mode}")
+        self.directory = os.path.abspath(directory)
+        self.mode = mode
+        self.memory = memory
+        self.interval = interval
+        self.top = top
+        self.files = {}
+        self.prefix = os.path.join(self.directory, f"crawl-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}")
+        self._profile = None
+        self._samples = Counter()
+        self._sampler = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        if self.memory:
+            tracemalloc.start(25)
+        if self.mode == "cprofile":
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        else:
+            self._sampler = threading.Thread(
+                target=self._sample, args=(threading.get_ident(),), name="crawl-profiler", daemon=True
+            )
+            self._sampler.start()
+
+    def _sample(self, thread_id):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self._samples[";".join(reversed(stack))] += 1
+
+    def stop(self) -> dict:
+        """Stop profiling and write the artifacts
+
+        Returns:
+            dict: paths of the "pstats" or "collapsed" file and of the
+            "allocations" file when memory is traced
+        """
+        if self._profile is not None:
+            self._profile.disable()
+            self.files["pstats"] = self.prefix + ".pstats"
+            self._profile.dump_stats(self.files["pstats"])
+        if self._sampler is not None:
+            self._stopped.set()
+            self._sampler.join()
+            self.files["collapsed"] = self.prefix + ".collapsed"
+            with open(self.files["collapsed"], "w") as f:
+                for stack, count in self._samples.most_common():
+                    f.write(f"{stack} {count}\n")
+        if self.memory and tracemalloc.is_tracing():
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            self.files["allocations"] = self.prefix + ".allocations.txt"
+            with open(self.files["allocations"], "w") as f:
+                f.write(f"current: {current / 1024:.1f} KiB, peak: {peak / 1024:.1f} KiB\n\n")
+                for stat in snapshot.statistics("traceback")[:self.top]:
+                    f.write(f"{stat.size / 1024:.1f} KiB in {stat.count} blocks\n")
+                    for line in stat.traceback.format(most_recent_first=True)[:10]:
+                        f.write(f"    {line}\n")
+                    f.write("\n")
+        return self.files
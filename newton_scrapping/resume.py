@@ -0,0 +1,264 @@
+"""Checkpoints of resumable crawls"""
+
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+import time
+
+# Query entries that only bound a run, a crawl resumed with other values
+# keeps its checkpoint
+RUN_OPTIONS = ("max_items", "max_bytes", "concurrency", "shard_retries")
+
+
+def query_digest(query) -> str:
+    """Digest of the query entries that decide what a crawl fetches"""
+    crawl = {name: value for name, value in query.items() if name not in RUN_OPTIONS}
+    data = json.dumps(crawl, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.blake2b(data, digest_size=8).hexdigest()
+
+
+class CrawlCheckpoint:
+    """
+    On-disk progress of a crawl that can be resumed after a stop or a crash.
+    ...
+
+    A sqlite database in ``directory`` keeps the requests the spiders yielded,
+    which is both the queue of the pending requests and the dupefilter of the
+    crawl across runs, the URLs whose responses were fully processed and the
+    items scraped from them. Everything is committed together at most every
+    ``commit_interval`` seconds, and items only count once the response they
+    were scraped from is done, so after a crash the checkpoint is what it
+    was at the last commit and the responses processed since are fetched
+    again. A checkpoint of another query is reset.
+
+    Attributes
+    ----------
+    directory : str
+        directory of the checkpoint, created when missing
+    commit_interval : float
+        max seconds between two commits
+    status : str
+        "new", "running" (also after a crash), "stopped" or "finished"
+    output_files : list
+        files written by the earlier runs of the crawl
+
+    Methods
+    -------
+    begin(query)
+        Starts a run of the crawl and returns the status of the last one
+    is_known(url)
+        Whether a request for a URL was already yielded by the crawl
+    add_request(request, spider)
+        Records a yielded request, returns False when it can't be stored
+    pending_requests(spider)
+        Returns the requests yielded but not done
+    mark_done(urls, source, items)
+        Records a response as done once its items are
+    item_done(source)
+        Counts an item of a response as scraped or dropped
+    freeze()
+        Stops recording responses as done
+    add_item(item, source)
+        Records an item scraped from a response
+    items()
+        Returns the items of the done responses
+    results()
+        Returns the items by source URL, for "articles" crawls
+    finish(complete, output_files)
+        Commits the run and returns its summary
+    """
+
+    def __init__(self, directory, commit_interval=1.0):
+        self.directory = directory
+        self.commit_interval = commit_interval
+        os.makedirs(directory, exist_ok=True)
+        self.db = sqlite3.connect(os.path.join(directory, "checkpoint.db"))
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS state (name TEXT PRIMARY KEY, value TEXT)")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS requests ("
+            " url TEXT PRIMARY KEY, request BLOB, done INTEGER NOT NULL DEFAULT 0)"
+        )
+        self.db.execute("CREATE TABLE IF NOT EXISTS items (seq INTEGER PRIMARY KEY, source TEXT, data BLOB)")
+        self.db.commit()
+        self.status = self._get_state("status", "new")
+        self.output_files = json.loads(self._get_state("output_files", "[]"))
+        self.previous_status = self.status
+        self._known = set()
+        self._frozen = False
+        # Items scraped and responses waiting for their items, by response URL
+        self._scraped = {}
+        self._waiting = {}
+        self._pending_until = 0
+        self._committed_at = time.monotonic()
+
+    def _get_state(self, name, default=None):
+        row = self.db.execute("SELECT value FROM state WHERE name = ?", (name,)).fetchone()
+        return default if row is None else row[0]
+
+    def _set_state(self, name, value):
+        self.db.execute(
+            "INSERT INTO state (name, value) VALUES (?, ?)"
+            " ON CONFLICT (name) DO UPDATE SET value = excluded.value",
+            (name, value),
+        )
+
+    def begin(self, query) -> str:
+        """Start a run of the crawl of a query
+
+        Items of responses that were not done are dropped, they are scraped
+        again when the response is fetched again.
+
+        Args:
+            query (dict): query of the crawl
+
+        Returns:
+            str: status of the last run, "new" for a new checkpoint
+        """
+        digest = query_digest(query)
+        if self._get_state("query", digest) != digest:
+            for table in ("state", "requests", "items"):
+                self.db.execute(f"DELETE FROM {table}")
+            self.status, self.output_files = "new", []
+        self.previous_status = self.status
+        self.db.execute(
+            "DELETE FROM items WHERE source IS NOT NULL"
+            " AND source NOT IN (SELECT url FROM requests WHERE done = 1)"
+        )
+        self._known = {url for (url,) in self.db.execute("SELECT url FROM requests")}
+        (self._pending_until,) = self.db.execute("SELECT COALESCE(MAX(rowid), 0) FROM requests").fetchone()
+        self._set_state("query", digest)
+        if self.status != "finished":
+            self.status = "running"
+            self._set_state("status", self.status)
+        self.db.commit()
+        self._committed_at = time.monotonic()
+        return self.previous_status
+
+    @property
+    def resumed(self) -> bool:
+        return self.previous_status in ("running", "stopped")
+
+    def is_known(self, url: str) -> bool:
+        return url in self._known
+
+    def add_request(self, request, spider) -> bool:
+        """Record a request yielded by a spider as pending
+
+        Returns:
+            bool: False when the request can't be serialized, its callback
+            isn't a spider method for instance
+        """
+        try:
+            data = pickle.dumps(request.to_dict(spider=spider), protocol=pickle.HIGHEST_PROTOCOL)
+        except (ValueError, TypeError, AttributeError, pickle.PicklingError):
+            return False
+        self.db.execute("INSERT OR IGNORE INTO requests (url, request) VALUES (?, ?)", (request.url, data))
+        self._known.add(request.url)
+        return True
+
+    def pending_requests(self, spider) -> list:
+        """Requests yielded by earlier runs whose responses are not done"""
+        from scrapy.utils.request import request_from_dict
+
+        rows = self.db.execute(
+            "SELECT request FROM requests WHERE done = 0 AND request IS NOT NULL AND rowid <= ?"
+            " ORDER BY rowid",
+            (self._pending_until,),
+        ).fetchall()
+        return [request_from_dict(pickle.loads(data), spider=spider) for (data,) in rows]
+
+    def freeze(self):
+        """Stop recording responses as done, as the output of the responses
+        still being processed is cut short when the spiders are closed"""
+        self._frozen = True
+
+    def mark_done(self, urls, source, items=0):
+        """Record a response as done once all its items went through
+
+        Args:
+            urls (list): request, redirect and response URLs of a response
+                whose output went through the spider middlewares
+            source (str): URL of the response
+            items (int, optional): items yielded from it. Defaults to 0.
+        """
+        if self._scraped.get(source, 0) < items:
+            self._waiting[source] = (urls, items)
+            return
+        self._scraped.pop(source, None)
+        if self._frozen:
+            return
+        self.db.executemany(
+            "INSERT INTO requests (url, done) VALUES (?, 1) ON CONFLICT (url) DO UPDATE SET done = 1",
+            [(url,) for url in urls],
+        )
+        self._known.update(urls)
+        if time.monotonic() - self._committed_at >= self.commit_interval:
+            self.commit()
+
+    def item_done(self, source):
+        """Count an item scraped or dropped from the response of the source URL"""
+        self._scraped[source] = self._scraped.get(source, 0) + 1
+        waiting = self._waiting.get(source)
+        if waiting is not None and self._scraped[source] >= waiting[1]:
+            del self._waiting[source]
+            self.mark_done(waiting[0], source, waiting[1])
+
+    def add_item(self, item, source=None):
+        """Record an item scraped from the response of the source URL"""
+        self.db.execute(
+            "INSERT INTO items (source, data) VALUES (?, ?)",
+            (source, pickle.dumps(item, protocol=pickle.HIGHEST_PROTOCOL)),
+        )
+
+    def items(self) -> list:
+        """Items of the done responses in the order they were scraped"""
+        rows = self.db.execute(
+            "SELECT data FROM items WHERE source IS NULL"
+            " OR source IN (SELECT url FROM requests WHERE done = 1) ORDER BY seq"
+        )
+        return [pickle.loads(data) for (data,) in rows]
+
+    def results(self) -> dict:
+        """Last item of every done source URL"""
+        rows = self.db.execute(
+            "SELECT source, data FROM items WHERE source IN (SELECT url FROM requests WHERE done = 1) ORDER BY seq"
+        )
+        return {source: pickle.loads(data) for source, data in rows}
+
+    def commit(self):
+        self.db.commit()
+        self._committed_at = time.monotonic()
+
+    def finish(self, complete, output_files=()) -> dict:
+        """Commit the run and close the checkpoint
+
+        The crawl is "finished" when the run was complete and no request is
+        pending, failed requests are tried again by the next run.
+
+        Args:
+            complete (bool): whether the spiders were not closed early
+            output_files (list, optional): files written by the crawl,
+                including those of the earlier runs. Defaults to ().
+
+        Returns:
+            dict: "status", whether the run "resumed" an earlier one, the
+            number of "pending" requests and of checkpointed "items"
+        """
+        (pending,) = self.db.execute(
+            "SELECT COUNT(*) FROM requests WHERE done = 0 AND request IS NOT NULL"
+        ).fetchone()
+        (items,) = self.db.execute("SELECT COUNT(*) FROM items").fetchone()
+        if self.status != "finished":
+            self.status = "finished" if complete and not pending else "stopped"
+        self._set_state("status", self.status)
+        self._set_state("output_files", json.dumps(list(output_files)))
+        self.close()
+        return {"status": self.status, "resumed": self.resumed, "pending": pending, "items": items}
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
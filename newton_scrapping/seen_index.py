@@ -0,0 +1,330 @@
+"""Persistent index of already crawled URLs"""
+
+import datetime
+import hashlib
+import math
+import os
+import sqlite3
+import threading
+import time
+
+from dateutil.parser import isoparse
+from scrapy import Request
+from scrapy.utils.request import fingerprint
+from w3lib.url import canonicalize_url
+
+# Indexes of the process by path, shared by its spiders
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def content_hash(body: bytes) -> str:
+    """Hash of a response body used to detect changed articles"""
+    return hashlib.blake2b(body, digest_size=16).hexdigest()
+
+
+def lastmod_key(value) -> str:
+    """Normalize a lastmod/modified_at so sitemap and article values compare
+
+    Args:
+        value (str|datetime.date|datetime.datetime): W3C date or datetime
+
+    Returns:
+        str: "YYYY-MM-DD" for a date, the UTC ISO datetime to the second for
+        a datetime, naive ones taken as UTC, and other values as given
+    """
+    if isinstance(value, str):
+        try:
+            parsed = isoparse(value.strip())
+        except ValueError:
+            return value
+        # isoparse returns a datetime for dates too
+        value = parsed if "T" in value else parsed.date()
+    if isinstance(value, datetime.datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+        return value.replace(microsecond=0).isoformat() + "Z"
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    return str(value)
+
+
+class BloomFilter:
+    """
+    In-memory Bloom filter over request fingerprints.
+    ...
+
+    ``might_contain`` never returns False for an added fingerprint, so a
+    negative answer skips the on-disk lookup entirely.
+
+    Attributes
+    ----------
+    capacity : int
+        number of entries the filter is sized for
+    error_rate : float
+        false positive rate at capacity
+    """
+
+    def __init__(self, capacity=1_000_000, error_rate=0.01):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, fp: bytes):
+        # Double hashing over the two halves of the fingerprint
+        h1 = int.from_bytes(fp[:8], "little")
+        h2 = int.from_bytes(fp[8:16], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hash_count))
+
+    def add(self, fp: bytes):
+        for position in self._positions(fp):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def might_contain(self, fp: bytes) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(fp))
+
+
+class SeenIndex:
+    """
+    On-disk index of crawled URLs keyed by request fingerprint.
+    ...
+
+    Every entry stores the canonical URL, the lastmod/modified_at reported for
+    it (normalized by lastmod_key) and the hash of the last downloaded
+    content, so repeated crawls can skip URLs that did not change. Entries
+    older than ``ttl`` are evicted and the index is trimmed to
+    ``max_entries`` on ``compact()``. The last release() only compacts once
+    the index is over one of them by ``compact_threshold``, so most crawls
+    close without a VACUUM. Writes are committed every
+    ``commit_interval`` seconds, so the database isn't kept locked for
+    other processes.
+
+    Attributes
+    ----------
+    path : str
+        sqlite database file
+    ttl : int
+        seconds after which an entry is evicted, None to keep entries forever
+    max_entries : int
+        number of entries kept by compact(), None for no limit
+    compact_threshold : float
+        fraction of max_entries extra entries, or of ttl past it, that makes
+        release() compact the index
+
+    Methods
+    -------
+    shared(path, **options)
+        Returns the index of a path shared by the spiders of the process
+    release()
+        Releases a shared index, closed by its last user
+    get(url)
+        Returns the stored entry of a URL
+    is_unchanged(url, lastmod, content_hash)
+        Whether a URL was seen with the same lastmod or content
+    add(url, lastmod, content_hash)
+        Records a URL
+    needs_compaction()
+        Whether the index is over its ttl or max_entries by compact_threshold
+    compact()
+        Evicts expired entries, trims the index and rebuilds the Bloom filter
+    """
+
+    def __init__(self, path, ttl=None, max_entries=None, error_rate=0.01, commit_interval=1.0,
+                 compact_threshold=0.1):
+        """
+        Args:
+            path (str): sqlite database file, created when missing
+            ttl (int, optional): seconds to keep an entry. Defaults to None.
+            max_entries (int, optional): entries kept by compact(). Defaults to None.
+            error_rate (float, optional): Bloom filter false positive rate. Defaults to 0.01.
+            commit_interval (float, optional): max seconds between two commits
+                of the added entries. Defaults to 1.0.
+            compact_threshold (float, optional): excess over ttl or max_entries,
+                as a fraction of them, compacted by release(). Defaults to 0.1.
+        """
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.error_rate = error_rate
+        self.commit_interval = commit_interval
+        self.compact_threshold = compact_threshold
+        self.references = 0
+        self._committed_at = time.monotonic()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS seen ("
+            " fingerprint BLOB PRIMARY KEY, url TEXT, lastmod TEXT,"
+            " content_hash TEXT, seen_at REAL) WITHOUT ROWID"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS seen_at_idx ON seen (seen_at)")
+        self._build_bloom()
+
+    @classmethod
+    def from_settings(cls, settings):
+        """Open the index configured by the NEWTON_SEEN_INDEX_* settings"""
+        ttl_days = settings.getfloat("NEWTON_SEEN_INDEX_TTL_DAYS")
+        return cls.shared(
+            settings.get("NEWTON_SEEN_INDEX_PATH"),
+            ttl=ttl_days * 86400 if ttl_days else None,
+            max_entries=settings.getint("NEWTON_SEEN_INDEX_MAX_ENTRIES") or None,
+            compact_threshold=settings.getfloat("NEWTON_SEEN_INDEX_COMPACT_THRESHOLD", 0.1),
+        )
+
+    @classmethod
+    def shared(cls, path, **options) -> "SeenIndex":
+        """Return the index of a path, shared by all the spiders of the process
+
+        One connection for all the spiders (one per link of an "articles"
+        query) keeps them from locking each other out. Every shared() must be
+        matched by a release(), the index is closed by the last one.
+        """
+        key = os.path.abspath(path)
+        with _indexes_lock:
+            index = _indexes.get(key)
+            if index is None:
+                index = _indexes[key] = cls(path, **options)
+            index.references += 1
+            return index
+
+    def release(self):
+        with _indexes_lock:
+            self.references -= 1
+            if self.references > 0:
+                return
+            _indexes.pop(os.path.abspath(self.path), None)
+        if self.needs_compaction():
+            # The handle is closing, no need for a new Bloom filter
+            self._evict()
+        self.close()
+
+    def _build_bloom(self):
+        (entries,) = self.db.execute("SELECT COUNT(*) FROM seen").fetchone()
+        self.bloom = BloomFilter(max(1_000_000, entries * 2), self.error_rate)
+        for (fp,) in self.db.execute("SELECT fingerprint FROM seen"):
+            self.bloom.add(fp)
+
+    @staticmethod
+    def fingerprint(url: str) -> bytes:
+        return fingerprint(Request(canonicalize_url(url)))
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM seen").fetchone()[0]
+
+    def __contains__(self, url):
+        return self.get(url) is not None
+
+    def get(self, url: str) -> dict:
+        """Return the entry stored for a URL
+
+        Args:
+            url (str): article URL
+
+        Returns:
+            dict: url, lastmod, content_hash and seen_at, None when unseen
+        """
+        fp = self.fingerprint(url)
+        if not self.bloom.might_contain(fp):
+            return None
+        row = self.db.execute(
+            "SELECT url, lastmod, content_hash, seen_at FROM seen WHERE fingerprint = ?", (fp,)
+        ).fetchone()
+        if row is None or (self.ttl and row[3] < time.time() - self.ttl):
+            return None
+        return {"url": row[0], "lastmod": row[1], "content_hash": row[2], "seen_at": row[3]}
+
+    def is_unchanged(self, url: str, lastmod=None, content_hash=None) -> bool:
+        """Whether a URL was already crawled and did not change since
+
+        Args:
+            url (str): article URL
+            lastmod (str, optional): current lastmod/modified_at, a date or a
+                datetime. Defaults to None.
+            content_hash (str, optional): hash of the current content. Defaults to None.
+
+        Returns:
+            bool: True when the URL is known and every given value matches
+        """
+        entry = self.get(url)
+        if entry is None:
+            return False
+        if lastmod is not None and entry["lastmod"] != lastmod_key(lastmod):
+            return False
+        if content_hash is not None and entry["content_hash"] != content_hash:
+            return False
+        return True
+
+    def add(self, url: str, lastmod=None, content_hash=None):
+        """Record a URL, keeping stored values that are not given
+
+        Args:
+            url (str): article URL
+            lastmod (str, optional): lastmod/modified_at of the URL. Defaults to None.
+            content_hash (str, optional): hash of the content. Defaults to None.
+        """
+        fp = self.fingerprint(url)
+        lastmod = None if lastmod is None else lastmod_key(lastmod)
+        self.db.execute(
+            "INSERT INTO seen (fingerprint, url, lastmod, content_hash, seen_at)"
+            " VALUES (?, ?, ?, ?, ?) ON CONFLICT (fingerprint) DO UPDATE SET"
+            " lastmod = COALESCE(excluded.lastmod, lastmod),"
+            " content_hash = COALESCE(excluded.content_hash, content_hash),"
+            " seen_at = excluded.seen_at",
+            (fp, canonicalize_url(url), lastmod, content_hash, time.time()),
+        )
+        self.bloom.add(fp)
+        if self.bloom.count > self.bloom.capacity:
+            self.commit()
+            self._build_bloom()
+        elif time.monotonic() - self._committed_at >= self.commit_interval:
+            self.commit()
+
+    def commit(self):
+        self.db.commit()
+        self._committed_at = time.monotonic()
+
+    def needs_compaction(self) -> bool:
+        """Whether the index is over its ttl or max_entries by compact_threshold
+
+        Returns:
+            bool: True when an entry is older than (1 + compact_threshold) * ttl
+            or the index holds more than (1 + compact_threshold) * max_entries
+        """
+        if self.ttl:
+            (oldest,) = self.db.execute("SELECT MIN(seen_at) FROM seen").fetchone()
+            if oldest is not None and oldest < time.time() - self.ttl * (1 + self.compact_threshold):
+                return True
+        if self.max_entries:
+            limit = int(self.max_entries * (1 + self.compact_threshold))
+            if self.db.execute("SELECT 1 FROM seen LIMIT 1 OFFSET ?", (limit,)).fetchone():
+                return True
+        return False
+
+    def compact(self):
+        """Evict expired entries, trim to max_entries and reclaim disk space"""
+        self._evict()
+        self._build_bloom()
+
+    def _evict(self):
+        if self.ttl:
+            self.db.execute("DELETE FROM seen WHERE seen_at < ?", (time.time() - self.ttl,))
+        if self.max_entries:
+            self.db.execute(
+                "DELETE FROM seen WHERE fingerprint IN ("
+                " SELECT fingerprint FROM seen ORDER BY seen_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+        self.db.commit()
+        self.db.execute("VACUUM")
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
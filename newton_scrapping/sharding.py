@@ -0,0 +1,66 @@
+"""Splitting a sitemap crawl in shards and merging their results"""
+
+import datetime
+
+SHARD_BY = ("sitemap", "date")
+
+
+def split_date_range(since, until, shards: int) -> list:
+    """Split since..until in up to ``shards`` contiguous day ranges
+
+    Args:
+        since (str): first day, like "2022-03-01"
+        until (str): last day, like "2022-03-26"
+        shards (int): number of ranges
+
+    Returns:
+        list: (since, until) ISO date strings of every range, in order
+    """
+    if not since or not until:
+        raise ValueError("Sharding by date needs since and until")
+    first = datetime.date.fromisoformat(str(since)[:10])
+    last = datetime.date.fromisoformat(str(until)[:10])
+    days = (last - first).days + 1
+    if days < 1:
+        raise ValueError("until is before since")
+    shards = max(1, min(shards, days))
+    ranges = []
+    start = 0
+    for shard in range(shards):
+        # The first days % shards ranges are one day longer
+        length = days // shards + (1 if shard < days % shards else 0)
+        ranges.append((
+            (first + datetime.timedelta(days=start)).isoformat(),
+            (first + datetime.timedelta(days=start + length - 1)).isoformat(),
+        ))
+        start += length
+    return ranges
+
+
+def split_sitemaps(sitemaps: list, shards: int) -> list:
+    """Deal child sitemap URLs out to up to ``shards`` shards
+
+    Sitemaps are listed by date in an index, dealing them in turn gives every
+    shard recent and old (large and small) sitemaps alike.
+
+    Returns:
+        list: non-empty lists of sitemap URLs
+    """
+    sitemaps = list(dict.fromkeys(sitemaps))
+    return [sitemaps[shard::shards] for shard in range(min(shards, len(sitemaps)))]
+
+
+def merge_links(results) -> list:
+    """Merge the sitemap links of the shards, keeping the first of every link
+
+    Args:
+        results (iterable): lists of {"link": ..., "title": ...} of every shard
+
+    Returns:
+        list[dict]: the links, in shard order
+    """
+    merged = {}
+    for entries in results:
+        for entry in entries:
+            merged.setdefault(entry["link"], entry)
+    return list(merged.values())
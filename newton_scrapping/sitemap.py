@@ -0,0 +1,313 @@
+"""Incremental sitemap parsing with since/until filtering"""
+
+import datetime
+import gzip
+import io
+from collections import namedtuple
+from urllib.parse import urljoin, urlparse
+
+import scrapy
+from dateutil.parser import isoparse
+from lxml import etree
+from scrapy.utils.sitemap import sitemap_urls_from_robots
+
+GZIP_MAGIC = b"\x1f\x8b"
+
+SitemapNode = namedtuple("SitemapNode", ["kind", "loc", "lastmod", "title", "modified"], defaults=(None,))
+SitemapNode.__doc__ = """A <sitemap> entry of an index or an <url> entry of an urlset
+
+kind is "sitemap" or "url", lastmod is a datetime.date or None and title is the
+news:title of the entry when the sitemap is a news sitemap. modified is the
+lastmod (or news publication date) as written, with its time when it has one.
+"""
+
+
+def parse_date(value) -> datetime.date:
+    """Convert a sitemap or query date to a date
+
+    Args:
+        value (str|datetime.date): W3C datetime such as "2022-03-01" or
+            "2022-03-01T10:00:00+05:30", or an already converted date
+
+    Returns:
+        datetime.date: the date, None when value is empty or invalid
+    """
+    if not value:
+        return None
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    try:
+        return isoparse(value.strip()).date()
+    except ValueError:
+        return None
+
+
+def open_sitemap_body(body: bytes):
+    """Return a file object over the sitemap XML, decompressing gzip lazily"""
+    stream = io.BytesIO(body)
+    if body[:2] == GZIP_MAGIC:
+        return gzip.GzipFile(fileobj=stream)
+    return stream
+
+
+def iter_sitemap(body: bytes):
+    """Parse a sitemap index or urlset one entry at a time
+
+    The XML (and the gzip stream around it) is decoded incrementally and every
+    entry is released once yielded, so memory does not grow with the size of
+    the sitemap.
+
+    Args:
+        body (bytes): sitemap XML, optionally gzip compressed
+
+    Yields:
+        SitemapNode: every <sitemap> or <url> entry in document order
+    """
+    parser = etree.iterparse(
+        open_sitemap_body(body),
+        events=("end",),
+        tag=("{*}sitemap", "{*}url"),
+        resolve_entities=False,
+        no_network=True,
+        huge_tree=True,
+        recover=True,
+    )
+    for _, element in parser:
+        loc = lastmod = title = None
+        for child in element.iter():
+            name = etree.QName(child).localname
+            if name == "loc" and loc is None:
+                loc = (child.text or "").strip()
+            elif name == "lastmod" or (name == "publication_date" and lastmod is None):
+                lastmod = child.text
+            elif name == "title" and title is None:
+                # Only news:title, image:title and video:title describe media
+                if etree.QName(child.getparent()).localname == "news":
+                    title = (child.text or "").strip()
+        kind = etree.QName(element).localname
+        # Drop the parsed entry and the siblings before it from the tree
+        element.clear()
+        while element.getprevious() is not None:
+            del element.getparent()[0]
+        if loc:
+            yield SitemapNode(kind, loc, parse_date(lastmod), title, lastmod.strip() if lastmod else None)
+
+
+class SitemapEngine:
+    """
+    Walks sitemap indexes and urlsets keeping only entries inside a date window.
+    ...
+
+    A child sitemap whose <lastmod> is before ``since`` can't contain newer
+    URLs, so it is skipped without being downloaded. URL entries are kept
+    when their lastmod (or news publication date) is inside the window.
+    Entries without a date are always kept. With a ``seen_index`` URLs that
+    were already returned with the same lastmod by an earlier crawl are
+    skipped as well.
+
+    Attributes
+    ----------
+    since : datetime.date
+        first day of the window, None for no lower bound
+    until : datetime.date
+        last day of the window, None for no upper bound
+    seen_index : SeenIndex
+        index of the URLs returned by earlier crawls
+
+    Methods
+    -------
+    parse(response, callback)
+        Yields requests for the child sitemaps and data for the article URLs
+    """
+
+    def __init__(self, since=None, until=None, seen_index=None):
+        """
+        Args:
+            since (str, optional): first day to keep, like "2022-03-01". Defaults to None.
+            until (str, optional): last day to keep, like "2022-03-26". Defaults to None.
+            seen_index (SeenIndex, optional): skip URLs that did not change since
+                an earlier crawl. Defaults to None.
+        """
+        self.since = parse_date(since)
+        self.until = parse_date(until)
+        self.seen_index = seen_index
+        self.skipped_sitemaps = 0
+        self.skipped_urls = 0
+        self.skipped_seen = 0
+
+    def sitemap_in_window(self, node) -> bool:
+        """Whether a child sitemap may contain URLs inside the window"""
+        return not (self.since and node.lastmod and node.lastmod < self.since)
+
+    def url_in_window(self, node) -> bool:
+        """Whether an article URL is inside the window"""
+        if node.lastmod is None:
+            return True
+        if self.since and node.lastmod < self.since:
+            return False
+        if self.until and node.lastmod > self.until:
+            return False
+        return True
+
+    def iter_nodes(self, body: bytes):
+        """Yield the entries of a sitemap body that are inside the window"""
+        return self.filter_nodes(iter_sitemap(body))
+
+    def filter_nodes(self, nodes):
+        """Yield the sitemap entries that are inside the window"""
+        for node in nodes:
+            if node.kind == "sitemap":
+                if self.sitemap_in_window(node):
+                    yield node
+                else:
+                    self.skipped_sitemaps += 1
+            elif not self.url_in_window(node):
+                self.skipped_urls += 1
+            elif self.seen_index is None:
+                yield node
+            elif self.seen_index.is_unchanged(node.loc, lastmod=node.modified or node.lastmod):
+                self.skipped_seen += 1
+            else:
+                self.seen_index.add(node.loc, lastmod=node.modified or node.lastmod)
+                yield node
+
+    def parse(self, response, callback):
+        """Parse a sitemap response
+
+        Args:
+            response (Response): sitemap index or urlset response
+            callback (callable): spider callback for the child sitemaps
+
+        Yields:
+            Request|dict: a request for every child sitemap inside the window
+            and {"link": ..., "title": ...} for every article URL inside it
+        """
+        for node in self.iter_nodes(response.body):
+            if node.kind == "sitemap":
+                yield scrapy.Request(node.loc, callback=callback)
+            else:
+                yield {"link": node.loc, "title": node.title}
+
+
+class SitemapShardSpider(scrapy.Spider):
+    """
+    Crawls a given list of sitemaps, a shard of a sharded sitemap crawl.
+    ...
+
+    Takes the spider arguments of the project spiders, with "sitemaps",
+    "since", "until" and "expand" in args. A robots.txt URL is replaced by its
+    Sitemap: entries, or /sitemap.xml when it has none. With expand the
+    child sitemaps are crawled and {"link": ..., "title": ...} is yielded for
+    every article, without it {"sitemap": ..., "lastmod": ...} is yielded for
+    every child sitemap instead, which is how a crawl is split in shards.
+    Sitemaps that could not be downloaded are listed in ``failed_sitemaps``
+    so only they have to be crawled again. With a ``domain_cache`` the
+    entries of robots.txt and of the sitemap indexes are cached, and taken
+    from the cache by SitemapCacheMiddleware while they are fresh.
+
+    Attributes
+    ----------
+    sitemaps : list
+        sitemap or robots.txt URLs to crawl
+    expand : bool
+        whether child sitemaps are crawled or returned
+    engine : SitemapEngine
+        since/until filter of the entries
+    failed_sitemaps : list
+        URLs of the sitemaps that failed
+    domain_cache : DomainCache
+        cache of the robots.txt and sitemap index entries, set by
+        SitemapCacheMiddleware
+    """
+
+    name = "sitemap_shard"
+    domain_cache = None
+
+    def __init__(self, type="sitemaps", url=None, args=None, *a, **kw):
+        super().__init__(*a, **kw)
+        args = args or {}
+        self.type = type
+        self.sitemaps = list(args.get("sitemaps") or ([url] if url else []))
+        self.expand = args.get("expand", True)
+        self.callback = args.get("callback")
+        self.engine = SitemapEngine(args.get("since"), args.get("until"))
+        self.failed_sitemaps = []
+
+    async def start(self):
+        # Scrapy >= 2.13, which no longer falls back to start_requests()
+        for request in self.start_requests():
+            yield request
+
+    def start_requests(self):
+        # Set by SeenIndexMiddleware once the spider is opened
+        self.engine.seen_index = getattr(self, "seen_index", None)
+        for url in self.sitemaps:
+            yield self.sitemap_request(url)
+
+    def sitemap_request(self, url):
+        callback = self.parse_robots if urlparse(url).path == "/robots.txt" else self.parse_sitemap
+        return scrapy.Request(url, callback=callback, errback=self.sitemap_failed)
+
+    def parse_robots(self, response):
+        nodes = self.cached_nodes(response)
+        if nodes is None:
+            try:
+                urls = list(sitemap_urls_from_robots(response.body, base_url=response.url))
+            except TypeError:
+                # Older Scrapy versions only parse str
+                urls = list(sitemap_urls_from_robots(response.text, base_url=response.url))
+            urls = urls or [urljoin(response.url, "/sitemap.xml")]
+            nodes = [SitemapNode("sitemap", url, None, None) for url in urls]
+            self.cache_nodes(response, nodes)
+        for node in nodes:
+            yield self.sitemap_request(node.loc)
+
+    def sitemap_nodes(self, response):
+        """Yield the entries of a sitemap response, caching those of an index"""
+        nodes = self.cached_nodes(response)
+        if nodes is not None:
+            yield from nodes
+            return
+        # Urlsets change with every article, only indexes are worth caching
+        index = []
+        for node in iter_sitemap(response.body):
+            if node.kind != "sitemap":
+                index = None
+            elif index is not None:
+                index.append(node)
+            yield node
+        if index:
+            self.cache_nodes(response, index)
+
+    def cached_nodes(self, response):
+        # Set by SitemapCacheMiddleware, responses built without a request have no meta
+        return None if response.request is None else response.meta.get("newton_cached_sitemap")
+
+    def cache_nodes(self, response, nodes):
+        if self.domain_cache is not None:
+            url = response.meta.get("redirect_urls", [response.url])[0]
+            self.domain_cache.set("sitemap", url, nodes, response.headers)
+
+    def parse_sitemap(self, response):
+        for node in self.engine.filter_nodes(self.sitemap_nodes(response)):
+            if node.kind == "url":
+                yield {"link": node.loc, "title": node.title}
+            elif self.expand:
+                yield self.sitemap_request(node.loc)
+            else:
+                yield {"sitemap": node.loc, "lastmod": node.lastmod.isoformat() if node.lastmod else None}
+
+    def sitemap_failed(self, failure):
+        url = failure.request.url
+        if urlparse(url).path == "/robots.txt":
+            yield self.sitemap_request(urljoin(url, "/sitemap.xml"))
+        else:
+            self.logger.warning("Sitemap %s failed: %s", url, failure.getErrorMessage())
+            self.failed_sitemaps.append(url)
+
+    def closed(self, reason):
+        # The items were delivered by the item_scraped signal
+        if self.callback:
+            self.callback([])
@@ -0,0 +1,114 @@
+"""Cold start benchmark: package import time and time to the first request
+
+Usage:
+    python -m newton_scrapping.test.benchmark_cold_start
+    python -m newton_scrapping.test.benchmark_cold_start --start-methods fork forkserver spawn
+
+Every run starts a fresh interpreter. The import time is measured inside it,
+the time to first request from starting the interpreter to the first request
+received by a local MockNewsSite, so it includes the interpreter startup, the
+imports and starting the crawler process.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from newton_scrapping.test.mock_site import MockNewsSite
+
+# TODO: Update the path here replace newton_scrapping --> your project name
+DEFAULT_CRAWLER = "newton_scrapping.main:Crawler"
+
+_IMPORT_SCRIPT = """
+import json, sys, time
+started = time.perf_counter()
+import {module}
+print(json.dumps({{"seconds": time.perf_counter() - started, "scrapy": "scrapy" in sys.modules}}))
+"""
+
+_CRAWL_SCRIPT = """
+import json, time
+from importlib import import_module
+started = time.perf_counter()
+Crawler = getattr(import_module({module!r}), {name!r})
+crawler = Crawler(query={{"type": "article", "link": {link!r}}}, start_method={start_method!r})
+created = time.perf_counter()
+crawler.crawl()
+print(json.dumps({{"import_seconds": created - started}}))
+"""
+
+
+def _run(script: str) -> dict:
+    completed = subprocess.run(
+        [sys.executable, "-c", script], capture_output=True, text=True, check=True, env=dict(os.environ)
+    )
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def measure_import(module="newton_scrapping", runs=5) -> dict:
+    """Time importing a module in fresh interpreters
+
+    Returns:
+        dict: median and min import ms, and whether the import pulled scrapy in
+    """
+    results = [_run(_IMPORT_SCRIPT.format(module=module)) for _ in range(runs)]
+    seconds = [result["seconds"] for result in results]
+    return {
+        "module": module,
+        "import_ms_median": round(statistics.median(seconds) * 1000, 1),
+        "import_ms_min": round(min(seconds) * 1000, 1),
+        "imports_scrapy": any(result["scrapy"] for result in results),
+    }
+
+
+def measure_first_request(site: MockNewsSite, crawler=DEFAULT_CRAWLER, start_method=None, runs=3) -> dict:
+    """Time a fresh interpreter crawling one article of a mock site
+
+    Returns:
+        dict: median ms to import the crawler, to the first request and to
+        the end of the crawl
+    """
+    module, name = crawler.split(":")
+    link = site.article_links()[0]
+    imports, first_requests, totals = [], [], []
+    for _ in range(runs):
+        site.reset_stats()
+        started = time.time()
+        result = _run(_CRAWL_SCRIPT.format(module=module, name=name, link=link, start_method=start_method))
+        totals.append(time.time() - started)
+        imports.append(result["import_seconds"])
+        if site.stats["first_request_at"] is not None:
+            first_requests.append(site.stats["first_request_at"] - started)
+    return {
+        "start_method": start_method or multiprocessing.get_start_method(),
+        "import_ms": round(statistics.median(imports) * 1000, 1),
+        "first_request_ms": round(statistics.median(first_requests) * 1000, 1) if first_requests else None,
+        "crawl_ms": round(statistics.median(totals) * 1000, 1),
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--module", default="newton_scrapping", help="package whose import is timed")
+    parser.add_argument("--crawler", default=DEFAULT_CRAWLER, help="crawler class as module:ClassName")
+    parser.add_argument("--start-methods", nargs="+", default=[None], help="multiprocessing start methods")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    report = {"import": measure_import(args.module, runs=max(args.runs, 5)), "first_request": []}
+    with MockNewsSite(sitemaps=1, urls_per_sitemap=1) as site:
+        for start_method in args.start_methods:
+            report["first_request"].append(
+                measure_first_request(site, args.crawler, start_method, runs=args.runs)
+            )
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,172 @@
+"""Offline parse throughput benchmark over the recorded test article responses
+
+Usage:
+    python -m newton_scrapping.test.benchmark_parse --record
+    python -m newton_scrapping.test.benchmark_parse --save-baseline
+    python -m newton_scrapping.test.benchmark_parse
+
+``--record`` downloads the TEST_ARTICLES once and stores them next to their
+test data. Every run after that replays the recordings (or the raw_response of
+the test data when nothing was recorded), so no network access is needed and
+the timings only measure the spider's parse. The report is compared to the
+saved baseline and the exit status is 1 when it regressed.
+"""
+
+import argparse
+import gc
+import importlib
+import json
+import math
+import os
+import sys
+import time
+import tracemalloc
+
+from newton_scrapping.test.helpers.constant import TEST_ARTICLES
+from newton_scrapping.test.helpers.utils import offline_response_from_url, record_response
+
+# TODO: Update the path here replace newton_scrapping --> your project name
+DEFAULT_SPIDER = "newton_scrapping.spiders.indian_express:IndianExpressSpider"
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "data", "parse_benchmark_baseline.json")
+
+
+def load_spider_class(path: str):
+    """Import a spider class given as "module:ClassName" """
+    module_name, class_name = path.split(":")
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def percentile(values: list, q: float) -> float:
+    """Nearest-rank percentile of a list of values"""
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, math.ceil(q / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def load_responses(spider_class, articles) -> list:
+    """Replay the response of every article once, outside the timed passes
+
+    Returns:
+        list: (article, response) tuples
+    """
+    responses = []
+    for article in articles:
+        spider = spider_class(type="article", url=article["url"])
+        responses.append((article, offline_response_from_url(spider.article_url, article["test_data_path"])))
+    return responses
+
+
+def parse_article(spider_class, article: dict, response) -> list:
+    spider = spider_class(type="article", url=article["url"])
+    # A copy every time, the selector of a response is cached
+    return list(spider.parse(response.replace()))
+
+
+def run_benchmark(spider_class, articles=TEST_ARTICLES, iterations=20, warmup=2) -> dict:
+    """Time the spider's parse over the recorded article responses
+
+    The responses are replayed once before the passes, so the latencies and
+    the peak allocation don't include reading and decoding the recordings.
+    Latencies are measured without tracemalloc, the peak allocation is taken
+    from one more pass with tracemalloc running.
+
+    Args:
+        spider_class (type): spider parsing the articles
+        articles (list, optional): TEST_ARTICLES like entries. Defaults to TEST_ARTICLES.
+        iterations (int, optional): timed passes over the articles. Defaults to 20.
+        warmup (int, optional): untimed passes first. Defaults to 2.
+
+    Returns:
+        dict: articles, articles_per_sec, p50_ms, p99_ms and peak_alloc_kb
+    """
+    responses = load_responses(spider_class, articles)
+    for _ in range(warmup):
+        for article, response in responses:
+            parse_article(spider_class, article, response)
+
+    latencies = []
+    gc.collect()
+    started = time.perf_counter()
+    for _ in range(iterations):
+        for article, response in responses:
+            parse_started = time.perf_counter()
+            parse_article(spider_class, article, response)
+            latencies.append(time.perf_counter() - parse_started)
+    elapsed = time.perf_counter() - started
+
+    tracemalloc.start()
+    try:
+        for article, response in responses:
+            parse_article(spider_class, article, response)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "articles": len(latencies),
+        "articles_per_sec": round(len(latencies) / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "peak_alloc_kb": round(peak / 1024, 1),
+    }
+
+
+def compare(report: dict, baseline: dict, tolerance=0.1) -> list:
+    """Return the regressions of a report against the baseline
+
+    Args:
+        report (dict): run_benchmark() result
+        baseline (dict): saved run_benchmark() result
+        tolerance (float, optional): allowed relative change. Defaults to 0.1.
+
+    Returns:
+        list: one message per regressed metric, empty when nothing regressed
+    """
+    regressions = []
+    if report["articles_per_sec"] < baseline["articles_per_sec"] * (1 - tolerance):
+        regressions.append(
+            f"articles_per_sec {report['articles_per_sec']} < baseline {baseline['articles_per_sec']}"
+        )
+    for key in ("p50_ms", "p99_ms", "peak_alloc_kb"):
+        if report[key] > baseline[key] * (1 + tolerance):
+            regressions.append(f"{key} {report[key]} > baseline {baseline[key]}")
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--spider", default=DEFAULT_SPIDER, help="spider class as module:ClassName")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--tolerance", type=float, default=0.1, help="allowed relative regression")
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the baseline")
+    parser.add_argument("--record", action="store_true", help="download and record the test articles")
+    args = parser.parse_args(argv)
+
+    if args.record:
+        for article in TEST_ARTICLES:
+            print(f"Recorded {record_response(article['url'], article['test_data_path'])}")
+        return 0
+
+    report = run_benchmark(load_spider_class(args.spider), iterations=args.iterations)
+    print(json.dumps(report, indent=2))
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("No baseline saved, run with --save-baseline first")
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare(report, baseline, args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION: {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,50 @@
+"""Spiders crawling MockNewsSite for the end-to-end tests"""
+
+import scrapy
+
+from newton_scrapping.main import Crawler
+
+
+class MockArticleSpider(scrapy.Spider):
+    """Article spider of the MockNewsSite pages, like a project spider
+
+    Yields an article item with the raw_response, the JSON-LD in parsed_json
+    and the title and paragraphs in parsed_data.
+    """
+
+    name = "mock_article"
+
+    def __init__(self, type="article", url=None, args=None, *a, **kw):
+        super().__init__(*a, **kw)
+        self.type = type
+        self.article_url = url
+        self.callback = (args or {}).get("callback")
+
+    async def start(self):
+        # Scrapy >= 2.13, which no longer falls back to start_requests()
+        for request in self.start_requests():
+            yield request
+
+    def start_requests(self):
+        yield scrapy.Request(self.article_url, callback=self.parse)
+
+    def parse(self, response):
+        yield {
+            "raw_response": {"content_type": "text/html; charset=utf-8", "content": response.text},
+            "parsed_json": {"main": []},
+            "parsed_data": {
+                "title": response.css("title::text").getall(),
+                "text": [text.strip() for text in response.css("p::text").getall() if text.strip()],
+            },
+        }
+
+    def closed(self, reason):
+        # The items were delivered by the item_scraped signal
+        if self.callback:
+            self.callback([])
+
+
+class MockCrawler(Crawler):
+    """Crawler running MockArticleSpider for the "article" and "articles" queries"""
+
+    spider_class = MockArticleSpider
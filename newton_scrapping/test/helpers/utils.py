@@ -1,3 +1,5 @@
+import gzip
+import os
 import requests
 import json
 from scrapy.http import Request, TextResponse
@@ -35,3 +37,84 @@ def get_article_content(file_name: str) -> dict:
         data = json.load(f)
 
     return data
+
+
+def recorded_response_path(test_data_path: str) -> str:
+    """Path of the recorded response stored next to an article test data file
+
+    Args:
+        test_data_path (str): JSON file path of the expected article
+
+    Returns:
+        str: path like test_article_1.response.json.gz
+    """
+    return os.path.splitext(test_data_path)[0] + ".response.json.gz"
+
+
+def record_response(url: str, test_data_path: str) -> str:
+    """Fetch the url and store its status, headers and body for offline replay
+
+    Args:
+        url (str): web address of article
+        test_data_path (str): JSON file path of the expected article
+
+    Returns:
+        str: path of the recorded response
+    """
+    raw_response = requests.get(url)
+    record = {
+        "url": url,
+        "status": raw_response.status_code,
+        "headers": dict(raw_response.headers),
+        "body": raw_response.text,
+    }
+    path = recorded_response_path(test_data_path)
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        json.dump(record, f)
+    return path
+
+
+def offline_response_from_url(url: str, test_data_path: str) -> TextResponse:
+    """Replay the recorded response of the url as a scrapy Response
+
+    Uses the recording made by record_response() and falls back to the page
+    stored in raw_response of the expected article data.
+
+    Args:
+        url (str): web address of article
+        test_data_path (str): JSON file path of the expected article
+
+    Returns:
+        TextResponse: Converted Response object
+    """
+    path = recorded_response_path(test_data_path)
+    if os.path.exists(path):
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            record = json.load(f)
+    else:
+        raw_response = get_article_content(test_data_path)[0]["raw_response"]
+        record = {
+            "status": 200,
+            "headers": {"Content-Type": raw_response["content_type"]},
+            "body": raw_response["content"],
+        }
+
+    request = Request(url=url)
+    response = TextResponse(url=url, request=request, status=record["status"],
+                            headers=record["headers"], body=record["body"], encoding='utf-8')
+    return response
+
+
+def response_from_url(url: str, test_data_path: str) -> TextResponse:
+    """Replay the recorded response of the url when there is one, else call it
+
+    Args:
+        url (str): web address of article
+        test_data_path (str): JSON file path of the expected article
+
+    Returns:
+        TextResponse: Converted Response object
+    """
+    if os.path.exists(recorded_response_path(test_data_path)):
+        return offline_response_from_url(url, test_data_path)
+    return online_response_from_url(url)
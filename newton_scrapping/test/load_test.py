@@ -0,0 +1,140 @@
+"""End to end crawl load test against the local MockNewsSite
+
+Usage:
+    python -m newton_scrapping.test.load_test --sitemaps 10 --urls-per-sitemap 100 \\
+        --latency 0.05 --error-rate 0.01 --rate-limit-rate 0.02 --concurrency 32 \\
+        --spider newton_scrapping.spiders.indian_express:IndianExpressSpider
+
+Runs a sitemap crawl over the mock site's sitemap index and then an articles
+crawl over the links it returned, and reports for both phases the requests
+and items per second, the p50/p99 download latency seen by the crawler
+(including the throttle delay) and the time the server took to answer, the
+status codes and the peak RSS of the crawler processes. Without --spider the
+sitemap phase uses the generic "sitemaps" spider and the articles phase,
+which needs a project spider, is skipped. No network access is needed.
+"""
+
+import argparse
+import json
+import multiprocessing
+import resource
+import sys
+import tempfile
+import time
+
+from newton_scrapping.main import Crawler
+from newton_scrapping.test.benchmark_parse import load_spider_class, percentile
+from newton_scrapping.test.mock_site import MockNewsSite
+
+
+def run_phase(site: MockNewsSite, crawler: Crawler) -> dict:
+    """Run a crawl against the site and measure it
+
+    Args:
+        site (MockNewsSite): running mock site
+        crawler (Crawler): crawler of the phase
+
+    Returns:
+        dict: the report of the phase and, under "results", the crawl output
+    """
+    site.reset_stats()
+    started = time.perf_counter()
+    results = crawler.crawl()
+    elapsed = time.perf_counter() - started
+    # crawl() returns before its process exits, reap it so that it is counted by RUSAGE_CHILDREN
+    for process in multiprocessing.active_children():
+        process.join()
+    items = len(results) if isinstance(results, (list, dict)) else 0
+    latencies = site.stats["latencies"] or [0]
+    download = crawler.report.get("metrics", {}).get("download_seconds") or {}
+    return {
+        "seconds": round(elapsed, 3),
+        "requests": site.stats["requests"],
+        "requests_per_sec": round(site.stats["requests"] / elapsed, 2),
+        "items": items,
+        "items_per_sec": round(items / elapsed, 2),
+        "status": {str(status): count for status, count in sorted(site.stats["status"].items())},
+        "download_p50_ms": round((download.get("p50") or 0) * 1000, 3),
+        "download_p99_ms": round((download.get("p99") or 0) * 1000, 3),
+        "server_p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "server_p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        # ru_maxrss is reported in kilobytes on Linux
+        "peak_child_rss_mb": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1),
+        "results": results,
+    }
+
+
+def run_load_test(
+    site: MockNewsSite, concurrency=16, max_articles=None, spider_class=None, **crawler_options
+) -> dict:
+    """Crawl the site's sitemap and then its articles
+
+    Args:
+        site (MockNewsSite): running mock site
+        concurrency (int, optional): concurrency of the articles crawl. Defaults to 16.
+        max_articles (int, optional): number of links of the articles crawl. Defaults to None.
+        spider_class (type, optional): project spider of both phases, None
+            crawls the sitemap with the generic "sitemaps" spider and skips
+            the articles. Defaults to None.
+        **crawler_options: keyword arguments of Crawler
+
+    Returns:
+        dict: "sitemap" and "articles" phase reports
+    """
+    with tempfile.TemporaryDirectory() as metrics:
+        # The download latency comes from the crawl metrics
+        crawler_options.setdefault("metrics", metrics)
+
+        def crawler(query):
+            crawler = Crawler(query=query, **crawler_options)
+            if spider_class is not None:
+                crawler.spider_class = spider_class
+            return crawler
+
+        if spider_class is None:
+            query = {"type": "sitemaps", "sitemaps": [f"{site.url}/sitemap.xml"]}
+        else:
+            query = {"type": "sitemap", "domain": f"{site.url}/sitemap.xml"}
+        sitemap = run_phase(site, crawler(query))
+        if spider_class is None:
+            sitemap.pop("results")
+            return {"sitemap": sitemap, "articles": {"skipped": "the articles phase needs --spider"}}
+        links = [entry.get("link") for entry in sitemap.pop("results") or [] if isinstance(entry, dict)]
+        links = [link for link in links if link]
+        # Fall back to the generated links when the sitemap crawl returned nothing
+        links = (links or site.article_links())[:max_articles]
+        articles = run_phase(site, crawler({"type": "articles", "links": links, "concurrency": concurrency}))
+        articles.pop("results")
+    return {"sitemap": sitemap, "articles": articles}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sitemaps", type=int, default=4)
+    parser.add_argument("--urls-per-sitemap", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--latency-jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of 503 responses")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="share of 429 responses")
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--max-articles", type=int, default=None)
+    parser.add_argument("--spider", default=None, help="project spider class as module:ClassName")
+    args = parser.parse_args(argv)
+    spider_class = load_spider_class(args.spider) if args.spider else None
+
+    site = MockNewsSite(
+        sitemaps=args.sitemaps, urls_per_sitemap=args.urls_per_sitemap, latency=args.latency,
+        latency_jitter=args.latency_jitter, error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate, retry_after=args.retry_after,
+    )
+    with site:
+        report = run_load_test(
+            site, concurrency=args.concurrency, max_articles=args.max_articles, spider_class=spider_class
+        )
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,201 @@
+"""Local stand-in for a news site, serving generated sitemaps and fixture articles"""
+
+import datetime
+import gzip
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+from newton_scrapping.test.helpers.constant import TEST_ARTICLES
+from newton_scrapping.test.helpers.utils import get_article_content
+
+SITEMAP_NS = "http://www.sitemaps.org/schemas/sitemap/0.9"
+NEWS_NS = "http://www.google.com/schemas/sitemap-news/0.9"
+
+
+class MockNewsSite:
+    """
+    Threaded HTTP server behaving like a news publisher.
+    ...
+
+    ``/sitemap.xml`` is a sitemap index of ``sitemaps`` gzip compressed news
+    sitemaps, one per day going back from ``today``, each listing
+    ``urls_per_sitemap`` articles. Article pages are the raw_response of the
+    test data fixtures, served in turn. Every response can be delayed and a
+    share of them fail with 503 or are rate limited with 429 and Retry-After.
+    Requests for absolute URLs are answered too, so the site can stand in for
+    an HTTP proxy.
+
+    Attributes
+    ----------
+    sitemaps : int
+        number of child sitemaps in the index
+    urls_per_sitemap : int
+        number of articles in every child sitemap
+    latency : float
+        seconds added to every response
+    latency_jitter : float
+        random seconds added on top of latency
+    error_rate : float
+        share of the responses answered with 503
+    rate_limit_rate : float
+        share of the responses answered with 429
+    retry_after : int
+        Retry-After seconds sent with 429
+    stats : dict
+        requests, status counts and latencies of the served responses, and
+        the time.time() of the first request
+
+    Methods
+    -------
+    start()
+        Starts serving in a background thread
+    stop()
+        Stops the server
+    article_links()
+        Returns the URLs of every article listed by the sitemaps
+    """
+
+    def __init__(
+        self, sitemaps=4, urls_per_sitemap=50, latency=0.0, latency_jitter=0.0, error_rate=0.0,
+        rate_limit_rate=0.0, retry_after=1, today=None, seed=0, host="127.0.0.1", port=0,
+    ):
+        self.sitemaps = sitemaps
+        self.urls_per_sitemap = urls_per_sitemap
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.today = today or datetime.date.today()
+        self.random = random.Random(seed)
+        self.pages = [
+            get_article_content(article["test_data_path"])[0]["raw_response"]["content"].encode("utf-8")
+            for article in TEST_ARTICLES
+        ]
+        self.lock = threading.Lock()
+        self.reset_stats()
+        self.server = ThreadingHTTPServer((host, port), self._handler_class())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "MockNewsSite":
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        if self.thread is not None:
+            self.thread.join()
+
+    def reset_stats(self):
+        with self.lock:
+            self.stats = {"requests": 0, "status": {}, "latencies": [], "first_request_at": None}
+
+    def sitemap_date(self, index) -> datetime.date:
+        return self.today - datetime.timedelta(days=index)
+
+    def article_links(self) -> list:
+        return [
+            f"{self.url}/article/{index}-{position}.html"
+            for index in range(self.sitemaps)
+            for position in range(self.urls_per_sitemap)
+        ]
+
+    def sitemap_index(self) -> bytes:
+        entries = "".join(
+            f"<sitemap><loc>{self.url}/sitemaps/news-{index}.xml.gz</loc>"
+            f"<lastmod>{self.sitemap_date(index).isoformat()}</lastmod></sitemap>"
+            for index in range(self.sitemaps)
+        )
+        return (
+            f'<?xml version="1.0" encoding="UTF-8"?><sitemapindex xmlns="{SITEMAP_NS}">'
+            f"{entries}</sitemapindex>"
+        ).encode("utf-8")
+
+    def child_sitemap(self, index) -> bytes:
+        date = self.sitemap_date(index).isoformat()
+        entries = "".join(
+            f"<url><loc>{self.url}/article/{index}-{position}.html</loc>"
+            f"<news:news><news:publication_date>{date}</news:publication_date>"
+            f"<news:title>Article {index}-{position}</news:title></news:news></url>"
+            for position in range(self.urls_per_sitemap)
+        )
+        xml = (
+            f'<?xml version="1.0" encoding="UTF-8"?>'
+            f'<urlset xmlns="{SITEMAP_NS}" xmlns:news="{NEWS_NS}">{entries}</urlset>'
+        )
+        return gzip.compress(xml.encode("utf-8"))
+
+    def route(self, path) -> tuple:
+        """Return the status, content type and body of a path"""
+        if path == "/robots.txt":
+            return 200, "text/plain", f"User-agent: *\nAllow: /\nSitemap: {self.url}/sitemap.xml\n".encode()
+        if path == "/sitemap.xml":
+            return 200, "application/xml", self.sitemap_index()
+        if path.startswith("/sitemaps/news-") and path.endswith(".xml.gz"):
+            index = path[len("/sitemaps/news-"):-len(".xml.gz")]
+            if index.isdigit() and int(index) < self.sitemaps:
+                return 200, "application/x-gzip", self.child_sitemap(int(index))
+        if path.startswith("/article/") and path.endswith(".html"):
+            index, _, position = path[len("/article/"):-len(".html")].partition("-")
+            if index.isdigit() and position.isdigit():
+                page = self.pages[(int(index) * self.urls_per_sitemap + int(position)) % len(self.pages)]
+                return 200, "text/html; charset=utf-8", page
+        return 404, "text/plain", b"Not Found"
+
+    def _handler_class(self):
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                started = time.perf_counter()
+                with site.lock:
+                    if site.stats["first_request_at"] is None:
+                        site.stats["first_request_at"] = time.time()
+                    roll = site.random.random()
+                    delay = site.latency + site.random.uniform(0, site.latency_jitter)
+                if delay:
+                    time.sleep(delay)
+                headers = {}
+                if roll < site.rate_limit_rate:
+                    status, content_type, body = 429, "text/plain", b"Too Many Requests"
+                    headers["Retry-After"] = str(site.retry_after)
+                elif roll < site.rate_limit_rate + site.error_rate:
+                    status, content_type, body = 503, "text/plain", b"Service Unavailable"
+                else:
+                    status, content_type, body = site.route(urlsplit(self.path).path)
+                # Counted before answering so the client never sees a response that isn't counted yet
+                with site.lock:
+                    site.stats["requests"] += 1
+                    site.stats["status"][status] = site.stats["status"].get(status, 0) + 1
+                    site.stats["latencies"].append(time.perf_counter() - started)
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
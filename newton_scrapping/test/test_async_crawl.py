@@ -0,0 +1,75 @@
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import textwrap
+import unittest
+
+from newton_scrapping.main import Crawler
+from newton_scrapping.test.mock_site import MockNewsSite
+
+# The reactor of in-loop crawls is installed for the whole process, so they
+# run in a fresh interpreter
+_IN_LOOP_SCRIPT = textwrap.dedent("""
+    import asyncio, json, sys
+    from newton_scrapping.main import Crawler
+
+    async def main(query):
+        links = await Crawler(query=query, in_loop=True).acrawl()
+        streamed = [item async for item in Crawler(query=query, in_loop=True).aiter_crawl()]
+        async for item in Crawler(query=query, in_loop=True).aiter_crawl():
+            break
+        again = await Crawler(query=query, in_loop=True).acrawl()
+        return [len(links), len(streamed), len(again)]
+
+    print(json.dumps(asyncio.run(main(json.loads(sys.argv[1])))))
+""")
+
+
+class TestAsyncCrawl(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.site = MockNewsSite(sitemaps=2, urls_per_sitemap=5).start()
+        cls.query = {"type": "sitemaps", "sitemaps": [cls.site.url + "/sitemap.xml"]}
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.site.stop()
+
+    def test_concurrent_acrawl(self):
+        async def crawl_all():
+            return await asyncio.gather(*(Crawler(query=self.query).acrawl() for _ in range(3)))
+
+        for links in asyncio.run(crawl_all()):
+            self.assertEqual(sorted(link["link"] for link in links), sorted(self.site.article_links()))
+
+    def test_acrawl_mmap(self):
+        with asyncio.run(Crawler(query=self.query, transport="mmap").acrawl()) as links:
+            self.assertEqual(len(links), 10)
+
+    def test_aiter_crawl(self):
+        async def stream(stop_after=None):
+            crawler = Crawler(query=self.query)
+            items = []
+            async for item in crawler.aiter_crawl():
+                items.append(item)
+                if len(items) == stop_after:
+                    break
+            return items
+
+        self.assertEqual(len(asyncio.run(stream())), 10)
+        self.assertEqual(len(asyncio.run(stream(stop_after=1))), 1)
+
+    def test_in_loop(self):
+        completed = subprocess.run(
+            [sys.executable, "-c", _IN_LOOP_SCRIPT, json.dumps(self.query)],
+            capture_output=True, text=True, env=dict(os.environ), timeout=120,
+        )
+        self.assertEqual(completed.returncode, 0, completed.stderr[-2000:])
+        self.assertEqual(completed.stdout.strip().splitlines()[-1], "[10, 10, 10]")
+
+
+if __name__ == "__main__":
+    unittest.main()
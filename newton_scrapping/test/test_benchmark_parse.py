@@ -0,0 +1,47 @@
+import unittest
+from unittest import mock
+
+from newton_scrapping.test import benchmark_parse
+from newton_scrapping.test.benchmark_parse import compare, percentile, run_benchmark
+from newton_scrapping.test.helpers.constant import TEST_ARTICLES
+from newton_scrapping.test.helpers.utils import get_article_content, offline_response_from_url
+
+
+class TestBenchmarkParse(unittest.TestCase):
+    def test_offline_response_falls_back_to_test_data(self):
+        article = TEST_ARTICLES[0]
+        response = offline_response_from_url(article["url"], article["test_data_path"])
+        raw_response = get_article_content(article["test_data_path"])[0]["raw_response"]
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response.url, article["url"])
+        self.assertEqual(response.text, raw_response["content"])
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([5], 99), 5)
+
+    def test_compare(self):
+        baseline = {"articles_per_sec": 100, "p50_ms": 10, "p99_ms": 20, "peak_alloc_kb": 1000}
+        self.assertEqual(compare(dict(baseline), baseline), [])
+        report = dict(baseline, articles_per_sec=80, p99_ms=30)
+        self.assertEqual(len(compare(report, baseline, tolerance=0.1)), 2)
+
+    def test_responses_are_replayed_once(self):
+        class TitleSpider:
+            def __init__(self, type, url):
+                self.article_url = url
+
+            def parse(self, response):
+                yield {"title": response.css("title::text").get()}
+
+        replay = mock.Mock(wraps=offline_response_from_url)
+        with mock.patch.object(benchmark_parse, "offline_response_from_url", replay):
+            report = run_benchmark(TitleSpider, iterations=3, warmup=1)
+        self.assertEqual(replay.call_count, len(TEST_ARTICLES))
+        self.assertEqual(report["articles"], 3 * len(TEST_ARTICLES))
+
+
+if __name__ == "__main__":
+    unittest.main()
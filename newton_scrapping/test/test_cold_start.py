@@ -0,0 +1,40 @@
+import unittest
+
+import scrapy
+
+import newton_scrapping
+from newton_scrapping.main import Crawler
+from newton_scrapping.test.benchmark_cold_start import measure_import
+
+
+class SpiderCrawler(Crawler):
+    spider_classes = {"sitemap": "scrapy.spiders.SitemapSpider", "article": "scrapy.spiders.Spider"}
+
+
+class TestColdStart(unittest.TestCase):
+    def test_imports_do_not_import_scrapy(self):
+        for module in ("newton_scrapping", "newton_scrapping.main"):
+            with self.subTest(module=module):
+                self.assertFalse(measure_import(module, runs=1)["imports_scrapy"])
+
+    def test_lazy_attributes(self):
+        self.assertIn("Crawler", dir(newton_scrapping))
+        with self.assertRaises(AttributeError):
+            newton_scrapping.Missing
+
+    def test_spider_class_per_type(self):
+        crawler = SpiderCrawler()
+        self.assertIs(crawler.get_spider_class("article"), scrapy.Spider)
+        self.assertIs(crawler.get_spider_class("sitemap"), scrapy.spiders.SitemapSpider)
+        with self.assertRaises(Exception):
+            crawler.get_spider_class("link_feed")
+        self.assertIn("scrapy.spiders", crawler.get_preload_modules())
+
+    def test_spider_class_override(self):
+        crawler = SpiderCrawler()
+        crawler.spider_class = scrapy.Spider
+        self.assertIs(crawler.get_spider_class("sitemap"), scrapy.Spider)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,40 @@
+import unittest
+
+from scrapy import Selector
+
+from newton_scrapping.main import Crawler
+from newton_scrapping.test.helpers.spiders import MockCrawler
+from newton_scrapping.test.mock_site import MockNewsSite
+
+LINKS = ["https://example.com/articles/a.html", "https://example.com/articles/b.html"]
+
+
+class MissingSpiderCrawler(Crawler):
+    spider_classes = {"article": "newton_scrapping.test.missing_spiders.ArticleSpider"}
+
+
+class TestCrawlMany(unittest.TestCase):
+
+    def test_links_failing_before_their_spider_runs(self):
+        results = MissingSpiderCrawler().crawl_many(LINKS)
+        self.assertEqual(sorted(results), LINKS)
+        for result in results.values():
+            self.assertIn("missing_spiders", result["error"])
+
+    def test_articles_keyed_by_link(self):
+        with MockNewsSite(sitemaps=2, urls_per_sitemap=3) as site:
+            links = site.article_links()
+            missing = site.url + "/missing.html"
+            results = MockCrawler().crawl_many(links + [missing])
+            self.assertEqual(sorted(results), sorted(links + [missing]))
+            self.assertIn("error", results[missing])
+            for link in links:
+                _, _, page = site.route(link[len(site.url):])
+                page = page.decode("utf-8")
+                (article,) = results[link]["data"]
+                self.assertEqual(article["raw_response"]["content"], page)
+                self.assertEqual(article["parsed_data"]["title"], Selector(text=page).css("title::text").getall())
+
+
+if __name__ == "__main__":
+    unittest.main()
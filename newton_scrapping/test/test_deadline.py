@@ -0,0 +1,114 @@
+import asyncio
+import multiprocessing
+import time
+import unittest
+
+from newton_scrapping.main import Crawler, _DeadlineReached, _get_message, _phase_timings, _reap
+from newton_scrapping.pool import CrawlerPool
+from newton_scrapping.test.mock_site import MockNewsSite
+
+
+def _exit_silently():
+    pass
+
+
+def _hang():
+    time.sleep(60)
+
+
+class TestDeadline(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.fast = MockNewsSite(sitemaps=1, urls_per_sitemap=5).start()
+        cls.slow = MockNewsSite(sitemaps=1, urls_per_sitemap=5, latency=30).start()
+        cls.query = {
+            "type": "sitemaps",
+            "sitemaps": [cls.fast.url + "/sitemaps/news-0.xml.gz", cls.slow.url + "/sitemaps/news-0.xml.gz"],
+        }
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.fast.stop()
+        cls.slow.stop()
+
+    def assertPartial(self, crawler, links, started):
+        self.assertLess(time.monotonic() - started, 4)
+        self.assertEqual(sorted(link["link"] for link in links), sorted(self.fast.article_links()))
+        self.assertTrue(crawler.report["partial"])
+        self.assertEqual(crawler.report["reason"], "deadline")
+        self.assertEqual(multiprocessing.active_children(), [])
+
+    def test_partial_results(self):
+        crawler = Crawler(query=self.query, deadline=2.5)
+        started = time.monotonic()
+        links = crawler.crawl()
+        self.assertPartial(crawler, links, started)
+        self.assertEqual(
+            set(crawler.report["timings"]), {"spawn", "setup", "crawl", "transfer", "reap", "total"}
+        )
+
+    def test_acrawl_partial_results(self):
+        crawler = Crawler(query=self.query, deadline=2.5)
+        started = time.monotonic()
+        links = asyncio.run(crawler.acrawl())
+        self.assertPartial(crawler, links, started)
+
+    def test_pool_partial_results(self):
+        with CrawlerPool(size=1) as pool:
+            # Workers ready before the deadline starts
+            pool.submit({"type": "sitemaps", "sitemaps": self.query["sitemaps"][:1]}).result(timeout=60)
+            crawler = Crawler(query=self.query, deadline=2.5, pool=pool)
+            started = time.monotonic()
+            links = crawler.crawl()
+            self.assertLess(time.monotonic() - started, 4)
+            self.assertEqual(sorted(link["link"] for link in links), sorted(self.fast.article_links()))
+            self.assertEqual(crawler.report["reason"], "deadline")
+
+    def test_pool_job_waiting_at_the_deadline(self):
+        with CrawlerPool(size=1) as pool:
+            running = pool.submit(self.query, deadline=2)
+            crawler = Crawler(query=self.query, deadline=0.5, pool=pool)
+            started = time.monotonic()
+            self.assertEqual(crawler.crawl(), [])
+            self.assertLess(time.monotonic() - started, 1.5)
+            self.assertEqual(crawler.report, {"partial": True, "reason": "deadline"})
+            running.result(timeout=10)
+
+    def test_complete_crawl_is_not_partial(self):
+        crawler = Crawler(query={"type": "sitemaps", "sitemaps": self.query["sitemaps"][:1]}, deadline=30)
+        self.assertEqual(len(crawler.crawl()), 5)
+        self.assertNotIn("partial", crawler.report)
+
+
+class TestCrawlerProcessMessages(unittest.TestCase):
+
+    def test_process_exiting_without_result(self):
+        queue = multiprocessing.Queue()
+        process = multiprocessing.Process(target=_exit_silently)
+        process.start()
+        with self.assertRaises(Exception):
+            _get_message(queue, process)
+        _reap(process)
+
+    def test_deadline_and_reap(self):
+        queue = multiprocessing.Queue()
+        process = multiprocessing.Process(target=_hang)
+        process.start()
+        with self.assertRaises(_DeadlineReached):
+            _get_message(queue, process, time.time() + 0.2)
+        _reap(process, timeout=0)
+        self.assertIsNotNone(process.exitcode)
+
+    def test_phase_timings(self):
+        timings = _phase_timings(
+            {"started_at": 1.0, "crawl_started_at": 1.5, "crawl_finished_at": 3.5}, 0.5, 4.0
+        )
+        self.assertEqual(
+            [timings[phase] for phase in ("spawn", "setup", "crawl", "transfer")], [0.5, 0.5, 2.0, 0.5]
+        )
+        self.assertEqual(set(_phase_timings(None, time.time(), time.time())), {"crawl", "reap", "total"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+import asyncio
+import inspect
+import tempfile
+import unittest
+
+from scrapy import Request
+from scrapy.http import Headers, TextResponse
+from scrapy.utils.test import get_crawler
+
+from newton_scrapping.domain_cache import DomainCache, response_ttl
+from newton_scrapping.main import Crawler
+from newton_scrapping.middlewares import CachedRobotsTxtMiddleware
+from newton_scrapping.test.mock_site import MockNewsSite
+
+ROBOTS_URL = "https://example.com/robots.txt"
+
+
+class TestResponseTTL(unittest.TestCase):
+
+    def test_cache_control(self):
+        self.assertEqual(response_ttl(Headers({"Cache-Control": "public, max-age=600"})), 600)
+        self.assertEqual(response_ttl(Headers({"Cache-Control": "max-age=600, s-maxage=60"})), 60)
+        headers = Headers({"Cache-Control": "no-store", "Expires": "Wed, 21 Oct 2099 07:28:00 GMT"})
+        self.assertEqual(response_ttl(headers), 0)
+
+    def test_expires(self):
+        headers = Headers({"Date": "Wed, 21 Oct 2015 07:28:00 GMT", "Expires": "Wed, 21 Oct 2015 08:28:00 GMT"})
+        self.assertEqual(response_ttl(headers), 3600)
+        self.assertIsNone(response_ttl(Headers({"Content-Type": "text/plain"})))
+
+
+class TestDomainCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_persists_across_instances(self):
+        cache = DomainCache(self.directory.name)
+        self.assertIsNone(cache.get("sitemap", ROBOTS_URL))
+        cache.set("sitemap", ROBOTS_URL, ["https://example.com/sitemap.xml"])
+        cache.set("robots", "https://other.com/robots.txt", "rules")
+
+        cache = DomainCache(self.directory.name)
+        self.assertEqual(cache.get("sitemap", ROBOTS_URL), ["https://example.com/sitemap.xml"])
+        self.assertIsNone(cache.get("robots", ROBOTS_URL))
+        self.assertEqual(cache.get("robots", "https://other.com/robots.txt"), "rules")
+
+    def test_ttl_floor(self):
+        cache = DomainCache(self.directory.name, min_ttl=600, default_ttl=3600)
+        self.assertEqual(cache.ttl(Headers({"Cache-Control": "max-age=0"})), 600)
+        self.assertEqual(cache.ttl(Headers({"Cache-Control": "max-age=7200"})), 7200)
+        self.assertEqual(cache.ttl(), 3600)
+
+    def test_no_store_without_floor(self):
+        cache = DomainCache(self.directory.name, min_ttl=0)
+        self.assertFalse(cache.set("sitemap", ROBOTS_URL, [], Headers({"Cache-Control": "no-store"})))
+        self.assertIsNone(cache.get("sitemap", ROBOTS_URL))
+
+
+class TestCachedRobotsTxtMiddleware(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.settings = {"ROBOTSTXT_OBEY": True, "NEWTON_DOMAIN_CACHE_DIR": self.directory.name}
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_parsed_rules_are_reused(self):
+        middleware = CachedRobotsTxtMiddleware(get_crawler(settings_dict=self.settings))
+        request = Request(ROBOTS_URL, meta={"dont_obey_robotstxt": True})
+        body = b"User-agent: *\nDisallow: /private/\n"
+        middleware.process_response(request, TextResponse(ROBOTS_URL, body=body, request=request))
+
+        crawler = get_crawler(settings_dict=self.settings)
+        middleware = CachedRobotsTxtMiddleware(crawler)
+        middleware.cache = DomainCache(self.directory.name)
+        parser = middleware.robot_parser(Request("https://example.com/private/page.html"))
+        if inspect.iscoroutine(parser):
+            # Scrapy >= 2.13
+            parser = asyncio.run(parser)
+        self.assertFalse(parser.allowed("https://example.com/private/page.html", "newton"))
+        self.assertTrue(parser.allowed("https://example.com/news.html", "newton"))
+        self.assertEqual(crawler.stats.get_value("newton/domain_cache/robots_hit"), 1)
+
+
+class TestDomainCacheCrawl(unittest.TestCase):
+
+    def test_second_crawl_skips_robots_and_index(self):
+        with MockNewsSite(sitemaps=2, urls_per_sitemap=5) as site, tempfile.TemporaryDirectory() as directory:
+            query = {"type": "sitemaps", "sitemaps": [site.url + "/robots.txt"]}
+            self.assertEqual(len(Crawler(query=query, domain_cache=directory).crawl()), 10)
+            # robots.txt, the index and its 2 sitemaps
+            self.assertEqual(site.stats["requests"], 4)
+
+            site.reset_stats()
+            links = [item["link"] for item in Crawler(query=query, domain_cache=directory).crawl()]
+            self.assertEqual(sorted(links), sorted(site.article_links()))
+            self.assertEqual(site.stats["requests"], 2)
+
+    def test_settings(self):
+        settings = Crawler(query={"type": "article"}, domain_cache="cache").get_settings()
+        middlewares = settings.getdict("DOWNLOADER_MIDDLEWARES")
+        self.assertIsNone(middlewares["scrapy.downloadermiddlewares.robotstxt.RobotsTxtMiddleware"])
+        self.assertEqual(middlewares["newton_scrapping.middlewares.CachedRobotsTxtMiddleware"], 100)
+        self.assertEqual(settings.getfloat("NEWTON_DOMAIN_CACHE_MIN_TTL"), 600)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,141 @@
+import tempfile
+import unittest
+
+from scrapy import Spider
+from scrapy.http import HtmlResponse, Request, Response
+from scrapy.utils.test import get_crawler
+
+from newton_scrapping.httpcache import CompressedCacheStorage
+from newton_scrapping.middlewares import NewtonScrappingDownloaderMiddleware
+
+URL = "https://example.com/articles/test.html"
+BODY = b"<html><body>" + b"article text " * 1000 + b"</body></html>"
+
+
+class TestCompressedCacheStorage(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.storage = CompressedCacheStorage(self.directory.name)
+
+    def tearDown(self):
+        self.storage.close()
+        self.directory.cleanup()
+
+    def test_store_and_retrieve(self):
+        self.storage.store("ab12", URL, 200, {b"ETag": [b'"v1"']}, BODY)
+        entry = self.storage.retrieve("ab12")
+        self.assertEqual(entry["body"], BODY)
+        self.assertEqual(entry["etag"], '"v1"')
+        self.assertLess(self.storage.total_bytes(), len(BODY) / 10)
+        self.assertIsNone(self.storage.retrieve("cd34"))
+
+    def test_evicts_least_recently_used(self):
+        self.storage.store("aa01", URL, 200, {}, BODY)
+        size = self.storage.total_bytes()
+        self.storage.max_bytes = size * 2 + 16
+        self.storage.store("aa02", URL, 200, {}, BODY + b"2")
+        self.storage.touch("aa01")
+        self.storage.store("aa03", URL, 200, {}, BODY + b"3")
+        self.assertIsNotNone(self.storage.retrieve("aa01"))
+        self.assertIsNone(self.storage.retrieve("aa02"))
+        self.assertIsNotNone(self.storage.retrieve("aa03"))
+
+    def test_running_total(self):
+        def summed():
+            return self.storage.db.execute("SELECT SUM(size) FROM entries").fetchone()[0] or 0
+
+        self.storage.store("aa01", URL, 200, {}, BODY)
+        self.storage.store("aa02", URL, 200, {}, BODY + b"2")
+        self.storage.store("aa01", URL, 200, {}, b"replaced")
+        self.assertEqual(self.storage.total_bytes(), summed())
+        self.storage._delete("aa02")
+        self.assertEqual(self.storage.total_bytes(), summed())
+        self.storage.close()
+        self.storage = CompressedCacheStorage(self.directory.name)
+        self.assertEqual(self.storage.total_bytes(), summed())
+
+    def test_evicts_in_batches_from_the_index(self):
+        for i in range(10):
+            self.storage.store("aa%02d" % i, URL, 200, {}, BODY + bytes([i]))
+        self.storage.max_bytes = self.storage.total_bytes() // 4
+        self.storage.evict(batch_size=2)
+        self.assertLessEqual(self.storage.total_bytes(), self.storage.max_bytes)
+        self.assertIsNotNone(self.storage.retrieve("aa09"))
+        self.assertIsNone(self.storage.retrieve("aa00"))
+        plan = self.storage.db.execute(
+            "EXPLAIN QUERY PLAN SELECT fingerprint FROM entries ORDER BY accessed_at LIMIT 2"
+        ).fetchall()
+        self.assertIn("accessed_at_idx", str(plan))
+
+    def test_touch_releases_the_write_lock(self):
+        other = CompressedCacheStorage(self.directory.name)
+        other.db.execute("PRAGMA busy_timeout = 100")
+        self.storage.store("aa01", URL, 200, {}, BODY)
+        self.storage.touch("aa01")
+        other.store("aa02", URL, 200, {}, BODY)
+        other.close()
+
+    def test_retrieve_without_body(self):
+        self.storage.store("aa01", URL, 200, {}, BODY)
+        entry = self.storage.retrieve("aa01", load_body=False)
+        self.assertNotIn("body", entry)
+        self.assertEqual(self.storage.read_body("aa01"), BODY)
+
+    def test_shared_storage(self):
+        storage = CompressedCacheStorage.get(self.directory.name)
+        self.assertIs(CompressedCacheStorage.get(self.directory.name), storage)
+        storage.release()
+        storage.store("aa01", URL, 200, {}, BODY)
+        storage.release()
+        self.assertIsNot(CompressedCacheStorage.get(self.directory.name), storage)
+
+
+class TestConditionalCacheMiddleware(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        crawler = get_crawler(Spider, {
+            "NEWTON_HTTPCACHE_ENABLED": True, "NEWTON_HTTPCACHE_DIR": self.directory.name,
+        })
+        self.middleware = NewtonScrappingDownloaderMiddleware.from_crawler(crawler)
+        self.spider = Spider("test")
+
+    def tearDown(self):
+        self.middleware.cache.release()
+        self.directory.cleanup()
+
+    def test_revalidates_and_serves_cached_body_on_304(self):
+        request = Request(URL)
+        self.assertIsNone(self.middleware.process_request(request, self.spider))
+        headers = {"Content-Type": "text/html", "ETag": '"v1"', "Last-Modified": "Wed, 22 Mar 2023 10:00:00 GMT"}
+        response = HtmlResponse(URL, body=BODY, headers=headers, request=request)
+        self.middleware.process_response(request, response, self.spider)
+
+        request = Request(URL)
+        self.middleware.process_request(request, self.spider)
+        # Only decompressed once the server answers 304
+        self.assertNotIn("body", request.meta["newton_cache_entry"])
+        self.assertEqual(request.headers["If-None-Match"], b'"v1"')
+        self.assertEqual(request.headers["If-Modified-Since"], b"Wed, 22 Mar 2023 10:00:00 GMT")
+        cached = self.middleware.process_response(request, Response(URL, status=304, request=request), self.spider)
+        self.assertIsInstance(cached, HtmlResponse)
+        self.assertEqual(cached.status, 200)
+        self.assertEqual(cached.body, BODY)
+        self.assertIn("cached", cached.flags)
+
+    def test_truncated_response_is_not_stored(self):
+        request = Request(URL)
+        self.middleware.process_request(request, self.spider)
+        response = HtmlResponse(
+            URL, body=BODY[:10], headers={"ETag": '"v1"'}, request=request, flags=["download_stopped"],
+        )
+        self.assertIs(self.middleware.process_response(request, response, self.spider), response)
+        request = Request(URL)
+        self.middleware.process_request(request, self.spider)
+        self.assertNotIn("newton_cache_entry", request.meta)
+        self.assertNotIn("If-None-Match", request.headers)
+
+
+if __name__ == "__main__":
+    unittest.main()
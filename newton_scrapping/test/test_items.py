@@ -0,0 +1,58 @@
+import pickle
+import sys
+import unittest
+
+from newton_scrapping.items import ArticleRecord, Author, Image, ParsedData, SitemapBatch, SitemapEntry
+from newton_scrapping.test.helpers.constant import TEST_ARTICLES
+from newton_scrapping.test.helpers.utils import get_article_content
+from newton_scrapping.test.test_sitemap import NEWS_SITEMAP
+from newton_scrapping.sitemap import iter_sitemap
+
+
+class TestArticleRecord(unittest.TestCase):
+    def test_round_trip_test_articles(self):
+        for article in TEST_ARTICLES:
+            data = get_article_content(article["test_data_path"])[0]
+            record = ArticleRecord.from_dict(data)
+            with self.subTest(article=article["test_data_path"]):
+                self.assertEqual(record.to_dict(), data)
+                self.assertIsInstance(record.parsed_data.author[0], Author)
+                self.assertIsInstance(record.parsed_data.images[0], Image)
+                self.assertEqual(record.parsed_data.title, data["parsed_data"]["title"])
+                self.assertEqual(pickle.loads(pickle.dumps(record)), record)
+
+    def test_unknown_keys_are_kept(self):
+        data = {"title": ["Title"], "author": [{"name": "A", "sameAs": "x"}], "custom": [1]}
+        record = ParsedData.from_dict(data)
+        self.assertEqual(record.extra, {"custom": [1]})
+        self.assertEqual(record.author[0].extra, {"sameAs": "x"})
+        self.assertEqual(record.to_dict(), data)
+
+    def test_no_instance_dict(self):
+        self.assertFalse(hasattr(ParsedData(), "__dict__"))
+        self.assertFalse(hasattr(SitemapEntry("https://example.com"), "__dict__"))
+
+
+class TestSitemapBatch(unittest.TestCase):
+    def setUp(self):
+        self.entries = [{"link": node.loc, "title": node.title} for node in iter_sitemap(NEWS_SITEMAP)]
+
+    def test_round_trip(self):
+        batch = SitemapBatch.from_dicts(self.entries)
+        self.assertEqual(len(batch), len(self.entries))
+        self.assertEqual(batch.to_dicts(), self.entries)
+        self.assertEqual(batch[0], SitemapEntry.from_dict(self.entries[0]))
+        self.assertEqual([entry.to_dict() for entry in batch], self.entries)
+        self.assertEqual(batch[1:].to_dicts(), self.entries[1:])
+        self.assertEqual(pickle.loads(pickle.dumps(batch)), batch)
+
+    def test_smaller_than_dicts(self):
+        entries = [{"link": f"https://example.com/{i}", "title": None} for i in range(1000)]
+        batch = SitemapBatch.from_dicts(entries)
+        dicts_size = sum(sys.getsizeof(entry) for entry in entries) + sys.getsizeof(entries)
+        batch_size = sys.getsizeof(batch.links) + sys.getsizeof(batch.titles)
+        self.assertLess(batch_size * 5, dicts_size)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+import multiprocessing
+import time
+import unittest
+
+from newton_scrapping.main import Crawler
+from newton_scrapping.test.helpers.spiders import MockCrawler
+from newton_scrapping.test.mock_site import MockNewsSite
+
+
+class TestIterCrawl(unittest.TestCase):
+
+    def setUp(self):
+        self.site = MockNewsSite(sitemaps=1, urls_per_sitemap=20).start()
+        self.addCleanup(self.site.stop)
+        self.query = {"type": "articles", "links": self.site.article_links(), "concurrency": 1}
+
+    def test_items_arrive_before_the_crawl_ends(self):
+        with MockNewsSite(sitemaps=1, urls_per_sitemap=5, latency=5) as slow:
+            query = {
+                "type": "sitemaps",
+                "sitemaps": [self.site.url + "/sitemaps/news-0.xml.gz", slow.url + "/sitemaps/news-0.xml.gz"],
+            }
+            crawler = Crawler(query=query)
+            started = time.monotonic()
+            items = crawler.iter_crawl()
+            first = next(items)
+            # The slow site is still being crawled
+            self.assertLess(time.monotonic() - started, 5)
+            self.assertNotEqual(multiprocessing.active_children(), [])
+            self.assertEqual(crawler.report, {})
+            links = [first["link"]] + [item["link"] for item in items]
+        self.assertEqual(sorted(links), sorted(self.site.article_links() + slow.article_links()))
+
+    def test_bounded_buffer_applies_backpressure(self):
+        items = MockCrawler(query=self.query).iter_crawl(buffer_size=1)
+        results = dict([next(items)])
+        time.sleep(2)
+        # The crawler waits for the consumer instead of fetching all the links
+        self.assertLess(self.site.stats["requests"], 10)
+        results.update(items)
+        self.assertEqual(sorted(results), sorted(self.site.article_links()))
+        self.assertTrue(all("data" in result for result in results.values()))
+
+    def test_end_message_ends_the_iteration(self):
+        crawler = MockCrawler(query=self.query)
+        results = list(crawler.iter_crawl())
+        self.assertEqual(len(results), len(self.site.article_links()))
+        self.assertTrue(all(isinstance(result, tuple) for result in results))
+        self.assertNotIn("partial", crawler.report)
+        self.assertIn("timings", crawler.report)
+        self.assertEqual(multiprocessing.active_children(), [])
+
+    def test_stopping_early_terminates_the_crawl(self):
+        crawler = MockCrawler(query=self.query)
+        items = crawler.iter_crawl(buffer_size=1)
+        next(items)
+        started = time.monotonic()
+        items.close()
+        self.assertLess(time.monotonic() - started, 2)
+        self.assertEqual(multiprocessing.active_children(), [])
+        self.assertIn("timings", crawler.report)
+        requests = self.site.stats["requests"]
+        time.sleep(1)
+        self.assertEqual(self.site.stats["requests"], requests)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,155 @@
+import unittest
+
+from scrapy import Request
+from scrapy.exceptions import StopDownload
+from scrapy.http import Headers
+from scrapy.signalmanager import SignalManager
+from twisted.internet.task import Clock
+
+from newton_scrapping.main import Crawler
+from newton_scrapping.memory import (DEFAULT_SIZE_LIMITS, MemoryWatchdog, ResponseSizeLimiter,
+                                     memory_pressure, size_limit)
+from newton_scrapping.test.mock_site import MockNewsSite
+
+
+class FakeStats(dict):
+    def inc_value(self, key, count=1):
+        self[key] = self.get(key, 0) + count
+
+    def max_value(self, key, value):
+        self[key] = max(self.get(key, value), value)
+
+
+class FakeEngine:
+    def __init__(self):
+        self.paused = False
+        self.closed = None
+
+    def pause(self):
+        self.paused = True
+
+    def unpause(self):
+        self.paused = False
+
+    def close_spider(self, spider, reason):
+        self.closed = reason
+
+
+class FakeCrawler:
+    def __init__(self):
+        self.stats = FakeStats()
+        self.signals = SignalManager()
+        self.engine = FakeEngine()
+        self.spider = None
+
+
+class TestSizeLimit(unittest.TestCase):
+
+    def test_lookup(self):
+        self.assertEqual(size_limit(DEFAULT_SIZE_LIMITS, b"text/html; charset=utf-8"), DEFAULT_SIZE_LIMITS["text/html"])
+        self.assertEqual(size_limit(DEFAULT_SIZE_LIMITS, "image/jpeg"), 0)
+        self.assertEqual(size_limit(DEFAULT_SIZE_LIMITS, None), DEFAULT_SIZE_LIMITS["*"])
+        self.assertIsNone(size_limit({"text/html": 10}, "application/json"))
+
+
+class TestResponseSizeLimiter(unittest.TestCase):
+
+    def setUp(self):
+        self.stats = FakeStats()
+        self.limiter = ResponseSizeLimiter({"text/html": 10, "application/json": 10}, self.stats)
+
+    def receive(self, content_type, chunks, body_length=0):
+        request = Request("https://example.com/")
+        self.limiter.headers_received(Headers({"Content-Type": content_type}), body_length, request, None)
+        for chunk in chunks:
+            self.limiter.bytes_received(chunk, request, None)
+
+    def test_html_is_truncated(self):
+        self.receive("text/html", [b"12345"])
+        with self.assertRaises(StopDownload) as context:
+            self.receive("text/html", [b"123456", b"789012"])
+        self.assertFalse(context.exception.fail)
+        self.assertEqual(self.stats["newton/response_size/truncated"], 1)
+
+    def test_other_content_is_dropped(self):
+        with self.assertRaises(StopDownload) as context:
+            self.receive("application/json", [b"123456789012"])
+        self.assertTrue(context.exception.fail)
+        # Dropped before its body when the Content-Length is over the limit
+        with self.assertRaises(StopDownload):
+            self.receive("application/json", [], body_length=11)
+        self.assertEqual(self.stats["newton/response_size/dropped"], 2)
+
+    def test_unlimited_type(self):
+        self.receive("text/plain", [b"x" * 100])
+        self.assertEqual(self.stats, {})
+
+
+class TestMemoryWatchdog(unittest.TestCase):
+
+    def test_pressure_pauses_and_signals(self):
+        crawler = FakeCrawler()
+        pressures = []
+        crawler.signals.connect(lambda rss: pressures.append(rss), signal=memory_pressure, weak=False)
+        clock = Clock()
+        MemoryWatchdog(crawler, limit=1, hard_limit=1 << 50, pause=0.5, clock=clock).check()
+        self.assertTrue(crawler.engine.paused)
+        self.assertEqual(len(pressures), 1)
+        self.assertEqual(crawler.stats["newton/memory/pressure"], 1)
+        self.assertIsNone(crawler.engine.closed)
+        clock.advance(0.5)
+        self.assertFalse(crawler.engine.paused)
+
+    def test_hard_limit_closes_spider(self):
+        crawler = FakeCrawler()
+        MemoryWatchdog(crawler, limit=1, hard_limit=1, clock=Clock()).check()
+        self.assertEqual(crawler.engine.closed, "memory_limit")
+
+    def test_below_limit(self):
+        crawler = FakeCrawler()
+        MemoryWatchdog(crawler, limit=1 << 50, hard_limit=1 << 50, clock=Clock()).check()
+        self.assertFalse(crawler.engine.paused)
+        self.assertIn("newton/memory/max_rss", crawler.stats)
+
+
+class TestCrawlLimits(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.site = MockNewsSite(sitemaps=1, urls_per_sitemap=50).start()
+        cls.sitemaps = [cls.site.url + "/sitemaps/news-0.xml.gz"]
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.site.stop()
+
+    def test_max_items(self):
+        crawler = Crawler(query={"type": "sitemaps", "sitemaps": self.sitemaps, "max_items": 10})
+        self.assertEqual(len(crawler.crawl()), 10)
+        self.assertTrue(crawler.report["partial"])
+        self.assertEqual(crawler.report["reason"], "max_items")
+
+    def test_max_bytes(self):
+        crawler = Crawler(query={"type": "sitemaps", "sitemaps": self.sitemaps, "max_bytes": 1})
+        crawler.crawl()
+        self.assertEqual(crawler.report["reason"], "max_bytes")
+
+    def test_max_rss_streams_items(self):
+        crawler = Crawler(query={"type": "sitemaps", "sitemaps": self.sitemaps}, max_rss_mb=1 << 20)
+        self.assertEqual(len(crawler.crawl()), 50)
+        self.assertNotIn("partial", crawler.report)
+
+    def test_settings(self):
+        settings = Crawler(query={"type": "article"}, max_rss_mb=512).get_settings()
+        self.assertEqual(settings.getdict("EXTENSIONS")["newton_scrapping.memory.MemoryWatchdog"], 100)
+        self.assertEqual(settings.getfloat("NEWTON_MEMORY_LIMIT_MB"), 512)
+        self.assertNotIn("newton_scrapping.memory.ResponseSizeLimiter", settings.getdict("EXTENSIONS"))
+        limited = Crawler(query={"type": "article"}, response_size_limits=DEFAULT_SIZE_LIMITS).get_settings()
+        self.assertEqual(limited.getdict("EXTENSIONS")["newton_scrapping.memory.ResponseSizeLimiter"], 100)
+        self.assertEqual(limited.getdict("NEWTON_RESPONSE_SIZE_LIMITS"), DEFAULT_SIZE_LIMITS)
+        disabled = Crawler(query={"type": "article"}, response_size_limits={}).get_settings()
+        self.assertNotIn("newton_scrapping.memory.ResponseSizeLimiter", disabled.getdict("EXTENSIONS"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+import json
+import os
+import tempfile
+import unittest
+
+from newton_scrapping.metrics import CrawlMetrics, Histogram
+
+
+class TestHistogram(unittest.TestCase):
+    def test_quantiles(self):
+        histogram = Histogram(buckets=(1.0, 2.0, 4.0))
+        for value in (0.5, 1.5, 1.5, 3.0, 10.0):
+            histogram.observe(value)
+        self.assertEqual(histogram.counts, [1, 2, 1, 1])
+        self.assertEqual(histogram.count, 5)
+        self.assertAlmostEqual(histogram.sum, 16.5)
+        self.assertAlmostEqual(histogram.quantile(0.5), 1.75)
+        self.assertEqual(histogram.quantile(1.0), 4.0)
+        self.assertIsNone(Histogram().quantile(0.5))
+
+
+class TestCrawlMetrics(unittest.TestCase):
+    def setUp(self):
+        self.metrics = CrawlMetrics()
+        self.metrics.observe("download", 0.2)
+        self.metrics.add_items("parse", 1)
+        self.metrics.add_request("example.com")
+        self.metrics.add_error("example.com", "503")
+        self.metrics.bytes_in = 100
+
+    def test_merge(self):
+        other = CrawlMetrics()
+        other.merge(self.metrics)
+        other.merge(self.metrics)
+        summary = other.summary()
+        self.assertEqual(summary["download_seconds"]["count"], 2)
+        self.assertEqual(summary["items"], {"parse": 2})
+        self.assertEqual(summary["errors"], {"example.com": {"503": 2}})
+        self.assertEqual(summary["bytes_in"], 200)
+
+    def test_prometheus(self):
+        text = self.metrics.to_prometheus()
+        self.assertIn('newton_crawl_download_seconds_bucket{le="0.25"} 1\n', text)
+        self.assertIn('newton_crawl_download_seconds_bucket{le="+Inf"} 1\n', text)
+        self.assertIn('newton_crawl_errors_total{domain="example.com",reason="503"} 1\n', text)
+        self.assertIn("newton_crawl_bytes_in_total 100\n", text)
+
+    def test_write(self):
+        with tempfile.TemporaryDirectory() as directory:
+            summary = self.metrics.write(directory)
+            self.assertTrue(os.path.exists(summary["files"]["prometheus"]))
+            with open(summary["files"]["json"]) as f:
+                self.assertEqual(json.load(f)["requests"], {"example.com": 1})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,50 @@
+import unittest
+import urllib.error
+import urllib.request
+
+from newton_scrapping.sitemap import iter_sitemap
+from newton_scrapping.test.mock_site import MockNewsSite
+
+
+def fetch(url):
+    try:
+        with urllib.request.urlopen(url) as response:
+            return response.status, response.headers, response.read()
+    except urllib.error.HTTPError as error:
+        return error.code, error.headers, error.read()
+
+
+class TestMockNewsSite(unittest.TestCase):
+    def test_sitemaps_and_articles(self):
+        with MockNewsSite(sitemaps=2, urls_per_sitemap=3) as site:
+            status, _, body = fetch(f"{site.url}/sitemap.xml")
+            self.assertEqual(status, 200)
+            children = list(iter_sitemap(body))
+            self.assertEqual([node.kind for node in children], ["sitemap", "sitemap"])
+
+            status, _, body = fetch(children[1].loc)
+            self.assertEqual(status, 200)
+            urls = list(iter_sitemap(body))
+            self.assertEqual([node.loc for node in urls], site.article_links()[3:])
+            self.assertEqual(urls[0].lastmod, site.sitemap_date(1))
+            self.assertEqual(urls[0].title, "Article 1-0")
+
+            status, headers, body = fetch(urls[0].loc)
+            self.assertEqual(status, 200)
+            self.assertIn("text/html", headers["Content-Type"])
+            self.assertIn(body, site.pages)
+
+            self.assertEqual(fetch(f"{site.url}/missing")[0], 404)
+            self.assertEqual(site.stats["requests"], 4)
+
+    def test_rate_limit_and_errors(self):
+        with MockNewsSite(rate_limit_rate=1.0, retry_after=7) as site:
+            status, headers, _ = fetch(f"{site.url}/sitemap.xml")
+            self.assertEqual(status, 429)
+            self.assertEqual(headers["Retry-After"], "7")
+        with MockNewsSite(error_rate=1.0) as site:
+            self.assertEqual(fetch(f"{site.url}/sitemap.xml")[0], 503)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,216 @@
+import os
+import random
+import tempfile
+import time
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from scrapy.exceptions import DropItem
+from scrapy.settings import Settings
+from twisted.internet import defer, task
+
+from newton_scrapping.near_duplicates import NearDuplicateIndex, article_text, article_url, shingle_hashes
+from newton_scrapping.pipelines import NearDuplicatePipeline
+from newton_scrapping.test.helpers.constant import TEST_ARTICLES
+from newton_scrapping.test.helpers.spiders import MockCrawler
+from newton_scrapping.test.helpers.utils import get_article_content
+from newton_scrapping.test.mock_site import MockNewsSite
+
+
+def random_text(generator, words=300):
+    return " ".join(f"word{generator.randrange(5000)}" for _ in range(words))
+
+
+def edit(generator, text, changes):
+    words = text.split()
+    for position in generator.sample(range(len(words)), changes):
+        words[position] = "edited"
+    return " ".join(words)
+
+
+class TestNearDuplicateIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "near_duplicates.sqlite3")
+        self.index = NearDuplicateIndex(self.path)
+        self.random = random.Random(0)
+
+    def tearDown(self):
+        self.index.close()
+        self.directory.cleanup()
+
+    def test_shingles_ignore_case_and_punctuation(self):
+        self.assertEqual(
+            shingle_hashes("One, two three. Four five six!").tolist(),
+            shingle_hashes("one two three four five SIX").tolist(),
+        )
+        self.assertEqual(len(shingle_hashes("one two", size=5)), 1)
+        self.assertEqual(len(shingle_hashes(" ... ")), 0)
+
+    def test_batch_signatures_match_single(self):
+        texts = [random_text(self.random, words) for words in (3, 300, 2000)] + [""]
+        signatures = self.index.signatures(texts)
+        for text, signature in zip(texts, signatures):
+            self.assertEqual(self.index.signatures([text])[0].tolist(), signature.tolist())
+        self.assertTrue(self.index.is_empty(signatures[-1]))
+
+    def test_finds_edited_copies_only(self):
+        original = random_text(self.random)
+        results = self.index.check_many([
+            ("https://a.example.com/story", original),
+            ("https://b.example.com/story", edit(self.random, original, 3)),
+            ("https://c.example.com/other", random_text(self.random)),
+            ("https://d.example.com/empty", ""),
+        ])
+        self.assertIsNone(results[0])
+        self.assertEqual(results[1][0], "https://a.example.com/story")
+        self.assertGreater(results[1][1], 0.8)
+        self.assertIsNone(results[2])
+        self.assertIsNone(results[3])
+        self.assertEqual(len(self.index), 2)
+
+    def test_same_url_is_not_a_duplicate(self):
+        text = random_text(self.random)
+        self.assertEqual(self.index.check_many([("https://example.com/a", text)] * 2), [None, None])
+        self.assertEqual(len(self.index), 1)
+
+    def test_persists_between_runs(self):
+        text = random_text(self.random)
+        self.index.check_many([("https://a.example.com/story", text)])
+        self.index.close()
+        self.index = NearDuplicateIndex(self.path, seed=2)
+        (duplicate,) = self.index.check_many([("https://b.example.com/story", text)])
+        self.assertEqual(duplicate, ("https://a.example.com/story", 1.0))
+        with self.assertRaises(ValueError):
+            NearDuplicateIndex(self.path, num_perm=64)
+
+    def test_compact_evicts_expired_and_extra_entries(self):
+        self.index.ttl = 60
+        self.index.max_entries = 2
+        self.index.check_many([("https://example.com/expired", random_text(self.random))])
+        self.index.db.execute("UPDATE documents SET added_at = ?", (time.time() - 120,))
+        self.index.check_many([(f"https://example.com/{i}", random_text(self.random)) for i in range(3)])
+        self.index.compact()
+        urls = [url for (url,) in self.index.db.execute("SELECT url FROM documents ORDER BY id")]
+        self.assertEqual(urls, ["https://example.com/1", "https://example.com/2"])
+        (buckets,) = self.index.db.execute("SELECT COUNT(*) FROM buckets").fetchone()
+        self.assertEqual(buckets, 2 * self.index.bands)
+
+    def test_candidates_are_capped(self):
+        signature = self.index.signatures([random_text(self.random)])[0]
+        # Share the first band only
+        for i in range(5):
+            other = self.index.signatures([random_text(self.random)])[0]
+            other[:self.index.rows] = signature[:self.index.rows]
+            self.index.add(f"https://example.com/{i}", other)
+        self.index.add("https://example.com/copy", signature)
+        self.index.max_candidates = 2
+        keys = self.index.bucket_keys(signature[None])[0]
+        candidates = self.index.candidates(keys)
+        self.assertEqual(len(candidates), 2)
+        self.assertEqual(candidates[0][0], "https://example.com/copy")
+        self.assertEqual(len(self.index.candidates(keys, "https://example.com/copy")), 2)
+        self.assertEqual(self.index.find(signature), ("https://example.com/copy", 1.0))
+
+
+class TestNearDuplicatePipeline(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.article = get_article_content(TEST_ARTICLES[1]["test_data_path"])[0]
+        # Batches are checked right away instead of on a thread of the reactor pool
+        patcher = mock.patch(
+            "twisted.internet.threads.deferToThread", side_effect=lambda f, *args: defer.maybeDeferred(f, *args)
+        )
+        self.deferToThread = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def pipeline(self, action, batch_size=64):
+        crawler = self.crawler(action)
+        crawler.settings.set("NEWTON_NEAR_DUPLICATE_BATCH_SIZE", batch_size)
+        pipeline = NearDuplicatePipeline.from_crawler(crawler)
+        pipeline.clock = task.Clock()
+        return pipeline
+
+    @staticmethod
+    def result(deferred):
+        results = []
+        # Keeps the result in the deferred
+        deferred.addBoth(lambda result: results.append(result) or result)
+        return results[0] if results else None
+
+    def crawler(self, action):
+        return SimpleNamespace(
+            settings=Settings({
+                "NEWTON_NEAR_DUPLICATE_INDEX": os.path.join(self.directory.name, "near_duplicates.sqlite3"),
+                "NEWTON_NEAR_DUPLICATE_ACTION": action,
+            }),
+            stats=None,
+        )
+
+    def syndicated_copy(self):
+        return {
+            "parsed_json": {"main": [{"@type": "NewsArticle", "url": "https://syndication.example.com/copy"}]},
+            "parsed_data": dict(self.article["parsed_data"]),
+        }
+
+    def test_article_url_and_text(self):
+        self.assertTrue(article_url(self.article).startswith("https://indianexpress.com/article/"))
+        self.assertEqual(article_url({"link": "https://example.com/a"}), "https://example.com/a")
+        self.assertEqual(article_url({"raw_response": {"url": "https://example.com/b"}}), "https://example.com/b")
+        self.assertTrue(article_text(self.article).startswith(self.article["parsed_data"]["title"][0]))
+
+    def test_tag_then_drop(self):
+        pipeline = self.pipeline("tag")
+        original = pipeline.process_item(self.article, None)
+        copy = pipeline.process_item(self.syndicated_copy(), None)
+        # Checked together once the batch delay is over
+        self.assertIsNone(self.result(original))
+        pipeline.clock.advance(pipeline.batch_delay)
+        self.assertEqual(self.deferToThread.call_count, 1)
+        self.assertNotIn("near_duplicate", self.result(original))
+        self.assertEqual(self.result(copy)["near_duplicate"], {"url": article_url(self.article), "similarity": 1.0})
+        pipeline.close_spider(None)
+
+        pipeline = self.pipeline("drop", batch_size=1)
+        # A full batch is checked right away
+        deferred = pipeline.process_item(self.syndicated_copy(), None)
+        self.assertIsInstance(self.result(deferred).value, DropItem)
+        deferred.addErrback(lambda failure: None)
+        pipeline.close_spider(None)
+
+    def test_other_items_pass_through(self):
+        pipeline = self.pipeline("tag")
+        item = {"link": "https://example.com/sitemap-entry"}
+        self.assertIs(pipeline.process_item(item, None), item)
+        pipeline.close_spider(None)
+
+    def test_close_checks_the_buffered_articles(self):
+        pipeline = self.pipeline("tag")
+        deferred = pipeline.process_item(self.article, None)
+        pipeline.close_spider(None)
+        self.assertIs(self.result(deferred), self.article)
+        self.assertFalse(pipeline.clock.getDelayedCalls())
+
+
+class TestNearDuplicateCrawl(unittest.TestCase):
+
+    def test_recrawled_article_without_json_ld_url(self):
+        with tempfile.TemporaryDirectory() as directory, MockNewsSite(sitemaps=1, urls_per_sitemap=1) as site:
+            link = site.article_links()[0]
+            for _ in range(2):
+                crawler = MockCrawler(
+                    query={"type": "article", "link": link},
+                    near_duplicates=os.path.join(directory, "near_duplicates.sqlite3"),
+                )
+                (article,) = crawler.crawl()
+                # Keyed by the response URL, not flagged as a copy of itself
+                self.assertEqual(article["raw_response"]["url"], link)
+                self.assertNotIn("near_duplicate", article)
+
+
+if __name__ == "__main__":
+    unittest.main()
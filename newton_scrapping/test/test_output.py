@@ -0,0 +1,140 @@
+import gzip
+import json
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from scrapy.settings import Settings
+
+from newton_scrapping.output import BulkWriter, pyarrow
+from newton_scrapping.pipelines import BulkOutputPipeline
+
+
+def read_jsonl(paths):
+    records = []
+    for path in paths:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            records.extend(json.loads(line) for line in f)
+    return records
+
+
+class TestBulkWriter(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def test_jsonl_round_trip(self):
+        writer = BulkWriter(self.directory.name, batch_size=2)
+        records = [{"link": f"https://example.com/{index}", "content": b"\x00\x01"} for index in range(5)]
+        for record in records:
+            writer.write(record)
+        files = writer.close()
+        self.assertEqual(len(files), 1)
+        self.assertEqual(writer.records, 5)
+        self.assertEqual(
+            read_jsonl(files),
+            [{"link": record["link"], "content": "AAE="} for record in records],
+        )
+
+    def test_rotates_by_size_without_partial_files(self):
+        writer = BulkWriter(self.directory.name, batch_size=1, rotate_bytes=50)
+        for index in range(10):
+            writer.write({"title": "x" * 60, "index": index})
+        files = writer.close()
+        self.assertEqual(len(files), 10)
+        self.assertEqual(sorted(os.listdir(self.directory.name)), sorted(os.path.basename(f) for f in files))
+        self.assertEqual([record["index"] for record in read_jsonl(files)], list(range(10)))
+
+    def test_shared_writer(self):
+        first = BulkWriter.get(self.directory.name)
+        second = BulkWriter.get(self.directory.name)
+        self.assertIs(first, second)
+        first.write({"index": 1})
+        first.release()
+        self.assertEqual(first.files, [])
+        second.write({"index": 2})
+        second.release()
+        self.assertEqual(read_jsonl(first.files), [{"index": 1}, {"index": 2}])
+        self.assertIsNot(BulkWriter.get(self.directory.name), first)
+        BulkWriter.get(self.directory.name).release()
+        BulkWriter.get(self.directory.name).release()
+
+    def test_unknown_format(self):
+        with self.assertRaises(ValueError):
+            BulkWriter(self.directory.name, format="csv")
+
+    @unittest.skipUnless(pyarrow, "pyarrow is not installed")
+    def test_parquet(self):
+        import pyarrow.parquet
+
+        writer = BulkWriter(self.directory.name, format="parquet", batch_size=2)
+        for index in range(3):
+            writer.write({
+                "link": f"https://example.com/{index}", "index": index, "paywall": False, "tags": ["a", "b"],
+                "parsed_data": {"title": ["T"], "author": [{"@type": "Person", "name": "N"}]},
+            })
+        files = writer.close()
+        self.assertEqual(len(files), 1)
+        table = pyarrow.parquet.read_table(files[0])
+        self.assertEqual(table.num_rows, 3)
+        self.assertEqual(table.schema.field("index").type, pyarrow.int64())
+        self.assertEqual(table.schema.field("paywall").type, pyarrow.bool_())
+        self.assertEqual(table.schema.field("tags").type, pyarrow.list_(pyarrow.string()))
+        self.assertTrue(pyarrow.types.is_struct(table.schema.field("parsed_data").type))
+        self.assertEqual(
+            table.column("parsed_data").to_pylist()[2],
+            {"title": ["T"], "author": [{"@type": "Person", "name": "N"}]},
+        )
+
+    @unittest.skipUnless(pyarrow, "pyarrow is not installed")
+    def test_parquet_schema_changes(self):
+        import pyarrow.parquet
+
+        writer = BulkWriter(self.directory.name, format="parquet", batch_size=2)
+        # Fits the schema of the first batch: a missing column and null values
+        for record in ({"link": "a", "index": 1, "extra": {"a": 1}}, {"link": "b", "index": 2, "extra": None},
+                       {"link": "c", "extra": None}, {"link": "d", "extra": {}}):
+            writer.write(record)
+        # Mixed types are kept as JSON, in a file of their own
+        writer.write({"link": "e", "index": "5"})
+        writer.write({"link": "f", "index": 6})
+        files = writer.close()
+        self.assertEqual(len(files), 2)
+        first = pyarrow.parquet.read_table(files[0])
+        self.assertEqual(first.column("index").to_pylist(), [1, 2, None, None])
+        self.assertEqual(first.column("extra").to_pylist(), [{"a": 1}, None, None, {"a": None}])
+        self.assertEqual(pyarrow.parquet.read_table(files[1]).column("index").to_pylist(), ["5", "6"])
+
+
+class TestBulkOutputPipeline(unittest.TestCase):
+    def test_pipeline(self):
+        with tempfile.TemporaryDirectory() as directory:
+            crawler = SimpleNamespace(settings=Settings({"NEWTON_OUTPUT_DIR": directory}))
+            pipeline = BulkOutputPipeline.from_crawler(crawler)
+            pipeline.open_spider(None)
+            item = {"link": "https://example.com/a", "title": "A"}
+            self.assertIs(pipeline.process_item(item, None), item)
+            pipeline.close_spider(None)
+            BulkOutputPipeline.write_items(crawler, [{"link": "https://example.com/b", "title": "B"}])
+            self.assertEqual(len(crawler.newton_output_files), 2)
+            self.assertEqual(
+                [record["title"] for record in read_jsonl(crawler.newton_output_files)], ["A", "B"]
+            )
+
+    def test_write_items_does_not_connect_signals(self):
+        with tempfile.TemporaryDirectory() as directory:
+            signals = mock.Mock()
+            crawler = SimpleNamespace(
+                settings=Settings({"NEWTON_OUTPUT_DIR": directory, "NEWTON_MEMORY_LIMIT_MB": 512}), signals=signals,
+            )
+            BulkOutputPipeline.from_crawler(crawler)
+            self.assertEqual(signals.connect.call_count, 1)
+            for _ in range(3):
+                BulkOutputPipeline.write_items(crawler, [{"link": "https://example.com/a"}])
+            self.assertEqual(signals.connect.call_count, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+import os
+import signal
+import unittest
+
+from newton_scrapping.main import Crawler
+from newton_scrapping.pool import CrawlerPool
+from newton_scrapping.test.mock_site import MockNewsSite
+
+
+class TestCrawlerPool(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.site = MockNewsSite(sitemaps=1, urls_per_sitemap=5, latency=0.3).start()
+        cls.query = {"type": "sitemaps", "sitemaps": [cls.site.url + "/sitemaps/news-0.xml.gz"]}
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.site.stop()
+
+    def test_submit(self):
+        with CrawlerPool(size=2) as pool:
+            futures = [pool.submit(self.query) for _ in range(3)]
+            for future in futures:
+                links = [item["link"] for item in future.result(timeout=60)]
+                self.assertEqual(sorted(links), sorted(self.site.article_links()))
+
+    def test_report(self):
+        missing = self.site.url + "/sitemaps/missing.xml"
+        query = {"type": "sitemaps", "sitemaps": self.query["sitemaps"] + [missing]}
+        with CrawlerPool(size=1) as pool:
+            crawler = Crawler(query=query, pool=pool)
+            self.assertEqual(len(crawler.crawl()), 5)
+        # Sharded crawls retry the failed sitemaps of the report
+        self.assertEqual(crawler.report["failed_sitemaps"], [missing])
+
+    def test_recycling(self):
+        with CrawlerPool(size=1, max_jobs_per_worker=1) as pool:
+            first_pid = pool._workers[0].pid
+            self.assertEqual(len(pool.submit(self.query).result(timeout=60)), 5)
+            self.assertEqual(len(pool.submit(self.query).result(timeout=60)), 5)
+            self.assertNotEqual(pool._workers[0].pid, first_pid)
+
+    def test_worker_crash_fails_its_job(self):
+        with CrawlerPool(size=1) as pool:
+            future = pool.submit(self.query)
+            # Killed before it could even take the job
+            (pid,) = pool._running
+            os.kill(pid, signal.SIGKILL)
+            with self.assertRaisesRegex(Exception, "exited with code"):
+                future.result(timeout=60)
+            # Replaced by a new worker
+            self.assertEqual(len(pool.submit(self.query).result(timeout=60)), 5)
+
+    def test_close_waits_for_running_jobs(self):
+        pool = CrawlerPool(size=1)
+        running = pool.submit(self.query)
+        queued = pool.submit(self.query)
+        pool.close(timeout=60)
+        self.assertEqual(len(running.result(timeout=0)), 5)
+        with self.assertRaisesRegex(Exception, "before the job started"):
+            queued.result(timeout=0)
+        with self.assertRaises(RuntimeError):
+            pool.submit(self.query)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,50 @@
+import os
+import pstats
+import tempfile
+import time
+import unittest
+
+from newton_scrapping.profiling import CrawlProfiler
+
+
+def busy(seconds):
+    deadline = time.perf_counter() + seconds
+    data = []
+    while time.perf_counter() < deadline:
+        data.append(sum(range(1000)))
+    return data
+
+
+class TestCrawlProfiler(unittest.TestCase):
+    def test_cprofile_with_memory(self):
+        with tempfile.TemporaryDirectory() as directory:
+            profiler = CrawlProfiler(directory, memory=True)
+            profiler.start()
+            busy(0.05)
+            files = profiler.stop()
+            self.assertEqual(set(files), {"pstats", "allocations"})
+            stats = pstats.Stats(files["pstats"])
+            self.assertTrue(any(function[2] == "busy" for function in stats.stats))
+            with open(files["allocations"]) as f:
+                self.assertTrue(f.readline().startswith("current:"))
+
+    def test_sampling(self):
+        with tempfile.TemporaryDirectory() as directory:
+            profiler = CrawlProfiler(directory, mode="sampling", interval=0.001)
+            profiler.start()
+            busy(0.1)
+            files = profiler.stop()
+            self.assertEqual(set(files), {"collapsed"})
+            with open(files["collapsed"]) as f:
+                lines = f.read().splitlines()
+            self.assertTrue(any("busy (test_profiling.py" in line for line in lines))
+            self.assertTrue(all(line.rsplit(" ", 1)[1].isdigit() for line in lines))
+            self.assertTrue(os.path.dirname(files["collapsed"]) == os.path.abspath(directory))
+
+    def test_unknown_mode(self):
+        with self.assertRaises(ValueError):
+            CrawlProfiler("profiles", mode="perf")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,128 @@
+import os
+import tempfile
+import time
+import unittest
+
+from scrapy import Request, Spider
+
+from newton_scrapping.main import Crawler
+from newton_scrapping.resume import CrawlCheckpoint, query_digest
+from newton_scrapping.test.mock_site import MockNewsSite
+
+QUERY = {"type": "sitemaps", "sitemaps": ["https://example.com/sitemap.xml"]}
+
+
+class CheckpointSpider(Spider):
+    name = "checkpoint"
+
+    def parse_sitemap(self, response):
+        pass
+
+
+class TestCrawlCheckpoint(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "job")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_items_count_once_their_response_is_done(self):
+        checkpoint = CrawlCheckpoint(self.path)
+        self.assertEqual(checkpoint.begin(QUERY), "new")
+        checkpoint.add_item({"link": "a"}, "https://example.com/1.xml")
+        checkpoint.add_item({"link": "b"}, "https://example.com/2.xml")
+        checkpoint.item_done("https://example.com/1.xml")
+        checkpoint.mark_done(["https://example.com/1.xml"], "https://example.com/1.xml", items=1)
+        # Waits for its second item
+        checkpoint.mark_done(["https://example.com/2.xml"], "https://example.com/2.xml", items=2)
+        checkpoint.item_done("https://example.com/2.xml")
+        self.assertEqual(checkpoint.items(), [{"link": "a"}])
+        self.assertEqual(checkpoint.finish(True)["status"], "finished")
+
+        checkpoint = CrawlCheckpoint(self.path)
+        self.assertEqual(checkpoint.begin(QUERY), "finished")
+        self.assertEqual(checkpoint.items(), [{"link": "a"}])
+        checkpoint.close()
+
+    def test_crash_keeps_the_last_commit(self):
+        spider = CheckpointSpider()
+        checkpoint = CrawlCheckpoint(self.path, commit_interval=3600)
+        checkpoint.begin(QUERY)
+        checkpoint.add_request(Request("https://example.com/1.xml", callback=spider.parse_sitemap), spider)
+        checkpoint.commit()
+        checkpoint.add_item({"link": "a"}, "https://example.com/1.xml")
+        checkpoint.mark_done(["https://example.com/1.xml"], "https://example.com/1.xml")
+
+        # The process dies, the changes since the last commit are lost
+        checkpoint.db.close()
+        resumed = CrawlCheckpoint(self.path)
+        self.assertEqual(resumed.begin(QUERY), "running")
+        self.assertTrue(resumed.resumed)
+        self.assertEqual(resumed.items(), [])
+        self.assertTrue(resumed.is_known("https://example.com/1.xml"))
+        pending = resumed.pending_requests(spider)
+        self.assertEqual([request.url for request in pending], ["https://example.com/1.xml"])
+        self.assertEqual(pending[0].callback, spider.parse_sitemap)
+        self.assertEqual(resumed.finish(True)["status"], "stopped")
+
+    def test_freeze(self):
+        checkpoint = CrawlCheckpoint(self.path)
+        checkpoint.begin(QUERY)
+        checkpoint.add_item({"link": "a"}, "https://example.com/1.xml")
+        checkpoint.freeze()
+        checkpoint.mark_done(["https://example.com/1.xml"], "https://example.com/1.xml")
+        self.assertEqual(checkpoint.items(), [])
+        checkpoint.close()
+
+    def test_other_query_resets(self):
+        checkpoint = CrawlCheckpoint(self.path)
+        checkpoint.begin(QUERY)
+        checkpoint.add_item({"link": "a"})
+        checkpoint.finish(False)
+
+        checkpoint = CrawlCheckpoint(self.path)
+        self.assertEqual(checkpoint.begin({**QUERY, "max_items": 10}), "stopped")
+        checkpoint.finish(False)
+
+        checkpoint = CrawlCheckpoint(self.path)
+        self.assertEqual(checkpoint.begin({**QUERY, "since": "2022-03-01"}), "new")
+        self.assertEqual(checkpoint.items(), [])
+        checkpoint.close()
+
+    def test_query_digest(self):
+        self.assertEqual(query_digest(QUERY), query_digest({**QUERY, "max_bytes": 1}))
+        self.assertNotEqual(query_digest(QUERY), query_digest({**QUERY, "expand": False}))
+
+
+class TestResumeCrawl(unittest.TestCase):
+
+    def test_resume_after_stop(self):
+        with MockNewsSite(sitemaps=4, urls_per_sitemap=5) as site, tempfile.TemporaryDirectory() as directory:
+            query = {"type": "sitemaps", "sitemaps": [site.url + "/sitemap.xml"]}
+            options = {"resume_key": "news", "resume_dir": directory}
+            crawler = Crawler(query={**query, "max_items": 7}, **options)
+            self.assertEqual(len(crawler.crawl()), 7)
+            self.assertEqual(crawler.report["resume"]["status"], "stopped")
+            pending = crawler.report["resume"]["pending"]
+            self.assertGreater(pending, 0)
+
+            # Requests of the stopped run still being answered
+            time.sleep(0.5)
+            site.reset_stats()
+            crawler = Crawler(query=query, **options)
+            links = [item["link"] for item in crawler.crawl()]
+            self.assertEqual(sorted(links), sorted(site.article_links()))
+            self.assertEqual(site.stats["requests"], pending)
+            self.assertEqual(crawler.report["resume"]["status"], "finished")
+            self.assertTrue(crawler.report["resume"]["resumed"])
+
+            site.reset_stats()
+            crawler = Crawler(query=query, **options)
+            self.assertEqual(len(crawler.crawl()), 20)
+            self.assertEqual(site.stats["requests"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
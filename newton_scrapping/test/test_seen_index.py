@@ -0,0 +1,152 @@
+import datetime
+import os
+import tempfile
+import time
+import unittest
+
+from scrapy.http import HtmlResponse
+from scrapy.utils.test import get_crawler
+
+from newton_scrapping.middlewares import SeenIndexMiddleware
+from newton_scrapping.seen_index import BloomFilter, SeenIndex, lastmod_key
+from newton_scrapping.sitemap import SitemapEngine
+from newton_scrapping.test.test_sitemap import NEWS_SITEMAP
+
+
+class TestSeenIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "seen.sqlite3")
+        self.index = SeenIndex(self.path)
+
+    def tearDown(self):
+        self.index.close()
+        self.directory.cleanup()
+
+    def test_bloom_filter_has_no_false_negatives(self):
+        bloom = BloomFilter(capacity=1000)
+        fingerprints = [SeenIndex.fingerprint(f"https://example.com/{i}") for i in range(1000)]
+        for fp in fingerprints:
+            bloom.add(fp)
+        self.assertTrue(all(bloom.might_contain(fp) for fp in fingerprints))
+
+    def test_canonical_url_lookup(self):
+        self.index.add("https://example.com/a?b=2&a=1", lastmod="2022-03-01", content_hash="x")
+        self.assertTrue(self.index.is_unchanged("https://example.com/a?a=1&b=2"))
+        self.assertTrue(self.index.is_unchanged("https://example.com/a?a=1&b=2", lastmod="2022-03-01"))
+        self.assertFalse(self.index.is_unchanged("https://example.com/a?a=1&b=2", lastmod="2022-03-02"))
+        self.assertFalse(self.index.is_unchanged("https://example.com/a?a=1&b=2", content_hash="y"))
+        self.assertFalse(self.index.is_unchanged("https://example.com/other"))
+
+    def test_persists_between_runs(self):
+        self.index.add("https://example.com/a", content_hash="x")
+        self.index.close()
+        self.index = SeenIndex(self.path)
+        self.assertEqual(self.index.get("https://example.com/a")["content_hash"], "x")
+
+    def test_compact_evicts_expired_and_extra_entries(self):
+        self.index.ttl = 60
+        self.index.max_entries = 2
+        self.index.add("https://example.com/expired")
+        self.index.db.execute("UPDATE seen SET seen_at = ?", (time.time() - 120,))
+        for i in range(3):
+            self.index.add(f"https://example.com/{i}")
+        self.index.compact()
+        self.assertEqual(len(self.index), 2)
+        self.assertNotIn("https://example.com/expired", self.index)
+        self.assertIn("https://example.com/2", self.index)
+
+    def test_release_compacts_over_the_threshold(self):
+        index = SeenIndex.shared(self.path, max_entries=10)
+        for i in range(11):
+            index.add(f"https://example.com/{i}")
+        self.assertFalse(index.needs_compaction())
+        index.release()
+        self.assertEqual(len(self.index), 11)
+
+        index = SeenIndex.shared(self.path, max_entries=5)
+        self.assertTrue(index.needs_compaction())
+        index.bloom = None
+        # Trimmed, but the Bloom filter of the closing handle is not rebuilt
+        index.release()
+        self.assertIsNone(index.bloom)
+        self.assertEqual(len(self.index), 5)
+
+    def test_expired_entries_threshold(self):
+        self.index.ttl = 100
+        self.index.add("https://example.com/a")
+        self.index.db.execute("UPDATE seen SET seen_at = ?", (time.time() - 105,))
+        self.assertFalse(self.index.needs_compaction())
+        self.index.db.execute("UPDATE seen SET seen_at = ?", (time.time() - 120,))
+        self.assertTrue(self.index.needs_compaction())
+
+    def test_lastmod_precision(self):
+        self.index.add("https://example.com/a", lastmod="2022-03-01T10:00:00+01:00")
+        self.assertTrue(self.index.is_unchanged("https://example.com/a", lastmod="2022-03-01T09:00:00Z"))
+        # Updated later the same day
+        self.assertFalse(self.index.is_unchanged("https://example.com/a", lastmod="2022-03-01T12:00:00Z"))
+        self.assertEqual(lastmod_key(datetime.date(2022, 3, 1)), lastmod_key("2022-03-01"))
+
+    def test_writes_are_committed_for_other_connections(self):
+        self.index.commit_interval = 0
+        self.index.add("https://example.com/a")
+        other = SeenIndex(self.path)
+        other.add("https://example.com/b")
+        other.close()
+        self.assertEqual(len(self.index), 2)
+
+    def test_shared_index(self):
+        index = SeenIndex.shared(self.path)
+        self.assertIs(SeenIndex.shared(self.path), index)
+        index.add("https://example.com/a")
+        index.release()
+        self.assertIn("https://example.com/a", index)
+        index.release()
+        self.assertIsNot(SeenIndex.shared(self.path), index)
+        SeenIndex.shared(self.path).release()
+
+    def test_sitemap_engine_skips_seen_urls(self):
+        links = [node.loc for node in SitemapEngine(seen_index=self.index).iter_nodes(NEWS_SITEMAP)]
+        self.assertEqual(len(links), 4)
+        engine = SitemapEngine(seen_index=self.index)
+        self.assertEqual(list(engine.iter_nodes(NEWS_SITEMAP)), [])
+        self.assertEqual(engine.skipped_seen, 4)
+
+
+class TestSeenIndexMiddleware(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        crawler = get_crawler(settings_dict={
+            "NEWTON_SEEN_INDEX_PATH": os.path.join(self.directory.name, "seen.sqlite3"),
+        })
+        self.middleware = SeenIndexMiddleware.from_crawler(crawler)
+
+    def tearDown(self):
+        self.middleware.index.release()
+        self.directory.cleanup()
+
+    def scrape(self, body, modified_at=None, flags=None):
+        response = HtmlResponse("https://example.com/a", body=body, flags=flags)
+        item = {"raw_response": {}, "parsed_data": {"modified_at": [modified_at] if modified_at else []}}
+        return list(self.middleware.process_spider_output(response, [item], None))
+
+    def test_drops_unchanged_pages(self):
+        self.assertEqual(len(self.scrape(b"<html>v1</html>")), 1)
+        self.assertEqual(self.scrape(b"<html>v1</html>"), [])
+        self.assertEqual(len(self.scrape(b"<html>v2</html>")), 1)
+
+    def test_truncated_body_is_not_hashed(self):
+        self.assertEqual(len(self.scrape(b"<html>v1</html>")), 1)
+        entry = self.middleware.index.get("https://example.com/a")
+        # Only part of the page, it can't be told unchanged
+        self.assertEqual(len(self.scrape(b"<html>v1</html>", flags=["download_stopped"])), 1)
+        self.assertEqual(self.middleware.index.get("https://example.com/a")["content_hash"], entry["content_hash"])
+        # Unless its modified_at didn't change
+        self.assertEqual(len(self.scrape(b"<html>", "2023-03-22", flags=["dataloss"])), 1)
+        self.assertEqual(self.scrape(b"<html>", "2023-03-22", flags=["dataloss"]), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+import unittest
+
+from newton_scrapping.main import Crawler
+from newton_scrapping.sharding import merge_links, split_date_range, split_sitemaps
+
+SITEMAPS = [f"https://example.com/sitemap-{day}.xml" for day in range(7)]
+
+
+class ShardCrawler(Crawler):
+    """Crawler answering shard queries without starting processes"""
+
+    def __init__(self, *args, fail=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fail = set(fail)
+        self.shard_queries = []
+
+    def _crawl_shard(self, query, index=None):
+        self.shard_queries.append((index, query))
+        if index is None:
+            return [{"sitemap": url, "lastmod": None} for url in SITEMAPS], {}
+        failed = [url for url in query["sitemaps"] if url in self.fail]
+        # A sitemap fails once
+        self.fail.difference_update(failed)
+        links = [{"link": url + "#article", "title": None} for url in query["sitemaps"] if url not in failed]
+        return links, {"failed_sitemaps": failed}
+
+
+class TestSharding(unittest.TestCase):
+
+    def test_split_date_range(self):
+        self.assertEqual(split_date_range("2022-03-01", "2022-03-07", 3), [
+            ("2022-03-01", "2022-03-03"), ("2022-03-04", "2022-03-05"), ("2022-03-06", "2022-03-07"),
+        ])
+        self.assertEqual(split_date_range("2022-03-01", "2022-03-02", 5), [
+            ("2022-03-01", "2022-03-01"), ("2022-03-02", "2022-03-02"),
+        ])
+        with self.assertRaises(ValueError):
+            split_date_range("2022-03-02", "2022-03-01", 2)
+        with self.assertRaises(ValueError):
+            split_date_range(None, "2022-03-01", 2)
+
+    def test_split_sitemaps(self):
+        shards = split_sitemaps(SITEMAPS + SITEMAPS[:1], 3)
+        self.assertEqual([len(shard) for shard in shards], [3, 2, 2])
+        self.assertEqual(sorted(url for shard in shards for url in shard), sorted(SITEMAPS))
+        self.assertEqual(split_sitemaps(SITEMAPS[:1], 3), [SITEMAPS[:1]])
+
+    def test_merge_links(self):
+        links = merge_links([
+            [{"link": "a", "title": "A"}, {"link": "b", "title": None}],
+            [{"link": "a", "title": "Copy"}, {"link": "c", "title": "C"}],
+        ])
+        self.assertEqual([(link["link"], link["title"]) for link in links], [("a", "A"), ("b", None), ("c", "C")])
+
+    def test_sharded_crawl_retries_failed_sitemaps(self):
+        crawler = ShardCrawler(
+            query={"type": "sitemap", "domain": "https://example.com", "shards": 3}, fail=SITEMAPS[:2]
+        )
+        links = crawler.crawl()
+        self.assertEqual(sorted(link["link"] for link in links), sorted(url + "#article" for url in SITEMAPS))
+        self.assertEqual(crawler.shard_queries[0][1]["sitemaps"], ["https://example.com/robots.txt"])
+        self.assertEqual([report["attempts"] for report in crawler.report["shards"]], [2, 2, 1])
+        self.assertEqual(crawler.report["failed_sitemaps"], [])
+        queries = [query["sitemaps"] for index, query in crawler.shard_queries]
+        self.assertIn(SITEMAPS[:1], queries)
+        self.assertIn(SITEMAPS[1:2], queries)
+
+    def test_sharded_crawl_gives_up(self):
+        crawler = ShardCrawler(
+            query={"type": "sitemap", "domain": "https://example.com", "shards": 2, "shard_retries": 0},
+            fail=SITEMAPS[:1],
+        )
+        self.assertEqual(len(crawler.crawl()), len(SITEMAPS) - 1)
+        self.assertEqual(crawler.report["failed_sitemaps"], SITEMAPS[:1])
+
+    def test_date_shards(self):
+        crawler = ShardCrawler(query={
+            "type": "sitemap", "domain": "https://example.com", "shards": 2, "shard_by": "date",
+            "since": "2022-03-01", "until": "2022-03-04",
+        })
+        crawler._crawl_shard = lambda query, index: ([{"link": query["since"], "title": None}], {})
+        self.assertEqual([link["link"] for link in crawler.crawl()], ["2022-03-01", "2022-03-03"])
+        self.assertEqual([report["until"] for report in crawler.report["shards"]], ["2022-03-02", "2022-03-04"])
+
+
+if __name__ == "__main__":
+    unittest.main()
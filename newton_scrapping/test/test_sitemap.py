@@ -0,0 +1,112 @@
+import gzip
+import unittest
+
+from scrapy.http import Request, TextResponse, XmlResponse
+from twisted.python.failure import Failure
+
+from newton_scrapping.sitemap import SitemapEngine, SitemapShardSpider, iter_sitemap
+
+SITEMAP_INDEX = b"""<?xml version="1.0" encoding="UTF-8"?>
+<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
+  <sitemap><loc>https://example.com/sitemap-2022-02.xml.gz</loc><lastmod>2022-02-28T23:10:00+05:30</lastmod></sitemap>
+  <sitemap><loc>https://example.com/sitemap-2022-03.xml.gz</loc><lastmod>2022-03-31T10:00:00+05:30</lastmod></sitemap>
+  <sitemap><loc>https://example.com/sitemap-latest.xml</loc></sitemap>
+</sitemapindex>"""
+
+NEWS_SITEMAP = b"""<?xml version="1.0" encoding="UTF-8"?>
+<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9"
+        xmlns:news="http://www.google.com/schemas/sitemap-news/0.9"
+        xmlns:image="http://www.google.com/schemas/sitemap-image/1.1">
+  <url>
+    <loc>https://example.com/articles/old.html</loc>
+    <news:news><news:publication_date>2022-02-10</news:publication_date><news:title>Old</news:title></news:news>
+  </url>
+  <url>
+    <loc>https://example.com/articles/new.html</loc>
+    <image:image><image:loc>https://example.com/a.jpg</image:loc><image:title>Photo</image:title></image:image>
+    <news:news><news:publication_date>2022-03-05T08:00:00Z</news:publication_date><news:title>New</news:title></news:news>
+  </url>
+  <url><loc>https://example.com/articles/undated.html</loc></url>
+  <url><loc>https://example.com/articles/future.html</loc><lastmod>2022-04-02</lastmod></url>
+</urlset>"""
+
+
+class TestSitemap(unittest.TestCase):
+
+    def test_iter_sitemap_gzip(self):
+        nodes = list(iter_sitemap(gzip.compress(SITEMAP_INDEX)))
+        self.assertEqual([node.kind for node in nodes], ["sitemap"] * 3)
+        self.assertEqual(nodes[0].loc, "https://example.com/sitemap-2022-02.xml.gz")
+        self.assertEqual(str(nodes[1].lastmod), "2022-03-31")
+        self.assertIsNone(nodes[2].lastmod)
+
+    def test_iter_sitemap_news_title(self):
+        nodes = list(iter_sitemap(NEWS_SITEMAP))
+        self.assertEqual(len(nodes), 4)
+        self.assertEqual(nodes[1].loc, "https://example.com/articles/new.html")
+        self.assertEqual(nodes[1].title, "New")
+        self.assertEqual(str(nodes[1].lastmod), "2022-03-05")
+
+    def test_engine_skips_child_sitemaps_before_since(self):
+        engine = SitemapEngine(since="2022-03-01", until="2022-03-26")
+        response = XmlResponse(
+            url="https://example.com/sitemap.xml", body=SITEMAP_INDEX,
+            request=Request("https://example.com/sitemap.xml"),
+        )
+        requests = list(engine.parse(response, callback=None))
+        self.assertEqual(
+            [request.url for request in requests],
+            ["https://example.com/sitemap-2022-03.xml.gz", "https://example.com/sitemap-latest.xml"],
+        )
+        self.assertEqual(engine.skipped_sitemaps, 1)
+
+    def test_engine_filters_urls(self):
+        engine = SitemapEngine(since="2022-03-01", until="2022-03-26")
+        response = XmlResponse(url="https://example.com/sitemap-latest.xml", body=NEWS_SITEMAP)
+        articles = list(engine.parse(response, callback=None))
+        self.assertEqual(articles, [
+            {"link": "https://example.com/articles/new.html", "title": "New"},
+            {"link": "https://example.com/articles/undated.html", "title": None},
+        ])
+        self.assertEqual(engine.skipped_urls, 2)
+
+
+class TestSitemapShardSpider(unittest.TestCase):
+
+    def spider(self, **args):
+        return SitemapShardSpider(args={"since": "2022-03-01", "until": "2022-03-26", **args})
+
+    def test_robots_sitemaps(self):
+        spider = self.spider(sitemaps=["https://example.com/robots.txt"])
+        (request,) = spider.start_requests()
+        self.assertEqual(request.callback, spider.parse_robots)
+        robots = TextResponse(
+            url="https://example.com/robots.txt", body=b"User-agent: *\nSitemap: /news.xml\n", encoding="utf-8"
+        )
+        self.assertEqual([r.url for r in spider.parse_robots(robots)], ["https://example.com/news.xml"])
+        robots = TextResponse(url="https://example.com/robots.txt", body=b"User-agent: *\n", encoding="utf-8")
+        self.assertEqual([r.url for r in spider.parse_robots(robots)], ["https://example.com/sitemap.xml"])
+
+    def test_expand_or_list_child_sitemaps(self):
+        response = XmlResponse(url="https://example.com/sitemap.xml", body=SITEMAP_INDEX)
+        requests = list(self.spider().parse_sitemap(response))
+        self.assertEqual(requests[0].url, "https://example.com/sitemap-2022-03.xml.gz")
+        self.assertEqual(self.spider(expand=False).parse_sitemap(response).__next__(), {
+            "sitemap": "https://example.com/sitemap-2022-03.xml.gz", "lastmod": "2022-03-31",
+        })
+        response = XmlResponse(url="https://example.com/sitemap-latest.xml", body=NEWS_SITEMAP)
+        self.assertEqual(len(list(self.spider(expand=False).parse_sitemap(response))), 2)
+
+    def test_failed_sitemaps(self):
+        spider = self.spider()
+        failure = Failure(Exception("503"))
+        failure.request = Request("https://example.com/robots.txt")
+        (request,) = spider.sitemap_failed(failure)
+        self.assertEqual(request.url, "https://example.com/sitemap.xml")
+        failure.request = request
+        self.assertEqual(list(spider.sitemap_failed(failure)), [])
+        self.assertEqual(spider.failed_sitemaps, ["https://example.com/sitemap.xml"])
+
+
+if __name__ == "__main__":
+    unittest.main()
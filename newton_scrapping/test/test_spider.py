@@ -5,7 +5,7 @@ import unittest
 from newton_scrapping.spiders.indian_express import IndianExpressSpider
 from newton_scrapping.test.helpers.constant import SITEMAP_URL, TEST_ARTICLES
 from newton_scrapping.test.helpers.utils import (get_article_content,
-                                                 online_response_from_url)
+                                                 response_from_url)
 # TODO: Update below path here
 from crwindianexpress import Crawler
 
@@ -28,7 +28,7 @@ class TestArticle(unittest.TestCase):
         for article in TEST_ARTICLES:
             logger.info(f"Testing article with URL:- {article['url']}")
             spider = IndianExpressSpider(type="article", url=article["url"])
-            articles = spider.parse(online_response_from_url(spider.article_url))
+            articles = spider.parse(response_from_url(spider.article_url, article["test_data_path"]))
             self._test_article_results(articles, article["test_data_path"])
             logger.info(f"Testing completed article with URL:- {article['url']}")
 
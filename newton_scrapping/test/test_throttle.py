@@ -0,0 +1,91 @@
+import os
+import tempfile
+import time
+import unittest
+
+from scrapy.settings import Settings
+
+from newton_scrapping.throttle import AdaptiveThrottle, parse_retry_after
+
+
+class TestAdaptiveThrottle(unittest.TestCase):
+    def test_additive_increase(self):
+        throttle = AdaptiveThrottle(start_delay=0.25, start_concurrency=4, max_concurrency=6)
+        for _ in range(4):
+            throttle.on_response("example.com", 200, latency=0.1)
+        self.assertEqual(throttle.concurrency("example.com"), 4)
+        self.assertAlmostEqual(throttle.delay("example.com"), 0.05)
+        for _ in range(100):
+            throttle.on_response("example.com", 200, latency=0.1)
+        self.assertEqual(throttle.concurrency("example.com"), 6)
+        self.assertEqual(throttle.delay("example.com"), 0.0)
+
+    def test_multiplicative_decrease_once_per_round_trip(self):
+        throttle = AdaptiveThrottle(start_concurrency=16)
+        throttle.on_response("example.com", 503, latency=0.2)
+        throttle.on_response("example.com", 503, latency=0.2)
+        self.assertEqual(throttle.concurrency("example.com"), 8)
+        self.assertEqual(throttle.delay("example.com"), 0.5)
+        throttle._decreased_at.clear()
+        throttle.on_error("example.com")
+        self.assertEqual(throttle.concurrency("example.com"), 4)
+
+    def test_latency_congestion(self):
+        throttle = AdaptiveThrottle(start_concurrency=8, latency_factor=3.0, min_congested_latency=0.5)
+        throttle.on_response("example.com", 200, latency=0.2)
+        for _ in range(10):
+            throttle.on_response("example.com", 200, latency=2.0)
+        self.assertLess(throttle.concurrency("example.com"), 8)
+
+    def test_retry_after_pauses_domain(self):
+        throttle = AdaptiveThrottle(start_delay=0.0)
+        throttle.on_response("example.com", 429, retry_after=b"30")
+        self.assertGreater(throttle.delay("example.com"), 29)
+        self.assertEqual(throttle.delay("other.com"), 0.0)
+
+    def test_parse_retry_after(self):
+        self.assertEqual(parse_retry_after("120"), 120)
+        self.assertIsNone(parse_retry_after(None))
+        self.assertIsNone(parse_retry_after("soon"))
+        date = time.strftime("%a, %d %b %Y %H:%M:%S GMT", time.gmtime(time.time() + 60))
+        self.assertAlmostEqual(parse_retry_after(date), 60, delta=2)
+
+    def test_state_persists_between_runs(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "throttle.json")
+            throttle = AdaptiveThrottle(path, start_concurrency=16)
+            throttle.on_response("slow.com", 503)
+            throttle.save()
+            other = AdaptiveThrottle(path)
+            other.on_response("fast.com", 200)
+            other.save()
+
+            state = AdaptiveThrottle(path)
+            self.assertEqual(state.concurrency("slow.com"), 8)
+            self.assertIn("fast.com", state.domains)
+
+    def test_shared_by_the_crawlers_of_the_process(self):
+        settings = Settings({"CONCURRENT_REQUESTS_PER_DOMAIN": 16})
+        first = AdaptiveThrottle.from_settings(settings)
+        second = AdaptiveThrottle.from_settings(settings)
+        self.assertIs(first, second)
+        # A backoff seen by one crawler slows down the other
+        first.on_response("example.com", 503, latency=0.2)
+        self.assertEqual(second.concurrency("example.com"), 8)
+        first.release()
+        second.release()
+        self.assertIsNot(AdaptiveThrottle.from_settings(settings), first)
+        AdaptiveThrottle.get().release()
+
+    def test_budget_split_between_users(self):
+        throttle = AdaptiveThrottle(start_delay=0.25, start_concurrency=16, shares=2)
+        self.assertEqual(throttle.attach("example.com", "crawler-1"), 1)
+        self.assertEqual(throttle.attach("example.com", "crawler-2"), 2)
+        self.assertEqual(throttle.concurrency("example.com", 2), 4)
+        self.assertEqual(throttle.delay("example.com", 2), 1.0)
+        throttle.detach("crawler-2")
+        self.assertEqual(throttle.attach("example.com", "crawler-1"), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
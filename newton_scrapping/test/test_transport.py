@@ -0,0 +1,64 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+import unittest
+
+from newton_scrapping.transport import MappedResults, PipeSender, ResultWriter, create_result_file, receive
+
+RECORDS = [{"link": f"https://example.com/{i}", "title": f"Title {i}"} for i in range(100)]
+
+
+class TestTransport(unittest.TestCase):
+
+    def _write(self, codec):
+        path = create_result_file()
+        writer = ResultWriter(path, codec=codec)
+        for record in RECORDS:
+            writer.write(record)
+        writer.close()
+        return path
+
+    def test_round_trip(self):
+        for codec in ("pickle", "json"):
+            with MappedResults(self._write(codec), codec=codec) as results:
+                self.assertEqual(len(results), len(RECORDS))
+                self.assertEqual(results[42], RECORDS[42])
+                self.assertEqual(results[-1], RECORDS[-1])
+                self.assertEqual(list(results), RECORDS)
+
+    def test_close_deletes_file(self):
+        path = self._write("pickle")
+        results = MappedResults(path)
+        results.close()
+        self.assertFalse(os.path.exists(path))
+
+    def test_empty_file(self):
+        with MappedResults(create_result_file()) as results:
+            self.assertEqual(list(results), [])
+
+    def test_pipe_receive(self):
+        connection, sender = multiprocessing.Pipe(duplex=False)
+
+        def send():
+            for record in RECORDS:
+                PipeSender(sender).put(record)
+            sender.close()
+
+        async def read_all():
+            records = []
+            while True:
+                try:
+                    records.append(await receive(connection))
+                except EOFError:
+                    return records
+
+        thread = threading.Thread(target=send)
+        thread.start()
+        self.assertEqual(asyncio.run(read_all()), RECORDS)
+        thread.join()
+        connection.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
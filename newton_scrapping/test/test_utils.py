@@ -0,0 +1,98 @@
+import json
+import tempfile
+import unittest
+
+from scrapy.http import HtmlResponse
+
+from newton_scrapping.test.helpers.constant import TEST_ARTICLES
+from newton_scrapping.test.helpers.utils import get_article_content
+from newton_scrapping.output import encode_record
+from newton_scrapping.pipelines import RawResponsePipeline
+from newton_scrapping.utils import StructuredData, get_raw_content, zstandard
+
+PAGE = """<html><head>
+<script type="application/ld+json">{"@context": "https://schema.org", "@graph": [
+  {"@type": "NewsArticle", "headline": "Title", "keywords": "a, b",
+   "author": [{"@type": "Person", "name": "Writer", "url": "https://example.com/writer"}],
+   "image": {"@type": "ImageObject", "url": "https://example.com/a.jpg", "caption": "A"}},
+  {"@type": "WebSite", "name": "Example"}]}</script>
+<script type="application/ld+json">{"@type": "VideoObject", "name": "Clip"}</script>
+<script type="application/ld+json">{"@type": "ImageObject", "url": "https://example.com/b.jpg"}</script>
+<script type="application/ld+json">{not json</script>
+<script type="application/json">{"page": 1}</script>
+</head><body></body></html>"""
+
+
+class TestStructuredData(unittest.TestCase):
+
+    def test_classifies_blocks(self):
+        data = StructuredData(PAGE)
+        self.assertEqual(data.main["headline"], "Title")
+        self.assertEqual([block["@type"] for block in data.other], ["WebSite"])
+        self.assertEqual(len(data.video_objects), 1)
+        self.assertEqual(len(data.image_objects), 1)
+        self.assertEqual(data.misc, [{"page": 1}])
+        self.assertEqual(data.invalid_blocks, 1)
+        self.assertEqual(set(data.parsed_json), {"main", "imageObjects", "videoObjects", "other", "misc"})
+
+    def test_field_views(self):
+        data = StructuredData(PAGE)
+        self.assertEqual(data.title, ["Title"])
+        self.assertEqual(data.tags, ["a", "b"])
+        self.assertEqual(data.author, [{"@type": "Person", "name": "Writer", "url": "https://example.com/writer"}])
+        self.assertEqual([image["link"] for image in data.images],
+                         ["https://example.com/a.jpg", "https://example.com/b.jpg"])
+
+    def test_from_response_is_memoized(self):
+        response = HtmlResponse("https://example.com/", body=PAGE, encoding="utf-8")
+        self.assertIs(StructuredData.from_response(response), StructuredData.from_response(response))
+
+    def test_recorded_articles(self):
+        for article in TEST_ARTICLES:
+            expected = get_article_content(article["test_data_path"])[0]
+            data = StructuredData(expected["raw_response"]["content"])
+            with self.subTest(article["url"]):
+                self.assertIsInstance(data.parsed_json["main"], dict)
+                self.assertEqual(data.title, expected["parsed_data"]["title"])
+                self.assertEqual(data.description, expected["parsed_data"]["description"])
+
+
+class TestRawResponseStorage(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def store(self, storage):
+        item = {"raw_response": {"content": PAGE, "status": 200}}
+        return RawResponsePipeline(storage, self.directory.name).process_item(item, None)["raw_response"]
+
+    def assert_round_trip(self, storage):
+        raw_response = self.store(storage)
+        self.assertEqual(get_raw_content(raw_response), PAGE)
+        # Written to and read back from a JSONL output file
+        self.assertEqual(get_raw_content(json.loads(encode_record(raw_response))), PAGE)
+
+    def test_inline(self):
+        self.assert_round_trip("inline")
+
+    def test_gzip(self):
+        self.assertIsInstance(self.store("gzip")["content"], bytes)
+        self.assert_round_trip("gzip")
+
+    @unittest.skipIf(zstandard is None, "zstandard is not installed")
+    def test_zstd(self):
+        self.assert_round_trip("zstd")
+
+    def test_spill(self):
+        self.assertNotIn("content", self.store("spill"))
+        self.assert_round_trip("spill")
+
+    def test_omit(self):
+        self.assertIsNone(get_raw_content(self.store("omit")))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,285 @@
+"""Adaptive per-domain concurrency and delay"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+CONGESTION_STATUSES = (429, 503)
+
+# Throttles of the crawler process by state path
+_throttles = {}
+_throttles_lock = threading.Lock()
+
+
+class AdaptiveThrottle:
+    """
+    AIMD controller of the concurrency and download delay of every domain.
+    ...
+
+    Every healthy response additively raises the concurrency of its domain
+    (by about ``increase`` per window of requests) and lowers its delay by
+    ``delay_step``. A 429/503, a download error or a latency above
+    ``latency_factor`` times the fastest latency seen for the domain is a
+    congestion signal: the concurrency is multiplied by ``backoff`` and the
+    delay doubled, at most once per round trip so that the responses of the
+    requests already in flight don't collapse the window. A Retry-After on
+    429/503 pauses the domain until it expires.
+
+    The state of every domain is kept in ``path`` (JSON) between runs so that
+    the next crawl starts where the last one settled.
+
+    The crawlers of a process share one throttle (see get()), so a backoff
+    seen by one of them slows down all the others. The concurrency and the
+    delay of a domain are the budget of the whole process: they are split
+    between the crawlers downloading from it, and between ``shares``
+    processes crawling the same domains (the shards of a sitemap crawl).
+
+    Attributes
+    ----------
+    path : str
+        JSON file of the per-domain state, None to keep it in memory
+    start_delay : float
+        delay of a domain without state
+    start_concurrency : int
+        concurrency of a domain without state
+    shares : int
+        number of processes splitting the budget of every domain
+    domains : dict
+        state of every domain: concurrency, delay, latency, min_latency,
+        paused_until and updated_at
+
+    Methods
+    -------
+    get(path, **options)
+        Returns the throttle of a state path, shared by the crawlers of the process
+    release()
+        Saves the state and drops the shared throttle when its last crawler is done
+    attach(domain, user)
+        Registers a crawler downloading from a domain
+    detach(user)
+        Unregisters a crawler from all its domains
+    concurrency(domain, users)
+        Returns the concurrency of the download slot of one crawler
+    delay(domain, users)
+        Returns the delay of the download slot of one crawler
+    on_response(domain, status, latency, retry_after)
+        Adjusts a domain after a response
+    on_error(domain)
+        Adjusts a domain after a download error
+    save()
+        Writes the state of the domains to path
+    """
+
+    def __init__(
+        self, path=None, start_delay=0.25, min_delay=0.0, max_delay=60.0, delay_step=0.05,
+        start_concurrency=8, max_concurrency=32, increase=1.0, backoff=0.5,
+        latency_factor=3.0, min_congested_latency=0.5, shares=1,
+    ):
+        """
+        Args:
+            path (str, optional): JSON state file, loaded when it exists. Defaults to None.
+            start_delay (float, optional): delay of a new domain. Defaults to 0.25.
+            min_delay (float, optional): lowest delay. Defaults to 0.0.
+            max_delay (float, optional): highest delay. Defaults to 60.0.
+            delay_step (float, optional): delay removed by a healthy response. Defaults to 0.05.
+            start_concurrency (int, optional): concurrency of a new domain. Defaults to 8.
+            max_concurrency (int, optional): highest concurrency. Defaults to 32.
+            increase (float, optional): concurrency added per window. Defaults to 1.0.
+            backoff (float, optional): concurrency factor on congestion. Defaults to 0.5.
+            latency_factor (float, optional): latency over the fastest one that is
+                congestion. Defaults to 3.0.
+            min_congested_latency (float, optional): seconds under which latency is
+                never congestion. Defaults to 0.5.
+            shares (int, optional): processes crawling the same domains, each
+                gets its share of the concurrency and delay. Defaults to 1.
+        """
+        self.path = path
+        self.start_delay = start_delay
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.delay_step = delay_step
+        self.start_concurrency = start_concurrency
+        self.max_concurrency = max_concurrency
+        self.increase = increase
+        self.backoff = backoff
+        self.latency_factor = latency_factor
+        self.min_congested_latency = min_congested_latency
+        self.shares = max(1, shares)
+        self.domains = self.load(path) if path else {}
+        self.references = 0
+        self._decreased_at = {}
+        # Crawlers downloading from every domain
+        self._users = {}
+
+    @classmethod
+    def get(cls, path=None, **options) -> "AdaptiveThrottle":
+        """Return the throttle of a state path, shared by all the crawlers of the process
+
+        Every get() must be matched by a release(). The options of the first
+        crawler configure the throttle.
+        """
+        key = os.path.abspath(path) if path else None
+        with _throttles_lock:
+            throttle = _throttles.get(key)
+            if throttle is None:
+                throttle = _throttles[key] = cls(path, **options)
+            throttle.references += 1
+            return throttle
+
+    def release(self):
+        """Save the state, the shared throttle is dropped once its last crawler released it"""
+        self.save()
+        with _throttles_lock:
+            self.references -= 1
+            if self.references > 0:
+                return
+            key = os.path.abspath(self.path) if self.path else None
+            if _throttles.get(key) is self:
+                del _throttles[key]
+
+    @classmethod
+    def from_settings(cls, settings):
+        """Return the shared controller configured by the NEWTON_THROTTLE_* settings"""
+        return cls.get(
+            settings.get("NEWTON_THROTTLE_STATE_PATH"),
+            start_delay=settings.getfloat("DOWNLOAD_DELAY", 0.25),
+            min_delay=settings.getfloat("NEWTON_THROTTLE_MIN_DELAY", 0.0),
+            max_delay=settings.getfloat("NEWTON_THROTTLE_MAX_DELAY", 60.0),
+            start_concurrency=settings.getint("CONCURRENT_REQUESTS_PER_DOMAIN", 8),
+            max_concurrency=settings.getint("NEWTON_THROTTLE_MAX_CONCURRENCY", 32),
+            shares=settings.getint("NEWTON_THROTTLE_SHARES", 1),
+        )
+
+    @staticmethod
+    def load(path) -> dict:
+        """Read the per-domain state saved by save(), {} when there is none"""
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def state(self, domain: str) -> dict:
+        """Return the state of a domain, creating it when the domain is new"""
+        state = self.domains.get(domain)
+        if state is None:
+            state = self.domains[domain] = {
+                "concurrency": float(self.start_concurrency),
+                "delay": self.start_delay,
+                "latency": None,
+                "min_latency": None,
+                "paused_until": 0.0,
+                "updated_at": time.time(),
+            }
+        return state
+
+    def attach(self, domain: str, user) -> int:
+        """Register a crawler downloading from a domain
+
+        Returns:
+            int: number of crawlers of the process downloading from the domain
+        """
+        users = self._users.setdefault(domain, set())
+        users.add(id(user))
+        return len(users)
+
+    def detach(self, user):
+        """Unregister a crawler from all the domains it downloaded from"""
+        for domain, users in list(self._users.items()):
+            users.discard(id(user))
+            if not users:
+                del self._users[domain]
+
+    def concurrency(self, domain: str, users=1) -> int:
+        """Concurrency of one of ``users`` crawlers sharing the domain budget"""
+        return max(1, int(self.state(domain)["concurrency"] / (users * self.shares)))
+
+    def delay(self, domain: str, users=1) -> float:
+        """Delay to apply now, the Retry-After pause when the domain is paused
+
+        Every one of ``users`` crawlers waits ``users`` times the delay, so
+        their requests together keep the delay of the domain.
+        """
+        state = self.state(domain)
+        return max(state["delay"] * users * self.shares, state["paused_until"] - time.time())
+
+    def on_response(self, domain: str, status: int, latency=None, retry_after=None):
+        """Adjust a domain after a response
+
+        Args:
+            domain (str): download slot of the response
+            status (int): response status
+            latency (float, optional): download latency in seconds. Defaults to None.
+            retry_after (str, optional): Retry-After header value. Defaults to None.
+        """
+        state = self.state(domain)
+        if latency is not None:
+            state["latency"] = latency if state["latency"] is None else 0.8 * state["latency"] + 0.2 * latency
+            if state["min_latency"] is None or latency < state["min_latency"]:
+                state["min_latency"] = latency
+        if status in CONGESTION_STATUSES:
+            self._decrease(domain, state)
+            pause = parse_retry_after(retry_after)
+            if pause:
+                state["paused_until"] = max(state["paused_until"], time.time() + min(pause, self.max_delay))
+        elif self._latency_congested(state):
+            self._decrease(domain, state)
+        elif status < 500:
+            state["concurrency"] = min(
+                float(self.max_concurrency), state["concurrency"] + self.increase / state["concurrency"]
+            )
+            state["delay"] = max(self.min_delay, state["delay"] - self.delay_step)
+        state["updated_at"] = time.time()
+
+    def on_error(self, domain: str):
+        """Adjust a domain after a download error such as a timeout"""
+        state = self.state(domain)
+        self._decrease(domain, state)
+        state["updated_at"] = time.time()
+
+    def _latency_congested(self, state) -> bool:
+        if state["latency"] is None or state["min_latency"] is None:
+            return False
+        threshold = max(self.min_congested_latency, self.latency_factor * state["min_latency"])
+        return state["latency"] > threshold
+
+    def _decrease(self, domain, state):
+        now = time.monotonic()
+        # One decrease per round trip, the in flight responses saw the same congestion
+        window = state["latency"] or 1.0
+        if now - self._decreased_at.get(domain, float("-inf")) < window:
+            return
+        self._decreased_at[domain] = now
+        state["concurrency"] = max(1.0, state["concurrency"] * self.backoff)
+        state["delay"] = min(self.max_delay, max(state["delay"] * 2, self.delay_step))
+
+    def save(self):
+        """Write the state of the domains to path, keeping the other domains in the file"""
+        if not self.path:
+            return
+        domains = self.load(self.path)
+        domains.update(self.domains)
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory)
+        with os.fdopen(fd, "w") as f:
+            json.dump(domains, f)
+        os.replace(tmp_path, self.path)
+
+
+def parse_retry_after(value) -> float:
+    """Seconds to wait from a Retry-After header, delay-seconds or HTTP-date"""
+    if not value:
+        return None
+    if isinstance(value, bytes):
+        value = value.decode("latin1")
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,202 @@
+"""Memory mapped and pipe transfer of crawl results between processes"""
+
+import asyncio
+import json
+import mmap
+import os
+import pickle
+import struct
+import tempfile
+
+_LENGTH = struct.Struct("<Q")
+CODECS = ("pickle", "json")
+
+
+def create_result_file(prefix="newton-results-") -> str:
+    """Create an empty result file, in shared memory when /dev/shm is available
+
+    Returns:
+        str: path of the file
+    """
+    directory = "/dev/shm" if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK) else None
+    fd, path = tempfile.mkstemp(prefix=prefix, dir=directory)
+    os.close(fd)
+    return path
+
+
+def _encode(record, codec) -> bytes:
+    if codec == "pickle":
+        return pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL)
+    return json.dumps(record, ensure_ascii=False).encode("utf-8")
+
+
+def _decode(data, codec):
+    if codec == "pickle":
+        return pickle.loads(data)
+    return json.loads(bytes(data))
+
+
+class ResultWriter:
+    """
+    Appends length-prefixed records to a result file.
+    ...
+
+    Every record is written as an 8 byte little-endian length followed by the
+    encoded record, so the reader can index the file without decoding it.
+
+    Attributes
+    ----------
+    path : str
+        result file
+    codec : str
+        "pickle" or "json"
+    count : int
+        number of records written
+    """
+
+    def __init__(self, path, codec="pickle", buffer_size=1024 * 1024):
+        if codec not in CODECS:
+            raise ValueError(f"Unknown codec: {codec}")
+        self.path = path
+        self.codec = codec
+        self.count = 0
+        self.file = open(path, "wb", buffering=buffer_size)
+
+    def write(self, record):
+        data = _encode(record, self.codec)
+        self.file.write(_LENGTH.pack(len(data)))
+        self.file.write(data)
+        self.count += 1
+
+    def close(self):
+        self.file.close()
+
+
+class MappedResults:
+    """
+    Read-only sequence over a memory mapped result file.
+    ...
+
+    Records are decoded only when they are accessed, ``raw(i)`` returns the
+    encoded bytes as a memoryview without copying them. ``close()`` unmaps and
+    deletes the file, it is also called when used as a context manager.
+
+    Attributes
+    ----------
+    path : str
+        result file
+    codec : str
+        "pickle" or "json"
+    """
+
+    def __init__(self, path, codec="pickle"):
+        if codec not in CODECS:
+            raise ValueError(f"Unknown codec: {codec}")
+        self.path = path
+        self.codec = codec
+        self._offsets = []
+        self._mmap = None
+        self._view = None
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size:
+                self._mmap = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+                self._view = memoryview(self._mmap)
+        position = 0
+        while position < size:
+            (length,) = _LENGTH.unpack_from(self._view, position)
+            position += _LENGTH.size
+            self._offsets.append((position, length))
+            position += length
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def raw(self, index) -> memoryview:
+        """Return the encoded bytes of a record without copying them"""
+        if self._view is None and self._offsets:
+            raise ValueError("MappedResults is closed")
+        offset, length = self._offsets[index]
+        return self._view[offset:offset + length]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        view = self.raw(index)
+        try:
+            return _decode(view, self.codec)
+        finally:
+            view.release()
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def close(self):
+        """Unmap and delete the result file"""
+        if self._view is not None:
+            self._view.release()
+            self._view = None
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class PipeSender:
+    """
+    Sending end of a pipe with the put() of a multiprocessing Queue.
+    ...
+
+    Lets the crawler process methods putting their results on a Queue send
+    them to a caller awaiting them with receive(). put() blocks while the
+    pipe is full, so a slow reader slows the crawl down.
+
+    Attributes
+    ----------
+    connection : Connection
+        writable end of a multiprocessing Pipe
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def put(self, data):
+        self.connection.send(data)
+
+
+async def wait_readable(fd):
+    """Wait without blocking the event loop until a file descriptor is readable"""
+    loop = asyncio.get_running_loop()
+    readable = loop.create_future()
+    loop.add_reader(fd, lambda: readable.done() or readable.set_result(None))
+    try:
+        await readable
+    finally:
+        loop.remove_reader(fd)
+
+
+async def receive(connection):
+    """Receive the next object of a pipe without blocking the event loop
+
+    Raises:
+        EOFError: Raised when the sending process closed the pipe or died
+    """
+    while not connection.poll():
+        await wait_readable(connection.fileno())
+    return connection.recv()
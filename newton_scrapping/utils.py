@@ -1 +1,300 @@
 """Utility Functions"""
+
+import base64
+import gzip
+import hashlib
+import json
+import os
+import resource
+import tempfile
+import weakref
+from functools import cached_property
+
+from parsel import Selector
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+RAW_RESPONSE_STORAGES = ("inline", "gzip", "zstd", "spill", "omit")
+
+ARTICLE_TYPES = {
+    "Article", "NewsArticle", "ReportageNewsArticle", "AnalysisNewsArticle",
+    "OpinionNewsArticle", "BackgroundNewsArticle", "ReviewNewsArticle",
+    "BlogPosting", "LiveBlogPosting",
+}
+IMAGE_TYPES = {"ImageObject", "ImageGallery"}
+VIDEO_TYPES = {"VideoObject"}
+
+_STRUCTURED_DATA_XPATH = (
+    '//script[@type="application/ld+json" or @type="application/json"]'
+)
+_structured_data_cache = weakref.WeakKeyDictionary()
+
+
+def get_rss_bytes() -> int:
+    """Return the resident set size of the current process
+
+    Reads ``/proc/self/statm`` where available and falls back to the peak RSS
+    reported by ``getrusage`` on platforms without procfs.
+
+    Returns:
+        int: resident memory of the current process in bytes
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        # ru_maxrss is reported in kilobytes on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def compress_content(content: str, encoding: str) -> bytes:
+    """Compress page HTML with gzip or zstd
+
+    Args:
+        content (str): page HTML
+        encoding (str): "gzip" or "zstd"
+
+    Returns:
+        bytes: compressed UTF-8 content
+    """
+    data = content.encode("utf-8")
+    if encoding == "gzip":
+        return gzip.compress(data, compresslevel=6)
+    if encoding == "zstd":
+        if zstandard is None:
+            raise ImportError("zstd raw_response storage requires the zstandard package")
+        return zstandard.ZstdCompressor().compress(data)
+    raise ValueError(f"Unknown content encoding: {encoding}")
+
+
+def decompress_content(data: bytes, encoding: str) -> str:
+    """Reverse compress_content"""
+    if encoding == "gzip":
+        return gzip.decompress(data).decode("utf-8")
+    if encoding == "zstd":
+        if zstandard is None:
+            raise ImportError("zstd raw_response storage requires the zstandard package")
+        return zstandard.ZstdDecompressor().decompress(data).decode("utf-8")
+    raise ValueError(f"Unknown content encoding: {encoding}")
+
+
+def spill_content(content: str, directory: str) -> dict:
+    """Write page HTML to a content addressed file
+
+    Identical pages share one file, named by the SHA-256 of their content.
+
+    Args:
+        content (str): page HTML
+        directory (str): spill directory
+
+    Returns:
+        dict: "content_path" and "content_sha256" references to the file
+    """
+    data = content.encode("utf-8")
+    digest = hashlib.sha256(data).hexdigest()
+    path = os.path.join(os.path.abspath(directory), digest[:2], digest + ".html")
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    return {"content_path": path, "content_sha256": digest}
+
+
+def get_raw_content(raw_response: dict) -> str:
+    """Return the page HTML of an item's raw_response whatever its storage
+
+    Compressed content read back from JSON output files, where bytes are
+    written as base64 text, is decoded first.
+
+    Args:
+        raw_response (dict): raw_response of an article item
+
+    Returns:
+        str: page HTML, None when the content was omitted
+    """
+    if "content_path" in raw_response:
+        with open(raw_response["content_path"], "rb") as f:
+            return f.read().decode("utf-8")
+    content = raw_response.get("content")
+    encoding = raw_response.get("content_encoding")
+    if content is None or encoding is None:
+        return content
+    if isinstance(content, str):
+        content = base64.b64decode(content)
+    return decompress_content(content, encoding)
+
+
+def _schema_types(block: dict) -> set:
+    schema_type = block.get("@type")
+    if isinstance(schema_type, list):
+        return set(schema_type)
+    return {schema_type}
+
+
+def _as_list(value) -> list:
+    if value is None or value == "":
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+class StructuredData:
+    """
+    The JSON-LD and JSON blocks of a page, parsed once.
+    ...
+
+    All the <script type="application/ld+json"> and <script type="application/json">
+    elements are selected with one XPath over the page's lxml tree and every
+    block is decoded once. ld+json blocks (and their @graph entries) are
+    classified by @type into the parsed_json buckets: the first article is
+    "main", image and video objects go to "imageObjects"/"videoObjects" and
+    the rest to "other". Plain JSON blocks are "misc".
+
+    Use ``StructuredData.from_response(response)`` so that all the field
+    extractors of a response share one instance. The ``parsed_data`` field
+    views are computed on first access.
+
+    Attributes
+    ----------
+    main : dict
+        first article block, {} when the page has none
+    image_objects : list
+        ImageObject and ImageGallery blocks
+    video_objects : list
+        VideoObject blocks
+    other : list
+        remaining ld+json blocks
+    misc : list
+        application/json blocks
+    invalid_blocks : int
+        number of blocks that could not be decoded
+    """
+
+    def __init__(self, selector):
+        """
+        Args:
+            selector (Selector|Response|str): parsed page, response or page HTML
+        """
+        if isinstance(selector, str):
+            selector = Selector(text=selector)
+        self.main = {}
+        self.image_objects = []
+        self.video_objects = []
+        self.other = []
+        self.misc = []
+        self.invalid_blocks = 0
+        for script in selector.xpath(_STRUCTURED_DATA_XPATH):
+            text = script.xpath("text()").get()
+            try:
+                data = json.loads(text, strict=False)
+            except (TypeError, ValueError):
+                self.invalid_blocks += 1
+                continue
+            if script.attrib.get("type") == "application/json":
+                self.misc.append(data)
+            else:
+                for block in self._iter_blocks(data):
+                    self._classify(block)
+
+    @classmethod
+    def from_response(cls, response) -> "StructuredData":
+        """Return the StructuredData of a response, parsing it only the first time"""
+        data = _structured_data_cache.get(response)
+        if data is None:
+            data = _structured_data_cache[response] = cls(response)
+        return data
+
+    @staticmethod
+    def _iter_blocks(data):
+        for block in _as_list(data):
+            if not isinstance(block, dict):
+                continue
+            if "@graph" in block and "@type" not in block:
+                yield from (entry for entry in block["@graph"] if isinstance(entry, dict))
+            else:
+                yield block
+
+    def _classify(self, block):
+        types = _schema_types(block)
+        if types & ARTICLE_TYPES and not self.main:
+            self.main = block
+        elif types & IMAGE_TYPES:
+            self.image_objects.append(block)
+        elif types & VIDEO_TYPES:
+            self.video_objects.append(block)
+        else:
+            self.other.append(block)
+
+    @cached_property
+    def parsed_json(self) -> dict:
+        """parsed_json object of the article output, without empty buckets"""
+        buckets = {
+            "main": self.main,
+            "imageObjects": self.image_objects,
+            "videoObjects": self.video_objects,
+            "other": self.other,
+            "misc": self.misc,
+        }
+        return {key: value for key, value in buckets.items() if value}
+
+    @cached_property
+    def title(self) -> list:
+        return _as_list(self.main.get("headline") or self.main.get("name"))
+
+    @cached_property
+    def description(self) -> list:
+        return _as_list(self.main.get("description"))
+
+    @cached_property
+    def text(self) -> list:
+        return _as_list(self.main.get("articleBody"))
+
+    @cached_property
+    def published_at(self) -> list:
+        return _as_list(self.main.get("datePublished"))
+
+    @cached_property
+    def modified_at(self) -> list:
+        return _as_list(self.main.get("dateModified"))
+
+    @cached_property
+    def section(self) -> list:
+        return _as_list(self.main.get("articleSection"))
+
+    @cached_property
+    def tags(self) -> list:
+        keywords = self.main.get("keywords")
+        if isinstance(keywords, str):
+            return [keyword.strip() for keyword in keywords.split(",") if keyword.strip()]
+        return _as_list(keywords)
+
+    @cached_property
+    def language(self) -> list:
+        return _as_list(self.main.get("inLanguage"))
+
+    @cached_property
+    def author(self) -> list:
+        return [
+            {"@type": author.get("@type"), "name": author.get("name"), "url": author.get("url")}
+            for author in _as_list(self.main.get("author"))
+            if isinstance(author, dict)
+        ]
+
+    @cached_property
+    def publisher(self) -> list:
+        return [publisher for publisher in _as_list(self.main.get("publisher")) if isinstance(publisher, dict)]
+
+    @cached_property
+    def images(self) -> list:
+        images = []
+        for image in _as_list(self.main.get("image")) + self.image_objects:
+            if isinstance(image, str):
+                images.append({"link": image, "caption": None})
+            elif isinstance(image, dict) and image.get("url"):
+                images.append({"link": image["url"], "caption": image.get("caption")})
+        return images